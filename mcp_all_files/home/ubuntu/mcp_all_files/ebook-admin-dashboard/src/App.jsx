@@ -24,6 +24,8 @@ function App() {
   const [sidebarOpen, setSidebarOpen] = useState(true);
 
   useEffect(() => {
+    authService.onTokenRefreshed = (token) => localStorage.setItem('admin_token', token);
+    authService.onSessionExpired = clearSession;
     checkAuthStatus();
   }, []);
 
@@ -38,6 +40,7 @@ function App() {
           setIsAuthenticated(true);
           setUser(parsedUser);
           authService.setToken(token);
+          authService.setRefreshToken(localStorage.getItem('admin_refresh_token'));
         } else {
           logout();
         }
@@ -48,22 +51,38 @@ function App() {
     setLoading(false);
   };
 
-  const login = (token, userData) => {
+  const login = (token, userData, refreshToken) => {
     localStorage.setItem('admin_token', token);
+    localStorage.setItem('admin_refresh_token', refreshToken);
     localStorage.setItem('admin_user', JSON.stringify(userData));
     authService.setToken(token);
+    authService.setRefreshToken(refreshToken);
     setIsAuthenticated(true);
     setUser(userData);
   };
 
-  const logout = () => {
+  const clearSession = () => {
     localStorage.removeItem('admin_token');
+    localStorage.removeItem('admin_refresh_token');
     localStorage.removeItem('admin_user');
     authService.setToken(null);
+    authService.setRefreshToken(null);
     setIsAuthenticated(false);
     setUser(null);
   };
 
+  const logout = async () => {
+    // Revoke this session on the server; sign out locally even if that fails
+    if (authService.token) {
+      try {
+        await authService.logout();
+      } catch (error) {
+        console.error('Logout request failed:', error);
+      }
+    }
+    clearSession();
+  };
+
   if (loading) {
     return (
       <div className="min-h-screen flex items-center justify-center bg-gray-50">
@@ -28,7 +28,7 @@ const AnalyticsPage = () => {
       setLoading(true);
       const [userResponse, bookResponse, salesResponse] = await Promise.all([
         authService.getUserAnalytics(timeRange),
-        authService.getBookAnalytics(),
+        authService.getBookAnalytics(timeRange),
         authService.getSalesAnalytics(timeRange)
       ]);
       
@@ -45,12 +45,11 @@ const AnalyticsPage = () => {
 
   const exportReport = async (reportType) => {
     try {
-      const report = await authService.exportReport(reportType, 'json', timeRange);
-      const blob = new Blob([JSON.stringify(report, null, 2)], { type: 'application/json' });
+      const { job, blob } = await authService.exportReport(reportType, 'csv', timeRange);
       const url = URL.createObjectURL(blob);
       const a = document.createElement('a');
       a.href = url;
-      a.download = `${reportType}_report_${new Date().toISOString().split('T')[0]}.json`;
+      a.download = `${reportType}_report_${new Date().toISOString().split('T')[0]}.${job.format}`;
       document.body.appendChild(a);
       a.click();
       document.body.removeChild(a);
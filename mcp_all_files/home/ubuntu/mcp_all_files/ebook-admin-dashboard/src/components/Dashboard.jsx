@@ -18,10 +18,34 @@ const Dashboard = () => {
   const [error, setError] = useState('');
   const [timeRange, setTimeRange] = useState(30);
 
+  const [live, setLive] = useState(null);
+
   useEffect(() => {
     loadDashboardData();
   }, [timeRange]);
 
+  // Push updates instead of re-polling the dashboard queries
+  useEffect(() => {
+    const controller = new AbortController();
+    authService.streamLiveMetrics((event, data) => {
+      if (event === 'snapshot' || event === 'metrics') {
+        setLive(data);
+      }
+      if (event === 'metrics' && data.new_orders) {
+        setDashboardData((current) => current && {
+          ...current,
+          overview: {
+            ...current.overview,
+            total_orders: current.overview.total_orders + data.new_orders,
+            total_revenue: Math.round((current.overview.total_revenue + data.revenue) * 100) / 100,
+            recent_revenue: Math.round((current.overview.recent_revenue + data.revenue) * 100) / 100
+          }
+        });
+      }
+    }, controller.signal);
+    return () => controller.abort();
+  }, []);
+
   const loadDashboardData = async () => {
     try {
       setLoading(true);
@@ -102,6 +126,11 @@ const Dashboard = () => {
         <div>
           <h1 className="text-2xl font-bold text-gray-900">Dashboard</h1>
           <p className="text-gray-600">Welcome to eBookZone Master Control Program</p>
+          {live && (
+            <p className="text-sm text-gray-500 mt-1">
+              Live: {live.events_per_minute} events/min · {live.orders_today} orders today · ${live.revenue_today} revenue today
+            </p>
+          )}
         </div>
         <div className="flex items-center space-x-4">
           <select
@@ -30,7 +30,7 @@ const LoginPage = ({ onLogin }) => {
         return;
       }
 
-      onLogin(response.token, response.user);
+      onLogin(response.token, response.user, response.refresh_token);
     } catch (error) {
       setError(error.message || 'Login failed. Please try again.');
     } finally {
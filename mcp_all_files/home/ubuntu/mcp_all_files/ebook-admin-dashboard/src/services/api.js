@@ -1,14 +1,72 @@
 const API_BASE_URL = 'https://w5hni7c7oloe.manus.space/api';
 
+// How long exportReport waits for a queued report before giving up
+const REPORT_POLL_TIMEOUT_MS = 2 * 60 * 1000;
+
 class ApiService {
   constructor() {
     this.token = null;
+    this.refreshToken = null;
+    this.refreshPromise = null;
+    // Set by the app to persist a refreshed access token / sign out when the session ends
+    this.onTokenRefreshed = null;
+    this.onSessionExpired = null;
   }
 
   setToken(token) {
     this.token = token;
   }
 
+  setRefreshToken(refreshToken) {
+    this.refreshToken = refreshToken;
+  }
+
+  // Exchange the refresh token for a new access token. Concurrent callers
+  // share one request; resolves to null when the session can't be renewed.
+  async refreshAccessToken() {
+    if (!this.refreshPromise) {
+      this.refreshPromise = fetch(`${API_BASE_URL}/auth/refresh`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ refresh_token: this.refreshToken }),
+      })
+        .then(async (response) => {
+          if (!response.ok) return null;
+          const data = await response.json();
+          this.setToken(data.token);
+          if (this.onTokenRefreshed) this.onTokenRefreshed(data.token);
+          return data.token;
+        })
+        .catch(() => null)
+        .finally(() => {
+          this.refreshPromise = null;
+        });
+    }
+    return this.refreshPromise;
+  }
+
+  // fetch() with the access token. On a 401 the refresh token is exchanged
+  // once and the request retried; if that fails the session has ended.
+  async authorizedFetch(url, options = {}) {
+    const send = () => {
+      const headers = { ...options.headers };
+      if (this.token) {
+        headers.Authorization = `Bearer ${this.token}`;
+      }
+      return fetch(url, { ...options, headers });
+    };
+
+    let response = await send();
+    if (response.status === 401 && this.token && this.refreshToken) {
+      if (await this.refreshAccessToken()) {
+        response = await send();
+      } else if (this.onSessionExpired) {
+        this.onSessionExpired();
+      }
+    }
+    return response;
+  }
+
   async request(endpoint, options = {}) {
     const url = `${API_BASE_URL}${endpoint}`;
     const config = {
@@ -19,12 +77,8 @@ class ApiService {
       ...options,
     };
 
-    if (this.token) {
-      config.headers.Authorization = `Bearer ${this.token}`;
-    }
-
     try {
-      const response = await fetch(url, config);
+      const response = await this.authorizedFetch(url, config);
       const data = await response.json();
 
       if (!response.ok) {
@@ -46,9 +100,11 @@ class ApiService {
     });
   }
 
+  // Revokes only this session (its access and refresh tokens)
   async logout() {
     return this.request('/auth/logout', {
       method: 'POST',
+      body: JSON.stringify({ refresh_token: this.refreshToken }),
     });
   }
 
@@ -57,6 +113,57 @@ class ApiService {
     return this.request(`/analytics/dashboard?days=${days}`);
   }
 
+  // Live dashboard deltas over Server-Sent Events. fetch() is used instead of
+  // EventSource so the Authorization header can be sent. Reconnects with
+  // Last-Event-ID until the signal is aborted.
+  async streamLiveMetrics(onEvent, signal) {
+    let lastEventId = null;
+    let retryMs = 4000;
+
+    while (!signal.aborted) {
+      try {
+        const headers = {};
+        if (lastEventId !== null) {
+          headers['Last-Event-ID'] = lastEventId;
+        }
+        const response = await this.authorizedFetch(`${API_BASE_URL}/analytics/live`, { headers, signal });
+        if (!response.ok) {
+          throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += value;
+
+          let boundary;
+          while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            for (const line of block.split('\n')) {
+              if (line.startsWith('id: ')) lastEventId = line.slice(4);
+              else if (line.startsWith('event: ')) event = line.slice(7);
+              else if (line.startsWith('data: ')) data += line.slice(6);
+              else if (line.startsWith('retry: ')) retryMs = Number(line.slice(7));
+            }
+            if (data) {
+              onEvent(event, JSON.parse(data));
+            }
+          }
+        }
+      } catch (error) {
+        if (signal.aborted) return;
+        console.error('Live metrics stream failed:', error);
+      }
+      await new Promise((resolve) => setTimeout(resolve, retryMs));
+    }
+  }
+
   // User management
   async getUsers(page = 1, perPage = 20, search = '') {
     return this.request(`/admin/users?page=${page}&per_page=${perPage}&search=${search}`);
@@ -208,8 +315,8 @@ class ApiService {
     return this.request(`/analytics/users?days=${days}`);
   }
 
-  async getBookAnalytics() {
-    return this.request('/analytics/books');
+  async getBookAnalytics(days = 30) {
+    return this.request(`/analytics/books?days=${days}`);
   }
 
   async getSalesAnalytics(days = 30) {
@@ -226,8 +333,12 @@ class ApiService {
     return this.request(`/analytics/events?${params}`);
   }
 
-  async exportReport(reportType, format = 'json', days = 30) {
-    return this.request('/analytics/reports/export', {
+  // Reports are built by a background job: queue one, poll until it is
+  // completed, then download the file. Polling gives up after timeoutMs (the
+  // job may not be picked up at all if no process runs background jobs);
+  // exporting again reuses the same pending job.
+  async exportReport(reportType, format = 'csv', days = 30, timeoutMs = REPORT_POLL_TIMEOUT_MS) {
+    let { job } = await this.request('/analytics/reports/export', {
       method: 'POST',
       body: JSON.stringify({
         report_type: reportType,
@@ -235,16 +346,34 @@ class ApiService {
         days,
       }),
     });
+
+    const deadline = Date.now() + timeoutMs;
+    let delayMs = 1000;
+    while (job.status === 'queued' || job.status === 'running') {
+      if (Date.now() + delayMs > deadline) {
+        throw new Error('Report is still being generated. Please try exporting again in a few minutes.');
+      }
+      await new Promise((resolve) => setTimeout(resolve, delayMs));
+      delayMs = Math.min(delayMs * 2, 5000);
+      ({ job } = await this.request(`/analytics/reports/${job.job_id}`));
+    }
+    if (job.status !== 'completed') {
+      throw new Error(job.error || 'Report generation failed');
+    }
+
+    const response = await this.authorizedFetch(`${API_BASE_URL}/analytics/reports/${job.job_id}/download`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return { job, blob: await response.blob() };
   }
 
   // File upload
   async uploadFiles(formData) {
     return this.request('/books/upload', {
       method: 'POST',
-      headers: {
-        // Don't set Content-Type for FormData, let browser set it
-        Authorization: `Bearer ${this.token}`,
-      },
+      // Don't set Content-Type for FormData, let browser set it
+      headers: {},
       body: formData,
     });
   }
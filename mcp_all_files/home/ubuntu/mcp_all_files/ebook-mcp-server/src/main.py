@@ -4,9 +4,12 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory
+import click
 from flask_cors import CORS
 from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import text
 import os
+import time
 
 # Production settings
 PROD_DOMAIN = 'ebookzone100.github.io'
@@ -17,10 +20,11 @@ ALLOWED_ORIGINS = [
 ]
 
 # Import all models to ensure they are registered with SQLAlchemy
-from src.models.user import db, User, UserRole
+from src.models.user import db, User, UserRole, TokenVersion, RevokedSession
 from src.models.book import Book, Author, Category, BookStatus, BookCategory
-from src.models.order import Order, OrderItem, Payment, OrderStatus, PaymentStatus, PaymentMethod, Currency
-from src.models.analytics import AnalyticsEvent, DailySummary, SystemSetting, AuditLog, EventType
+from src.models.order import Order, OrderItem, Payment, Entitlement, WebhookEvent, RevenueHour, OrderStatus, PaymentStatus, PaymentMethod, Currency
+from src.models.analytics import AnalyticsEvent, DailySummary, RollupState, UniqueSketch, ReportJob, SystemSetting, AuditLog, EventType
+from src.models.pricing import ExchangeRate, BookPrice
 
 # Import routes
 from src.routes.user import user_bp
@@ -32,6 +36,23 @@ from src.routes.categories import categories_bp
 from src.routes.orders import orders_bp
 from src.routes.payments import payments_bp
 from src.routes.analytics import analytics_bp
+from src.routes.exports import exports_bp
+from src.routes.library import library_bp
+
+# Background jobs
+from src.services.scheduler import register_job, start_background_jobs, stop_background_jobs, background_jobs_running
+from src.services.order_sweeper import sweep_stale_orders
+from src.services.webhook_inbox import process_webhook_inbox
+from src.services.reconciliation import reconcile_settlement_file
+from src.services.rate_limiter import rate_limiter
+from src.services.token_revocation import revocation_list
+from src.services.daily_rollup import rollup_daily_summaries
+from src.services.event_archive import archive_old_events
+from src.services.event_queries import check_query_plans
+from src.services.event_store import event_store, sync_event_store
+from src.services.trending import poll_trending, TRENDING_POLL_INTERVAL
+from src.services.live_metrics import poll_live_metrics, LIVE_METRICS_INTERVAL
+from src.services.report_jobs import process_report_jobs
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
@@ -89,6 +110,8 @@ app.register_blueprint(categories_bp, url_prefix='/api')
 app.register_blueprint(orders_bp, url_prefix='/api')
 app.register_blueprint(payments_bp, url_prefix='/api')
 app.register_blueprint(analytics_bp, url_prefix='/api')
+app.register_blueprint(exports_bp, url_prefix='/api/admin')
+app.register_blueprint(library_bp, url_prefix='/api')
 
 # Database configuration
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
@@ -157,6 +180,7 @@ def create_default_data():
         {'key': 'max_download_limit', 'value': '5', 'description': 'Maximum downloads per purchase', 'setting_type': 'integer'},
         {'key': 'download_expiry_days', 'value': '365', 'description': 'Download link expiry in days', 'setting_type': 'integer'},
         {'key': 'enable_analytics', 'value': 'true', 'description': 'Enable analytics tracking', 'setting_type': 'boolean'},
+        {'key': 'analytics_retention_days', 'value': '180', 'description': 'Days analytics events stay in the database before archiving', 'setting_type': 'integer'},
         {'key': 'maintenance_mode', 'value': 'false', 'description': 'Enable maintenance mode', 'setting_type': 'boolean'}
     ]
     
@@ -166,15 +190,174 @@ def create_default_data():
             setting = SystemSetting(**setting_data)
             db.session.add(setting)
     
+    # Create default exchange rates
+    ExchangeRate.seed_defaults()
+    
     db.session.commit()
+    
+    # Materialize price lists on first start
+    if not BookPrice.query.first():
+        BookPrice.recompute()
+    
+    # Backfill the hourly revenue table from orders paid before it existed
+    if not RevenueHour.query.first() and Order.query.filter_by(payment_status=PaymentStatus.COMPLETED).first():
+        RevenueHour.rebuild()
+    
     print("Default data created successfully!")
 
-with app.app_context():
-    # Create all tables
-    db.create_all()
-    
-    # Create default data
-    create_default_data()
+# Indexes replaced by a wider one; dropped so writes don't maintain both
+SUPERSEDED_INDEXES = ['ix_analytics_events_created_at']
+
+def ensure_indexes():
+    """Create indexes declared on tables that already existed before the index was added"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    with db.engine.begin() as connection:
+        for name in SUPERSEDED_INDEXES:
+            connection.execute(text(f'DROP INDEX IF EXISTS {name}'))
+
+def init_database():
+    """Create tables, indexes and default rows (idempotent)"""
+    with app.app_context():
+        db.create_all()
+        ensure_indexes()
+        create_default_data()
+
+# Password hashing workers are started with forkserver/spawn, which re-import
+# the entry module as __mp_main__ when it was run as a script; they must not
+# touch the database.
+if __name__ != '__mp_main__':
+    init_database()
+
+# Background jobs run in daemon threads. Shared jobs take a file lock per run,
+# so with several worker processes each still runs on one process at a time;
+# per-process jobs keep in-memory state for their own worker.
+register_job('order-sweeper', int(os.getenv('ORDER_SWEEP_INTERVAL', 300)), sweep_stale_orders)
+register_job('webhook-inbox', float(os.getenv('WEBHOOK_POLL_INTERVAL', 2)), process_webhook_inbox)
+register_job('rate-limit-cleanup', 3600, rate_limiter.cleanup, per_process=True)
+register_job('revoked-session-cleanup', 3600, revocation_list.cleanup, per_process=True)
+register_job('daily-rollup', int(os.getenv('DAILY_ROLLUP_INTERVAL', 600)), rollup_daily_summaries)
+register_job('event-store-sync', int(os.getenv('EVENT_STORE_SYNC_INTERVAL', 60)), sync_event_store)
+register_job('trending', TRENDING_POLL_INTERVAL, poll_trending, per_process=True)
+register_job('live-metrics', LIVE_METRICS_INTERVAL, poll_live_metrics, per_process=True)
+register_job('report-jobs', float(os.getenv('REPORT_POLL_INTERVAL', 2)), process_report_jobs)
+register_job('event-archive', int(os.getenv('EVENT_ARCHIVE_INTERVAL', 3600)), archive_old_events)
+
+BACKGROUND_JOBS_ENABLED = os.getenv('ENABLE_BACKGROUND_JOBS', 'true').lower() == 'true'
+
+@app.before_request
+def start_background_jobs_on_first_request():
+    """Start the scheduler in processes that serve requests.
+
+    Not at import time: flask CLI commands and the reloader's watcher
+    process import this module too but never handle a request.
+    """
+    if BACKGROUND_JOBS_ENABLED and not background_jobs_running():
+        start_background_jobs(app)
+
+@app.cli.command('run-jobs')
+def run_jobs_command():
+    """Run the background jobs in the foreground (for a dedicated job process)"""
+    jobs = start_background_jobs(app)
+    print(f"Running {len(jobs)} background jobs; press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop_background_jobs()
+
+@app.cli.command('sweep-orders')
+def sweep_orders_command():
+    """Expire stale pending and processing orders"""
+    expired = sweep_stale_orders()
+    print(f"Expired {expired} stale orders")
+
+@app.cli.command('process-webhooks')
+def process_webhooks_command():
+    """Drain due events from the webhook inbox"""
+    total = 0
+    while True:
+        processed = process_webhook_inbox()
+        if not processed:
+            break
+        total += processed
+    print(f"Processed {total} webhook events")
+
+@app.cli.command('rebuild-entitlements')
+def rebuild_entitlements_command():
+    """Rebuild library entitlements from completed orders"""
+    count = Entitlement.rebuild_all()
+    print(f"Rebuilt entitlements for {count} purchased books")
+
+@app.cli.command('rollup-daily')
+@click.option('--full', is_flag=True, help='Recompute every day instead of only days with new data')
+def rollup_daily_command(full):
+    """Fill DailySummary rows for past days"""
+    days = rollup_daily_summaries(full=full, wait=True)
+    print(f"Rolled up {days} days")
+
+@app.cli.command('archive-events')
+@click.option('--max-days', type=int, help='Archive at most this many days in one run')
+def archive_events_command(max_days):
+    """Move analytics events past the retention horizon to archive files"""
+    count = archive_old_events(max_days=max_days)
+    print(f"Archived {count} analytics events")
+
+@app.cli.command('sync-event-store')
+@click.option('--rebuild', is_flag=True, help='Recreate the store from the archive and analytics_events')
+def sync_event_store_command(rebuild):
+    """Append new analytics events to the columnar event store"""
+    count = event_store.rebuild() if rebuild else event_store.sync()
+    print(f"Appended {count} events (store at event id {event_store.last_event_id})")
+
+@app.cli.command('run-report-jobs')
+def run_report_jobs_command():
+    """Build all queued report exports"""
+    total = 0
+    while process_report_jobs():
+        total += 1
+    print(f"Built {total} reports")
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """EXPLAIN QUERY PLAN the hot analytics_events queries; exits non-zero on a scan or sort"""
+    failed = False
+    for check in check_query_plans():
+        print(f"{check.name}: {'FAIL ' + ', '.join(check.problems) if check.problems else 'ok'}")
+        for detail in check.plan:
+            print(f"    {detail}")
+        failed = failed or bool(check.problems)
+    if failed:
+        raise SystemExit(1)
+
+@app.cli.command('rebuild-revenue-hours')
+def rebuild_revenue_hours_command():
+    """Recompute the hourly revenue table from completed orders"""
+    count = RevenueHour.rebuild()
+    print(f"Counted {count} completed orders")
+
+@app.cli.command('recompute-prices')
+def recompute_prices_command():
+    """Rebuild every book's price list from the exchange rate table"""
+    count = BookPrice.recompute()
+    print(f"Repriced {count} books")
+
+@app.cli.command('reconcile-settlements')
+@click.argument('settlement_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='CSV file for discrepancies')
+@click.option('--amount-unit', type=click.Choice(['major', 'minor']), default='major',
+              help='Whether settlement amounts are in major units or paise/cents')
+@click.option('--since', type=click.DateTime(), help='Also flag completed payments from this date that did not settle')
+@click.option('--until', type=click.DateTime(), help='End of the unsettled-payment window (exclusive)')
+def reconcile_settlements_command(settlement_file, output, amount_unit, since, until):
+    """Reconcile payments against a gateway settlement CSV"""
+    summary = reconcile_settlement_file(settlement_file, output, amount_unit=amount_unit, since=since, until=until)
+    for key in ('rows', 'matched', 'missing_payment', 'duplicate', 'duplicate_payment', 'amount_mismatch',
+                'currency_mismatch', 'status_mismatch', 'invalid_row', 'unsettled', 'skipped'):
+        print(f"{key}: {summary[key]}")
+    if output:
+        print(f"Discrepancies written to {output}")
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -1,7 +1,14 @@
 from src.models.user import db
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from datetime import datetime, date
 import enum
 
+def dialect_insert(table):
+    """INSERT for the app database that supports on_conflict_do_update (upserts)"""
+    insert = postgresql_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+    return insert(table)
+
 class EventType(enum.Enum):
     PAGE_VIEW = "page_view"
     BOOK_VIEW = "book_view"
@@ -13,6 +20,15 @@ class EventType(enum.Enum):
 
 class AnalyticsEvent(db.Model):
     __tablename__ = 'analytics_events'
+    __table_args__ = (
+        # Date ranges sorted newest first (recent activity, rollups, archiving); event_type
+        # makes it covering for the per-type summary
+        db.Index('ix_analytics_events_created_type', 'created_at', 'event_type'),
+        # Filtered event lists; each serves its filter, range and sort
+        db.Index('ix_analytics_events_type_created', 'event_type', 'created_at'),
+        db.Index('ix_analytics_events_book_created', 'book_id', 'created_at'),
+        db.Index('ix_analytics_events_user_created', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     event_type = db.Column(db.Enum(EventType), nullable=False)
@@ -131,6 +147,111 @@ class DailySummary(db.Model):
             'top_book': self.top_book.to_dict() if self.top_book else None
         }
 
+class RollupState(db.Model):
+    """Watermarks for incremental rollup jobs"""
+    __tablename__ = 'rollup_states'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    last_event_id = db.Column(db.Integer, default=0, nullable=False)
+    last_run_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'last_event_id': self.last_event_id,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None
+        }
+
+class UniqueSketch(db.Model):
+    """Per-day HyperLogLog registers (zlib-compressed) for approximate distinct counts"""
+    __tablename__ = 'unique_sketches'
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'subject_id', 'date', name='uq_unique_sketches_kind_subject_date'),
+    )
+
+    VISITORS = 'visitors'
+    BOOK_READERS = 'book_readers'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    subject_id = db.Column(db.Integer, default=0, nullable=False)  # book id for book_readers, 0 otherwise
+    date = db.Column(db.Date, nullable=False)
+    precision = db.Column(db.SmallInteger, nullable=False)
+    registers = db.Column(db.LargeBinary, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'subject_id': self.subject_id,
+            'date': self.date.isoformat() if self.date else None,
+            'precision': self.precision,
+            'size_bytes': len(self.registers) if self.registers else 0,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class ReportJobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class ReportJob(db.Model):
+    """Asynchronous analytics report export and the file it produced"""
+    __tablename__ = 'report_jobs'
+    __table_args__ = (
+        db.Index('ix_report_jobs_status_created', 'status', 'created_at'),
+        db.Index('ix_report_jobs_params_created', 'params_key', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(32), unique=True, nullable=False)  # Public, unguessable id
+
+    # Parameters; params_key is a hash of all of them, used to reuse finished reports
+    report_type = db.Column(db.String(20), nullable=False)
+    format = db.Column(db.String(10), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)  # Exclusive
+    params_key = db.Column(db.String(64), nullable=False)
+
+    # Processing state
+    status = db.Column(db.Enum(ReportJobStatus), default=ReportJobStatus.QUEUED, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    # Result
+    file_path = db.Column(db.String(500), nullable=True)
+    file_size = db.Column(db.Integer, nullable=True)
+    row_count = db.Column(db.Integer, nullable=True)
+
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)  # File is deleted after this
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'report_type': self.report_type,
+            'format': self.format,
+            'start_date': self.start_date.isoformat() if self.start_date else None,
+            'end_date': self.end_date.isoformat() if self.end_date else None,
+            'status': self.status.value if self.status else None,
+            'attempts': self.attempts,
+            'error': self.error,
+            'row_count': self.row_count,
+            'file_size': self.file_size,
+            'requested_by': self.requested_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+
 class SystemSetting(db.Model):
     __tablename__ = 'system_settings'
     
@@ -185,11 +306,9 @@ class SystemSetting(db.Model):
     
     @staticmethod
     def get_setting(key, default=None):
-        """Get setting value by key"""
-        setting = SystemSetting.query.filter_by(key=key).first()
-        if setting:
-            return setting.get_value()
-        return default
+        """Get setting value by key (served from the process-wide settings cache)"""
+        from src.services.settings_cache import settings_cache
+        return settings_cache.get(key, default)
     
     @staticmethod
     def set_setting(key, value, description=None, setting_type='string'):
@@ -205,9 +324,38 @@ class SystemSetting(db.Model):
         if setting_type:
             setting.setting_type = setting_type
         
+        # Tell every worker's settings cache to reload
+        SettingsVersion.bump()
         db.session.commit()
+        
+        from src.services.settings_cache import settings_cache
+        settings_cache.invalidate()
         return setting
 
+class SettingsVersion(db.Model):
+    """Single-row counter bumped whenever a system setting changes"""
+    __tablename__ = 'settings_versions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    @staticmethod
+    def current():
+        """Get current settings version"""
+        row = db.session.query(SettingsVersion.version).filter(SettingsVersion.id == 1).first()
+        return row.version if row else 0
+    
+    @staticmethod
+    def bump():
+        """Increment the settings version (committed by the caller)"""
+        updated = SettingsVersion.query.filter(SettingsVersion.id == 1).update(
+            {SettingsVersion.version: SettingsVersion.version + 1, SettingsVersion.updated_at: datetime.utcnow()},
+            synchronize_session=False
+        )
+        if not updated:
+            db.session.add(SettingsVersion(id=1, version=1))
+
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
     
@@ -164,8 +164,15 @@ class Book(db.Model):
         self.download_count += 1
         db.session.commit()
     
-    def to_dict(self, include_analytics=False):
-        """Convert book to dictionary"""
+    def price_in(self, currency):
+        """Get the precomputed BookPrice for a currency, or None"""
+        for price in self.prices:
+            if price.currency == currency:
+                return price
+        return None
+    
+    def to_dict(self, include_analytics=False, currency=None):
+        """Convert book to dictionary; currency adds the precomputed local price"""
         data = {
             'id': self.id,
             'title': self.title,
@@ -205,6 +212,10 @@ class Book(db.Model):
                 'download_count': self.download_count
             })
         
+        if currency is not None:
+            price = self.price_in(currency)
+            data['price'] = price.to_dict() if price else None
+        
         return data
     
     def __repr__(self):
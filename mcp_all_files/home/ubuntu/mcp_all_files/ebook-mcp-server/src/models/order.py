@@ -1,4 +1,9 @@
 from src.models.user import db
+from sqlalchemy import select, update, or_, func, event, inspect
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.hybrid import hybrid_property
 from datetime import datetime
 import enum
 import uuid
@@ -64,7 +69,7 @@ class Order(db.Model):
     payment_status = db.Column(db.Enum(PaymentStatus), default=PaymentStatus.PENDING, nullable=False)
     payment_method = db.Column(db.Enum(PaymentMethod), nullable=True)
     payment_gateway_id = db.Column(db.String(100), nullable=True)  # Razorpay payment ID
-    payment_gateway_order_id = db.Column(db.String(100), nullable=True)  # Razorpay order ID
+    payment_gateway_order_id = db.Column(db.String(100), nullable=True, index=True)  # Razorpay order ID
     
     # Notes and metadata
     notes = db.Column(db.Text, nullable=True)
@@ -79,6 +84,16 @@ class Order(db.Model):
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
     payments = db.relationship('Payment', backref='order', lazy=True, cascade='all, delete-orphan')
     
+    @hybrid_property
+    def revenue_at(self):
+        """When a paid order's revenue counts: its completion time (creation time
+        for orders completed before completed_at was recorded)"""
+        return self.completed_at or self.created_at
+    
+    @revenue_at.expression
+    def revenue_at(cls):
+        return func.coalesce(cls.completed_at, cls.created_at)
+    
     def __init__(self, **kwargs):
         super(Order, self).__init__(**kwargs)
         if not self.order_number:
@@ -127,6 +142,9 @@ class Order(db.Model):
         for item in self.items:
             if item.book:
                 item.book.increment_download_count()
+        
+        # Grant library entitlements for the purchased books
+        Entitlement.sync_order(self)
     
     def to_dict(self, include_items=True):
         """Convert order to dictionary"""
@@ -196,11 +214,47 @@ class OrderItem(db.Model):
     
     def record_download(self):
         """Record a download"""
-        if self.can_download():
-            self.download_count += 1
-            db.session.commit()
-            return True
-        return False
+        return OrderItem.consume_download(self.id)
+    
+    @staticmethod
+    def consume_download(item_id):
+        """Atomically consume one download from the item's quota.
+        
+        The limit and expiry checks run inside a single conditional UPDATE, so
+        concurrent requests can never push download_count past download_limit.
+        Returns True when a download was granted.
+        """
+        now = datetime.utcnow()
+        result = db.session.execute(
+            update(OrderItem).where(
+                OrderItem.id == item_id,
+                OrderItem.download_count < OrderItem.download_limit,
+                or_(OrderItem.download_expires_at.is_(None), OrderItem.download_expires_at > now)
+            ).values(
+                download_count=OrderItem.download_count + 1,
+                updated_at=now
+            ).execution_options(synchronize_session=False)
+        )
+        granted = result.rowcount == 1
+        
+        if granted:
+            # Keep the library entitlement counter in the same transaction
+            item_book_id = select(OrderItem.book_id).where(OrderItem.id == item_id).scalar_subquery()
+            item_user_id = select(Order.customer_id).join(
+                OrderItem, OrderItem.order_id == Order.id
+            ).where(OrderItem.id == item_id).scalar_subquery()
+            db.session.execute(
+                update(Entitlement).where(
+                    Entitlement.user_id == item_user_id,
+                    Entitlement.book_id == item_book_id
+                ).values(
+                    download_count=Entitlement.download_count + 1,
+                    updated_at=now
+                ).execution_options(synchronize_session=False)
+            )
+        
+        db.session.commit()
+        return granted
     
     def to_dict(self):
         """Convert order item to dictionary"""
@@ -237,7 +291,7 @@ class Payment(db.Model):
     status = db.Column(db.Enum(PaymentStatus), default=PaymentStatus.PENDING, nullable=False)
     
     # Gateway information
-    gateway_payment_id = db.Column(db.String(100), nullable=True)
+    gateway_payment_id = db.Column(db.String(100), nullable=True, index=True)
     gateway_order_id = db.Column(db.String(100), nullable=True)
     gateway_signature = db.Column(db.String(200), nullable=True)
     gateway_response = db.Column(db.Text, nullable=True)  # JSON response from gateway
@@ -273,3 +327,326 @@ class Payment(db.Model):
     def __repr__(self):
         return f'<Payment {self.gateway_payment_id}>'
 
+
+class Entitlement(db.Model):
+    """Precomputed per-user library entry (user -> book -> remaining downloads)"""
+    __tablename__ = 'entitlements'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'book_id', name='uq_entitlements_user_book'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    
+    # Order item downloads are currently served from
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    order_item_id = db.Column(db.Integer, db.ForeignKey('order_items.id'), nullable=False)
+    
+    # Download quota summed over all completed purchases of the book
+    book_title = db.Column(db.String(200), nullable=False)
+    download_count = db.Column(db.Integer, default=0, nullable=False)
+    download_limit = db.Column(db.Integer, default=0, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    @property
+    def downloads_remaining(self):
+        """Get downloads left, zero once expired"""
+        if self.expires_at and datetime.utcnow() > self.expires_at:
+            return 0
+        return max(self.download_limit - self.download_count, 0)
+    
+    @staticmethod
+    def sync(user_id, book_ids):
+        """Rebuild the user's entitlements for the given books from completed orders"""
+        book_ids = set(book_ids)
+        if not book_ids:
+            return
+        
+        items = db.session.query(OrderItem).join(Order).filter(
+            Order.customer_id == user_id,
+            Order.status == OrderStatus.COMPLETED,
+            OrderItem.book_id.in_(book_ids)
+        ).order_by(OrderItem.id).all()
+        
+        existing = {
+            entitlement.book_id: entitlement
+            for entitlement in Entitlement.query.filter(
+                Entitlement.user_id == user_id,
+                Entitlement.book_id.in_(book_ids)
+            ).all()
+        }
+        
+        items_by_book = {}
+        for item in items:
+            items_by_book.setdefault(item.book_id, []).append(item)
+        
+        for book_id in book_ids:
+            book_items = items_by_book.get(book_id)
+            entitlement = existing.get(book_id)
+            
+            if not book_items:
+                # No completed purchase left (refund, cancellation)
+                if entitlement:
+                    db.session.delete(entitlement)
+                continue
+            
+            if not entitlement:
+                entitlement = Entitlement(user_id=user_id, book_id=book_id)
+                db.session.add(entitlement)
+            
+            # Serve downloads from the newest item that still has quota
+            available = [item for item in book_items if item.can_download()]
+            current = available[-1] if available else book_items[-1]
+            
+            expiries = [item.download_expires_at for item in book_items]
+            
+            entitlement.order_id = current.order_id
+            entitlement.order_item_id = current.id
+            entitlement.book_title = current.book_title
+            entitlement.download_count = sum(item.download_count for item in book_items)
+            entitlement.download_limit = sum(item.download_limit for item in book_items)
+            entitlement.expires_at = None if None in expiries else max(expiries)
+    
+    @staticmethod
+    def sync_order(order):
+        """Refresh entitlements for every book in an order"""
+        Entitlement.sync(order.customer_id, [item.book_id for item in order.items])
+    
+    @staticmethod
+    def rebuild_all():
+        """Rebuild every entitlement from completed orders"""
+        pairs = db.session.query(Order.customer_id, OrderItem.book_id).join(OrderItem).filter(
+            Order.status == OrderStatus.COMPLETED
+        ).distinct().all()
+        
+        books_by_user = {}
+        for user_id, book_id in pairs:
+            books_by_user.setdefault(user_id, set()).add(book_id)
+        
+        # Drop entries whose purchases no longer qualify
+        for entitlement in Entitlement.query.all():
+            if entitlement.book_id not in books_by_user.get(entitlement.user_id, ()):
+                db.session.delete(entitlement)
+        
+        for user_id, book_ids in books_by_user.items():
+            Entitlement.sync(user_id, book_ids)
+        
+        db.session.commit()
+        return len(pairs)
+    
+    def to_dict(self):
+        """Convert entitlement to dictionary"""
+        return {
+            'book_id': self.book_id,
+            'book_title': self.book_title,
+            'order_id': self.order_id,
+            'order_item_id': self.order_item_id,
+            'download_count': self.download_count,
+            'download_limit': self.download_limit,
+            'downloads_remaining': self.downloads_remaining,
+            'can_download': self.downloads_remaining > 0,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<Entitlement user={self.user_id} book={self.book_id}>'
+
+class WebhookEventStatus(enum.Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    PROCESSED = "processed"
+    FAILED = "failed"
+
+class WebhookEvent(db.Model):
+    """Raw gateway webhook kept in a durable inbox until processed"""
+    __tablename__ = 'webhook_events'
+    __table_args__ = (
+        db.UniqueConstraint('provider', 'event_id', name='uq_webhook_events_provider_event'),
+        db.Index('ix_webhook_events_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    provider = db.Column(db.String(20), nullable=False)
+    event_id = db.Column(db.String(100), nullable=False)
+    event_type = db.Column(db.String(100), nullable=True)
+    payload = db.Column(db.Text, nullable=False)  # Raw JSON body
+    
+    # Processing state
+    status = db.Column(db.Enum(WebhookEventStatus), default=WebhookEventStatus.PENDING, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    
+    # Timestamps
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        """Convert webhook event to dictionary"""
+        return {
+            'id': self.id,
+            'provider': self.provider,
+            'event_id': self.event_id,
+            'event_type': self.event_type,
+            'status': self.status.value,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None
+        }
+    
+    def __repr__(self):
+        return f'<WebhookEvent {self.provider}:{self.event_id}>'
+
+
+def hour_bucket(value):
+    """Start of the UTC hour containing a datetime"""
+    return value.replace(minute=0, second=0, microsecond=0)
+
+class RevenueHour(db.Model):
+    """Completed orders, revenue and items per hour and currency.
+
+    Kept in step with orders by the before_flush hook below, in the same
+    transaction as the payment status change, so charts can aggregate any
+    range and granularity from a few rows per hour.
+    """
+    __tablename__ = 'revenue_hours'
+    __table_args__ = (
+        db.UniqueConstraint('hour', 'currency', name='uq_revenue_hours_hour_currency'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    hour = db.Column(db.DateTime, nullable=False)  # Start of the hour the payment completed
+    currency = db.Column(db.Enum(Currency), nullable=False)
+    orders = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)  # In `currency`
+    items = db.Column(db.Integer, default=0, nullable=False)
+    
+    @staticmethod
+    def apply(connection, deltas):
+        """Add {(hour, currency): [orders, revenue, items]} deltas with one upsert per bucket"""
+        insert = postgresql_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+        for (hour, currency), (orders, revenue, items) in deltas.items():
+            statement = insert(RevenueHour.__table__).values(
+                hour=hour, currency=currency, orders=orders, revenue=revenue, items=items
+            )
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=['hour', 'currency'],
+                set_={
+                    name: RevenueHour.__table__.c[name] + statement.excluded[name]
+                    for name in ('orders', 'revenue', 'items')
+                }
+            ))
+    
+    @staticmethod
+    def rebuild():
+        """Recompute every bucket from completed orders; returns the number of orders counted"""
+        item_counts = dict(db.session.query(OrderItem.order_id, func.sum(OrderItem.quantity)).group_by(OrderItem.order_id).all())
+        deltas = {}
+        orders = db.session.query(
+            Order.id, Order.currency, Order.total_amount, Order.revenue_at
+        ).filter(Order.payment_status == PaymentStatus.COMPLETED).yield_per(1000)
+        count = 0
+        for order in orders:
+            bucket = deltas.setdefault((hour_bucket(order.revenue_at), order.currency), [0, 0.0, 0])
+            bucket[0] += 1
+            bucket[1] += order.total_amount
+            bucket[2] += item_counts.get(order.id) or 0
+            count += 1
+        
+        db.session.query(RevenueHour).delete()
+        RevenueHour.apply(db.session.connection(), deltas)
+        db.session.commit()
+        return count
+    
+    def to_dict(self):
+        return {
+            'hour': self.hour.isoformat() if self.hour else None,
+            'currency': self.currency.value if self.currency else None,
+            'orders': self.orders,
+            'revenue': self.revenue,
+            'items': self.items
+        }
+
+# Order fields that decide which revenue bucket an order counts in, and for how much
+_REVENUE_FIELDS = ('payment_status', 'completed_at', 'created_at', 'currency', 'total_amount')
+
+def _revenue_contribution(payment_status, completed_at, created_at, currency, total_amount):
+    """(bucket key, amount) an order adds to the revenue table, or None if it is not paid"""
+    if payment_status != PaymentStatus.COMPLETED:
+        return None
+    moment = completed_at or created_at or datetime.utcnow()
+    return (hour_bucket(moment), currency or Currency.USD), total_amount or 0
+
+def _stored_contributions(session, order_ids):
+    """Contribution and item count of each order as currently stored in the database.
+
+    Read from the rows rather than attribute history: history has no old
+    value once an attribute was expired by an earlier commit. Within a
+    transaction the rows reflect earlier flushes, whose deltas are already
+    applied.
+    """
+    if not order_ids:
+        return {}
+    connection = session.connection()
+    item_counts = dict(connection.execute(
+        select(OrderItem.order_id, func.sum(OrderItem.quantity)).where(
+            OrderItem.order_id.in_(order_ids)
+        ).group_by(OrderItem.order_id)
+    ).all())
+    rows = connection.execute(select(Order.id, *(Order.__table__.c[name] for name in _REVENUE_FIELDS)).where(
+        Order.id.in_(order_ids)
+    ))
+    return {row[0]: (_revenue_contribution(*row[1:]), item_counts.get(row[0]) or 0) for row in rows}
+
+def _order_revenue_deltas(session):
+    """Revenue bucket changes for orders paid, refunded, re-dated or deleted in this flush"""
+    changed = []
+    for order in list(session.new) + list(session.dirty):
+        if not isinstance(order, Order):
+            continue
+        state = inspect(order)
+        if state.pending or any(state.attrs[name].history.has_changes() for name in _REVENUE_FIELDS):
+            changed.append(order)
+    deleted = [order for order in session.deleted if isinstance(order, Order)]
+    
+    stored = _stored_contributions(session, [
+        order.id for order in changed + deleted if order.id is not None and not inspect(order).pending
+    ])
+    
+    deltas = {}
+    def add(sign, contribution, items):
+        if contribution is None:
+            return
+        key, amount = contribution
+        bucket = deltas.setdefault(key, [0, 0.0, 0])
+        bucket[0] += sign
+        bucket[1] += sign * amount
+        bucket[2] += sign * items
+    
+    for order in changed:
+        before, items_before = stored.get(order.id, (None, 0))
+        after = _revenue_contribution(*(getattr(order, name) for name in _REVENUE_FIELDS))
+        items_after = sum(item.quantity or 1 for item in order.items)
+        if before == after and items_before == items_after:
+            continue
+        add(-1, before, items_before)
+        add(1, after, items_after)
+    for order in deleted:
+        add(-1, *stored.get(order.id, (None, 0)))
+    return {key: values for key, values in deltas.items() if any(values)}
+
+@event.listens_for(Session, 'before_flush')
+def _record_order_revenue(session, flush_context, instances):
+    deltas = _order_revenue_deltas(session)
+    if deltas:
+        RevenueHour.apply(session.connection(), deltas)
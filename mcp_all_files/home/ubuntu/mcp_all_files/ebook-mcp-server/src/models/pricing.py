@@ -0,0 +1,202 @@
+from src.models.user import db
+from src.models.book import Book
+from src.models.order import Currency
+from sqlalchemy import select, delete, insert, func
+from decimal import Decimal, ROUND_HALF_UP, ROUND_CEILING
+from datetime import datetime
+
+class PriceRounding:
+    """Rounding rules applied after currency conversion"""
+    CENT = 'cent'          # 12.345 -> 12.35
+    WHOLE = 'whole'        # 12.01 -> 13
+    CHARM_99 = 'charm_99'  # 12.01 -> 12.99
+    CHARM_9 = 'charm_9'    # 1071.50 -> 1079
+
+    ALL = (CENT, WHOLE, CHARM_99, CHARM_9)
+
+def round_price(amount, rule):
+    """Round a converted price with the given rule; returns a Decimal"""
+    amount = Decimal(str(amount))
+    if rule == PriceRounding.WHOLE:
+        return amount.to_integral_value(rounding=ROUND_CEILING)
+    if rule == PriceRounding.CHARM_99:
+        whole = amount.to_integral_value(rounding=ROUND_CEILING)
+        charm = whole - Decimal('0.01')
+        return charm if charm >= amount else whole + Decimal('0.99')
+    if rule == PriceRounding.CHARM_9:
+        tens = (amount / 10).to_integral_value(rounding=ROUND_CEILING) * 10
+        charm = tens - 1
+        return charm if charm >= amount else tens + 9
+    return amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+def to_minor_units(amount):
+    """Exact integer minor units (cents/paise) of a major-unit amount.
+
+    Goes through the decimal string, so float totals such as 19.99 give 1999
+    rather than the 1998 that int(19.99 * 100) truncates to.
+    """
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+# Seeded when the rate table is empty; edit through /api/admin/exchange-rates
+DEFAULT_EXCHANGE_RATES = {
+    Currency.USD: (1.0, PriceRounding.CENT),
+    Currency.EUR: (0.92, PriceRounding.CHARM_99),
+    Currency.GBP: (0.79, PriceRounding.CHARM_99),
+    Currency.INR: (83.0, PriceRounding.CHARM_9)
+}
+
+class ExchangeRate(db.Model):
+    """Locally stored conversion rate from USD, with the currency's rounding rule"""
+    __tablename__ = 'exchange_rates'
+
+    id = db.Column(db.Integer, primary_key=True)
+    currency = db.Column(db.Enum(Currency), nullable=False, unique=True)
+    rate_from_usd = db.Column(db.Float, nullable=False)
+    rounding = db.Column(db.String(20), default=PriceRounding.CENT, nullable=False)
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    @staticmethod
+    def seed_defaults():
+        """Create default rates for currencies that have none"""
+        existing = {rate.currency for rate in ExchangeRate.query.all()}
+        for currency, (rate, rounding) in DEFAULT_EXCHANGE_RATES.items():
+            if currency not in existing:
+                db.session.add(ExchangeRate(currency=currency, rate_from_usd=rate, rounding=rounding))
+
+    def to_dict(self):
+        """Convert exchange rate to dictionary"""
+        return {
+            'id': self.id,
+            'currency': self.currency.value,
+            'rate_from_usd': self.rate_from_usd,
+            'rounding': self.rounding,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+def usd_amount(amount, currency):
+    """SQL expression converting an amount in `currency` (e.g. Order.total_amount
+    with Order.currency) to USD with the stored rates, for use inside SUM/AVG"""
+    rate = select(ExchangeRate.rate_from_usd).where(ExchangeRate.currency == currency).scalar_subquery()
+    return amount / func.coalesce(rate, 1.0)
+
+class BookPrice(db.Model):
+    """Materialized price of a book in one currency.
+
+    Rows are derived from Book.price_usd/sale_price_usd and ExchangeRate and
+    rebuilt in bulk by BookPrice.recompute(); request handlers only read them.
+    """
+    __tablename__ = 'book_prices'
+    __table_args__ = (
+        db.UniqueConstraint('book_id', 'currency', name='uq_book_prices_book_currency'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    currency = db.Column(db.Enum(Currency), nullable=False)
+
+    # Prices in major units; current_price_minor is what payment gateways are sent
+    price = db.Column(db.Float, nullable=False)
+    sale_price = db.Column(db.Float, nullable=True)
+    current_price = db.Column(db.Float, nullable=False)
+    current_price_minor = db.Column(db.Integer, nullable=False)
+
+    rate_from_usd = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # Relationships
+    book = db.relationship('Book', backref=db.backref('prices', lazy=True, cascade='all, delete-orphan'))
+
+    # Books repriced per transaction during a full rebuild
+    RECOMPUTE_BATCH_SIZE = 500
+
+    @staticmethod
+    def compute_rows(book_rows, rates, now=None):
+        """Build price rows for (id, price_usd, sale_price_usd, is_on_sale) tuples"""
+        now = now or datetime.utcnow()
+        rows = []
+        for book_id, price_usd, sale_price_usd, is_on_sale in book_rows:
+            for rate in rates:
+                factor = Decimal(str(rate.rate_from_usd))
+                price = round_price(Decimal(str(price_usd)) * factor, rate.rounding)
+                sale_price = None
+                if sale_price_usd:
+                    sale_price = round_price(Decimal(str(sale_price_usd)) * factor, rate.rounding)
+                current = sale_price if is_on_sale and sale_price is not None else price
+                rows.append({
+                    'book_id': book_id,
+                    'currency': rate.currency,
+                    'price': float(price),
+                    'sale_price': float(sale_price) if sale_price is not None else None,
+                    'current_price': float(current),
+                    'current_price_minor': to_minor_units(current),
+                    'rate_from_usd': rate.rate_from_usd,
+                    'computed_at': now
+                })
+        return rows
+
+    @staticmethod
+    def recompute(book_ids=None, batch_size=None):
+        """Rebuild price rows for the given books, or for every book.
+
+        Each batch is one SELECT, one DELETE and one multi-row INSERT.
+        Commits per batch; returns the number of books repriced.
+        """
+        batch_size = batch_size or BookPrice.RECOMPUTE_BATCH_SIZE
+        rates = ExchangeRate.query.all()
+        if not rates:
+            return 0
+
+        query = select(Book.id, Book.price_usd, Book.sale_price_usd, Book.is_on_sale).order_by(Book.id)
+        if book_ids is not None:
+            book_ids = list(set(book_ids))
+            if not book_ids:
+                return 0
+            query = query.where(Book.id.in_(book_ids))
+
+        repriced = 0
+        last_id = 0
+        while True:
+            book_rows = db.session.execute(query.where(Book.id > last_id).limit(batch_size)).all()
+            if not book_rows:
+                break
+
+            ids = [row.id for row in book_rows]
+            last_id = ids[-1]
+            db.session.execute(delete(BookPrice).where(BookPrice.book_id.in_(ids)))
+            db.session.execute(insert(BookPrice), BookPrice.compute_rows(book_rows, rates))
+            db.session.commit()
+
+            repriced += len(ids)
+            if len(book_rows) < batch_size:
+                break
+
+        return repriced
+
+    @staticmethod
+    def for_books(book_ids, currency):
+        """Map book id -> BookPrice for one currency in a single query"""
+        if not book_ids:
+            return {}
+        return {
+            price.book_id: price
+            for price in BookPrice.query.filter(
+                BookPrice.book_id.in_(book_ids),
+                BookPrice.currency == currency
+            ).all()
+        }
+
+    def to_dict(self):
+        """Convert book price to dictionary"""
+        return {
+            'currency': self.currency.value,
+            'price': self.price,
+            'sale_price': self.sale_price,
+            'current_price': self.current_price,
+            'current_price_minor': self.current_price_minor,
+            'rate_from_usd': self.rate_from_usd,
+            'computed_at': self.computed_at.isoformat() if self.computed_at else None
+        }
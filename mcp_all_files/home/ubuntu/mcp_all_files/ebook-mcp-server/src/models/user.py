@@ -1,6 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from src.services.password_hasher import hash_password, verify_password, needs_rehash
 import enum
 
 db = SQLAlchemy()
@@ -40,11 +40,15 @@ class User(db.Model):
     
     def set_password(self, password):
         """Set password hash"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
         """Check password against hash"""
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """Check if the stored hash predates the current hash policy"""
+        return needs_rehash(self.password_hash)
     
     @property
     def full_name(self):
@@ -76,3 +80,39 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.email}>'
 
+
+class TokenVersion(db.Model):
+    """Per-user token version; tokens issued with an older version are revoked.
+
+    Only users who ever had a revocation (logout, password or role change,
+    deactivation) have a row, so the table stays small enough to mirror in
+    memory on every worker.
+    """
+    __tablename__ = 'token_versions'
+    
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    @staticmethod
+    def bump(user_id):
+        """Increment the user's token version (committed by the caller)"""
+        updated = TokenVersion.query.filter(TokenVersion.user_id == user_id).update(
+            {TokenVersion.version: TokenVersion.version + 1, TokenVersion.updated_at: datetime.utcnow()},
+            synchronize_session=False
+        )
+        if not updated:
+            db.session.add(TokenVersion(user_id=user_id, version=1, updated_at=datetime.utcnow()))
+
+class RevokedSession(db.Model):
+    """A signed-out session; its access and refresh tokens are revoked.
+
+    Rows are only needed until the session's refresh token would have
+    expired, so the table holds at most REFRESH_TOKEN_TTL worth of logouts.
+    """
+    __tablename__ = 'revoked_sessions'
+    
+    session_id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
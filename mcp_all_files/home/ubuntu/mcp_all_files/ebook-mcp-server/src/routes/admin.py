@@ -3,7 +3,13 @@ from sqlalchemy import or_, desc
 from datetime import datetime
 from src.models.user import db, User, UserRole
 from src.models.analytics import AuditLog
-from src.routes.auth import token_required, admin_required
+from src.models.order import Currency
+from src.models.pricing import ExchangeRate, BookPrice, PriceRounding
+from src.routes.auth import token_required, admin_required, revoke_user_tokens
+from src.services.stats import get_stats, invalidate_stats
+from src.services.metrics import metrics
+from src.services.principal_cache import principal_cache
+from src.services.password_hasher import PasswordHashingBusy
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -127,6 +133,7 @@ def create_user():
         
         db.session.add(user)
         db.session.commit()
+        invalidate_stats('users')
         
         # Log the creation
         AuditLog.log_action(
@@ -144,6 +151,9 @@ def create_user():
             'user': user.to_dict()
         }), 201
         
+    except PasswordHashingBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Server is busy, please try again'}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to create user', 'details': str(e)}), 500
@@ -182,6 +192,14 @@ def update_user(user_id):
             user.set_password(data['password'])
         
         db.session.commit()
+        invalidate_stats('users')
+        
+        # Role changes, deactivation and password resets end existing sessions
+        if (user.role.value != old_values['role'] or (old_values['is_active'] and not user.is_active)
+                or data.get('password')):
+            revoke_user_tokens(user.id)
+        else:
+            principal_cache.invalidate(user.id)
         
         # Log the update
         AuditLog.log_action(
@@ -200,6 +218,9 @@ def update_user(user_id):
             'user': user.to_dict()
         }), 200
         
+    except PasswordHashingBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Server is busy, please try again'}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to update user', 'details': str(e)}), 500
@@ -221,6 +242,8 @@ def delete_user(user_id):
         
         db.session.delete(user)
         db.session.commit()
+        invalidate_stats('users')
+        revoke_user_tokens(user_id)
         
         # Log the deletion
         AuditLog.log_action(
@@ -257,6 +280,11 @@ def toggle_user_status(user_id):
         # Toggle status
         user.is_active = not user.is_active
         db.session.commit()
+        invalidate_stats('users')
+        if user.is_active:
+            principal_cache.invalidate(user.id)
+        else:
+            revoke_user_tokens(user.id)
         
         # Log the status change
         AuditLog.log_action(
@@ -286,31 +314,7 @@ def toggle_user_status(user_id):
 def get_user_stats():
     """Get user statistics"""
     try:
-        total_users = User.query.count()
-        active_users = User.query.filter_by(is_active=True).count()
-        inactive_users = User.query.filter_by(is_active=False).count()
-        
-        # Count by role
-        admin_count = User.query.filter_by(role=UserRole.ADMIN).count()
-        editor_count = User.query.filter_by(role=UserRole.EDITOR).count()
-        customer_count = User.query.filter_by(role=UserRole.CUSTOMER).count()
-        
-        # Recent registrations (last 30 days)
-        from datetime import timedelta
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        recent_registrations = User.query.filter(User.created_at >= thirty_days_ago).count()
-        
-        return jsonify({
-            'total_users': total_users,
-            'active_users': active_users,
-            'inactive_users': inactive_users,
-            'recent_registrations': recent_registrations,
-            'by_role': {
-                'admin': admin_count,
-                'editor': editor_count,
-                'customer': customer_count
-            }
-        }), 200
+        return jsonify(get_stats('users')), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to get user stats', 'details': str(e)}), 500
@@ -367,3 +371,87 @@ def get_audit_logs():
     except Exception as e:
         return jsonify({'error': 'Failed to get audit logs', 'details': str(e)}), 500
 
+
+@admin_bp.route('/metrics', methods=['GET'])
+@token_required
+@admin_required
+def get_metrics():
+    """Get in-process metrics for this worker"""
+    try:
+        return jsonify(metrics.snapshot()), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to get metrics', 'details': str(e)}), 500
+
+@admin_bp.route('/exchange-rates', methods=['GET'])
+@token_required
+@admin_required
+def get_exchange_rates():
+    """Get exchange rates used for the price lists"""
+    try:
+        rates = ExchangeRate.query.order_by(ExchangeRate.currency).all()
+        return jsonify({
+            'rates': [rate.to_dict() for rate in rates],
+            'rounding_rules': list(PriceRounding.ALL)
+        }), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to get exchange rates', 'details': str(e)}), 500
+
+@admin_bp.route('/exchange-rates/<currency>', methods=['PUT'])
+@token_required
+@admin_required
+def update_exchange_rate(currency):
+    """Update a currency's rate or rounding rule and reprice all books"""
+    try:
+        try:
+            currency = Currency(currency.upper())
+        except ValueError:
+            return jsonify({'error': 'Unsupported currency'}), 400
+        
+        data = request.get_json() or {}
+        rate = ExchangeRate.query.filter_by(currency=currency).first()
+        old_values = rate.to_dict() if rate else None
+        if not rate:
+            if 'rate_from_usd' not in data:
+                return jsonify({'error': 'rate_from_usd is required'}), 400
+            rate = ExchangeRate(currency=currency)
+            db.session.add(rate)
+        
+        if 'rate_from_usd' in data:
+            try:
+                rate_from_usd = float(data['rate_from_usd'])
+            except (TypeError, ValueError):
+                return jsonify({'error': 'rate_from_usd must be a number'}), 400
+            if rate_from_usd <= 0:
+                return jsonify({'error': 'rate_from_usd must be positive'}), 400
+            rate.rate_from_usd = rate_from_usd
+        
+        if 'rounding' in data:
+            if data['rounding'] not in PriceRounding.ALL:
+                return jsonify({'error': f'rounding must be one of: {", ".join(PriceRounding.ALL)}'}), 400
+            rate.rounding = data['rounding']
+        
+        db.session.commit()
+        invalidate_stats('orders')
+        
+        repriced = BookPrice.recompute()
+        
+        AuditLog.log_action(
+            user_id=request.current_user.id,
+            action='update_exchange_rate',
+            resource_type='exchange_rate',
+            resource_id=rate.id,
+            old_values=old_values,
+            new_values=rate.to_dict(),
+            ip_address=request.remote_addr,
+            user_agent=request.headers.get('User-Agent')
+        )
+        
+        return jsonify({
+            'message': 'Exchange rate updated successfully',
+            'rate': rate.to_dict(),
+            'books_repriced': repriced
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to update exchange rate', 'details': str(e)}), 500
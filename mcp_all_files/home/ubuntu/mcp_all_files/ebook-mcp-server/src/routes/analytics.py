@@ -1,16 +1,60 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, send_file
 from sqlalchemy import func, desc, and_, or_
 from datetime import datetime, timedelta, date
 from collections import defaultdict
 import json
+import os
+import numpy as np
 from src.models.user import db, User, UserRole
 from src.models.book import Book, Author, Category
-from src.models.order import Order, OrderItem, Payment, OrderStatus, PaymentStatus
-from src.models.analytics import AnalyticsEvent, DailySummary, AuditLog, EventType
-from src.routes.auth import token_required, admin_required
+from src.models.order import Order, OrderItem, Payment, OrderStatus, PaymentStatus, Currency
+from src.models.pricing import usd_amount
+from src.models.analytics import AnalyticsEvent, DailySummary, AuditLog, EventType, ReportJob, ReportJobStatus
+from src.routes.auth import token_required, admin_required, verify_token
+from src.services.daily_rollup import (
+    summaries_between, today_new_users
+)
+from src.services.event_queries import recent_events_query, filtered_events_query, event_type_counts
+from src.services.event_archive import read_archived_events, archived_days, retention_horizon
+from src.services.event_store import event_store, decode_key, DERIVED_COLUMNS
+from src.services.unique_counts import unique_visitors, unique_readers
+from src.services.live_metrics import live_metrics
+from src.services.revenue_series import revenue_series, revenue_totals, GRANULARITIES
+from src.services.cohorts import cohort_retention, PERIODS
+from src.services.funnels import (
+    conversion_funnels, FUNNEL_STEPS, ATTRIBUTIONS, DEFAULT_PURCHASE_WINDOW, DEFAULT_DOWNLOAD_WINDOW
+)
+from src.services.reports import REPORTS, REPORT_FORMATS
+from src.services.report_jobs import enqueue_report
 
 analytics_bp = Blueprint('analytics', __name__)
 
+# Widest date range one archive read may scan
+MAX_ARCHIVE_RANGE_DAYS = 366
+
+# Widest date range a funnel may start in (events are read from analytics_events)
+MAX_FUNNEL_RANGE_DAYS = 366
+
+# Signup periods one cohort table may cover
+MAX_COHORTS = 120
+
+# Widest date range one report export may cover
+MAX_REPORT_RANGE_DAYS = 3660
+
+# Columns /analytics/events/aggregate can group by
+AGGREGATE_GROUP_COLUMNS = ('event_type', 'user_id', 'book_id') + DERIVED_COLUMNS
+
+def requested_date_range(days):
+    """Parse start_date/end_date (inclusive) or fall back to the last `days` days including today.
+
+    Returns (start, end) with end exclusive; raises ValueError on a malformed date.
+    """
+    end_date = date.fromisoformat(request.args['end_date']) + timedelta(days=1) \
+        if request.args.get('end_date') else datetime.utcnow().date() + timedelta(days=1)
+    start_date = date.fromisoformat(request.args['start_date']) \
+        if request.args.get('start_date') else end_date - timedelta(days=days)
+    return start_date, end_date
+
 @analytics_bp.route('/analytics/dashboard', methods=['GET'])
 @token_required
 @admin_required
@@ -22,9 +66,18 @@ def get_dashboard_data():
         end_date = datetime.utcnow().date()
         start_date = end_date - timedelta(days=days)
         
+        # Past days come from whatever the background rollup has summarized; only today is read from raw tables
+        history = summaries_between(start_date, end_date)
+        
+        # Sales come from the hourly revenue table
+        range_start = datetime.combine(start_date, datetime.min.time())
+        range_end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+        daily_revenue = revenue_series(range_start, range_end, 'day')
+        totals = revenue_totals()
+        
         # User Analytics
         total_users = User.query.count()
-        new_users = User.query.filter(User.created_at >= start_date).count()
+        new_users = sum(day.new_users for day in history) + today_new_users()
         active_users = User.query.filter(User.is_active == True).count()
         
         # Book Analytics
@@ -38,26 +91,18 @@ def get_dashboard_data():
         pending_orders = Order.query.filter_by(status=OrderStatus.PENDING).count()
         
         # Revenue Analytics
-        total_revenue = db.session.query(func.sum(Order.total_amount)).filter(
-            Order.payment_status == PaymentStatus.COMPLETED
-        ).scalar() or 0
-        
-        recent_revenue = db.session.query(func.sum(Order.total_amount)).filter(
-            Order.payment_status == PaymentStatus.COMPLETED,
-            Order.created_at >= start_date
-        ).scalar() or 0
+        total_revenue = totals['revenue']
+        recent_revenue = sum(day['revenue'] for day in daily_revenue)
         
         # Average Order Value
-        avg_order_value = db.session.query(func.avg(Order.total_amount)).filter(
-            Order.payment_status == PaymentStatus.COMPLETED
-        ).scalar() or 0
+        avg_order_value = total_revenue / totals['orders'] if totals['orders'] else 0
         
         # Top Books by Sales
         top_books = db.session.query(
             Book.id,
             Book.title,
             func.count(OrderItem.id).label('sales_count'),
-            func.sum(OrderItem.total_price).label('total_revenue')
+            func.sum(usd_amount(OrderItem.total_price, Order.currency)).label('total_revenue')
         ).join(OrderItem).join(Order).filter(
             Order.payment_status == PaymentStatus.COMPLETED
         ).group_by(Book.id, Book.title).order_by(
@@ -75,9 +120,9 @@ def get_dashboard_data():
         ]
         
         # Recent Activity (Analytics Events)
-        recent_events = AnalyticsEvent.query.filter(
-            AnalyticsEvent.created_at >= start_date
-        ).order_by(desc(AnalyticsEvent.created_at)).limit(10).all()
+        recent_events = db.session.execute(
+            recent_events_query(datetime.combine(start_date, datetime.min.time()))
+        ).scalars().all()
         
         recent_activity = [
             {
@@ -91,20 +136,11 @@ def get_dashboard_data():
         ]
         
         # Daily Revenue Trend (last 30 days)
-        daily_revenue = db.session.query(
-            func.date(Order.created_at).label('date'),
-            func.sum(Order.total_amount).label('revenue'),
-            func.count(Order.id).label('orders')
-        ).filter(
-            Order.payment_status == PaymentStatus.COMPLETED,
-            Order.created_at >= start_date
-        ).group_by(func.date(Order.created_at)).order_by('date').all()
-        
         revenue_trend = [
             {
-                'date': day.date.isoformat() if hasattr(day.date, 'isoformat') else str(day.date),
-                'revenue': float(day.revenue or 0),
-                'orders': day.orders
+                'date': day['period'][:10],
+                'revenue': day['revenue'],
+                'orders': day['orders']
             }
             for day in daily_revenue
         ]
@@ -147,21 +183,17 @@ def get_user_analytics():
         end_date = datetime.utcnow().date()
         start_date = end_date - timedelta(days=days)
         
-        # User Registration Trend
-        daily_registrations = db.session.query(
-            func.date(User.created_at).label('date'),
-            func.count(User.id).label('registrations')
-        ).filter(
-            User.created_at >= start_date
-        ).group_by(func.date(User.created_at)).order_by('date').all()
-        
+        # User Registration Trend (rolled-up days plus today)
         registration_trend = [
             {
-                'date': day.date.isoformat() if hasattr(day.date, 'isoformat') else str(day.date),
-                'registrations': day.registrations
+                'date': day.date.isoformat(),
+                'registrations': day.new_users
             }
-            for day in daily_registrations
+            for day in summaries_between(start_date, end_date) if day.new_users
         ]
+        registrations_today = today_new_users()
+        if registrations_today:
+            registration_trend.append({'date': end_date.isoformat(), 'registrations': registrations_today})
         
         # User Role Distribution
         role_distribution = db.session.query(
@@ -188,11 +220,11 @@ def get_user_analytics():
             User.last_name,
             User.email,
             func.count(Order.id).label('order_count'),
-            func.sum(Order.total_amount).label('total_spent')
+            func.sum(usd_amount(Order.total_amount, Order.currency)).label('total_spent')
         ).join(Order).filter(
             Order.payment_status == PaymentStatus.COMPLETED
         ).group_by(User.id, User.first_name, User.last_name, User.email).order_by(
-            func.sum(Order.total_amount).desc()
+            func.sum(usd_amount(Order.total_amount, Order.currency)).desc()
         ).limit(10).all()
         
         top_customers_data = [
@@ -230,6 +262,12 @@ def get_user_analytics():
 def get_book_analytics():
     """Get detailed book analytics"""
     try:
+        days = request.args.get('days', 30, type=int)
+        end_date = datetime.utcnow().date() + timedelta(days=1)
+        
+        # Conversion is attributed per visitor over the period, not lifetime sales / lifetime views
+        book_funnels = conversion_funnels(end_date - timedelta(days=days), end_date)['books']
+        
         # Book Performance
         book_performance = db.session.query(
             Book.id,
@@ -237,7 +275,7 @@ def get_book_analytics():
             Book.view_count,
             Book.download_count,
             func.count(OrderItem.id).label('sales_count'),
-            func.sum(OrderItem.total_price).label('revenue')
+            func.sum(usd_amount(OrderItem.total_price, Order.currency)).label('revenue')
         ).select_from(Book).outerjoin(OrderItem, Book.id == OrderItem.book_id).outerjoin(
             Order, OrderItem.order_id == Order.id
         ).filter(
@@ -254,7 +292,7 @@ def get_book_analytics():
                 'downloads': book.download_count or 0,
                 'sales': book.sales_count or 0,
                 'revenue': float(book.revenue or 0),
-                'conversion_rate': round((book.sales_count or 0) / max(book.view_count or 1, 1) * 100, 2)
+                'conversion_rate': book_funnels[book.id]['view_to_purchase'] if book.id in book_funnels else 0.0
             }
             for book in book_performance
         ]
@@ -294,13 +332,13 @@ def get_book_analytics():
             func.count(Book.id).label('book_count'),
             func.sum(Book.view_count).label('total_views'),
             func.count(OrderItem.id).label('total_sales'),
-            func.sum(OrderItem.total_price).label('total_revenue')
+            func.sum(usd_amount(OrderItem.total_price, Order.currency)).label('total_revenue')
         ).select_from(Author).outerjoin(Book, Author.id == Book.author_id).outerjoin(
             OrderItem, Book.id == OrderItem.book_id
         ).outerjoin(Order, OrderItem.order_id == Order.id).filter(
             or_(Order.payment_status == PaymentStatus.COMPLETED, Order.payment_status.is_(None))
         ).group_by(Author.id, Author.name).order_by(
-            func.sum(OrderItem.total_price).desc()
+            func.sum(usd_amount(OrderItem.total_price, Order.currency)).desc()
         ).all()
         
         author_data = [
@@ -340,32 +378,24 @@ def get_sales_analytics():
         end_date = datetime.utcnow().date()
         start_date = end_date - timedelta(days=days)
         
-        # Daily Sales Trend
-        daily_sales = db.session.query(
-            func.date(Order.created_at).label('date'),
-            func.count(Order.id).label('orders'),
-            func.sum(Order.total_amount).label('revenue'),
-            func.avg(Order.total_amount).label('avg_order_value')
-        ).filter(
-            Order.payment_status == PaymentStatus.COMPLETED,
-            Order.created_at >= start_date
-        ).group_by(func.date(Order.created_at)).order_by('date').all()
-        
+        # Daily Sales Trend from the hourly revenue table
+        range_end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
         sales_trend = [
             {
-                'date': day.date.isoformat() if hasattr(day.date, 'isoformat') else str(day.date),
-                'orders': day.orders,
-                'revenue': float(day.revenue or 0),
-                'avg_order_value': round(float(day.avg_order_value or 0), 2)
+                'date': day['period'][:10],
+                'orders': day['orders'],
+                'revenue': day['revenue'],
+                'items': day['items'],
+                'avg_order_value': round(day['revenue'] / day['orders'], 2)
             }
-            for day in daily_sales
+            for day in revenue_series(datetime.combine(start_date, datetime.min.time()), range_end, 'day')
         ]
         
         # Payment Method Distribution
         payment_methods = db.session.query(
             Order.payment_method,
             func.count(Order.id).label('count'),
-            func.sum(Order.total_amount).label('revenue')
+            func.sum(usd_amount(Order.total_amount, Order.currency)).label('revenue')
         ).filter(
             Order.payment_status == PaymentStatus.COMPLETED
         ).group_by(Order.payment_method).all()
@@ -393,33 +423,27 @@ def get_sales_analytics():
             for status in order_status
         ]
         
-        # Monthly Revenue Comparison (last 12 months)
-        monthly_revenue = db.session.query(
-            func.strftime('%Y-%m', Order.created_at).label('month'),
-            func.sum(Order.total_amount).label('revenue'),
-            func.count(Order.id).label('orders')
-        ).filter(
-            Order.payment_status == PaymentStatus.COMPLETED,
-            Order.created_at >= datetime.utcnow() - timedelta(days=365)
-        ).group_by(func.strftime('%Y-%m', Order.created_at)).order_by('month').all()
-        
+        # Monthly Revenue Comparison (this month and the 11 before it)
+        first_month = date(end_date.year - (1 if end_date.month < 12 else 0), end_date.month % 12 + 1, 1)
         monthly_data = [
             {
-                'month': month.month,
-                'revenue': float(month.revenue or 0),
-                'orders': month.orders
+                'month': month['period'][:7],
+                'revenue': month['revenue'],
+                'orders': month['orders']
             }
-            for month in monthly_revenue
+            for month in revenue_series(datetime.combine(first_month, datetime.min.time()), range_end, 'month')
         ]
         
+        totals = revenue_totals()
+        
         return jsonify({
             'daily_sales': sales_trend,
             'payment_methods': payment_data,
             'order_status': status_data,
             'monthly_revenue': monthly_data,
             'summary': {
-                'total_revenue': float(db.session.query(func.sum(Order.total_amount)).filter(Order.payment_status == PaymentStatus.COMPLETED).scalar() or 0),
-                'total_orders': Order.query.filter_by(payment_status=PaymentStatus.COMPLETED).count(),
+                'total_revenue': totals['revenue'],
+                'total_orders': totals['orders'],
                 'period_revenue': sum(day['revenue'] for day in sales_trend),
                 'period_orders': sum(day['orders'] for day in sales_trend),
                 'growth_rate': 0  # Calculate based on previous period comparison
@@ -442,29 +466,18 @@ def get_analytics_events():
         book_id = request.args.get('book_id', type=int)
         days = request.args.get('days', 7, type=int)
         
-        # Build query
-        query = AnalyticsEvent.query
-        
         # Apply filters
         if event_type and event_type in [e.value for e in EventType]:
-            query = query.filter(AnalyticsEvent.event_type == EventType(event_type))
-        
-        if user_id:
-            query = query.filter(AnalyticsEvent.user_id == user_id)
-        
-        if book_id:
-            query = query.filter(AnalyticsEvent.book_id == book_id)
-        
-        # Date filter
-        if days > 0:
-            start_date = datetime.utcnow() - timedelta(days=days)
-            query = query.filter(AnalyticsEvent.created_at >= start_date)
+            event_type = EventType(event_type)
+        else:
+            event_type = None
         
-        # Order by creation date (newest first)
-        query = query.order_by(desc(AnalyticsEvent.created_at))
+        # Date filter (also bounds the summary)
+        start_date = datetime.utcnow() - timedelta(days=days) if days > 0 else None
         
-        # Paginate
-        pagination = query.paginate(
+        # Newest first; each filter combination is served by a (..., created_at) index
+        pagination = db.paginate(
+            filtered_events_query(start_date, event_type=event_type, user_id=user_id, book_id=book_id),
             page=page, 
             per_page=per_page, 
             error_out=False
@@ -473,19 +486,12 @@ def get_analytics_events():
         events = pagination.items
         
         # Event type summary
-        event_summary = db.session.query(
-            AnalyticsEvent.event_type,
-            func.count(AnalyticsEvent.id).label('count')
-        ).filter(
-            AnalyticsEvent.created_at >= datetime.utcnow() - timedelta(days=days)
-        ).group_by(AnalyticsEvent.event_type).all()
-        
         summary_data = [
             {
-                'event_type': event.event_type.value,
-                'count': event.count
+                'event_type': event_type.value,
+                'count': count
             }
-            for event in event_summary
+            for event_type, count in event_type_counts(start_date)
         ]
         
         return jsonify({
@@ -504,48 +510,400 @@ def get_analytics_events():
     except Exception as e:
         return jsonify({'error': 'Failed to get analytics events', 'details': str(e)}), 500
 
+@analytics_bp.route('/analytics/events/archive', methods=['GET'])
+@token_required
+@admin_required
+def get_archived_events():
+    """Stream archived analytics events for a date range as NDJSON"""
+    try:
+        start_date = request.args.get('start_date', '', type=str)
+        end_date = request.args.get('end_date', '', type=str)
+        event_type = request.args.get('event_type', '', type=str)
+        user_id = request.args.get('user_id', type=int)
+        book_id = request.args.get('book_id', type=int)
+
+        if not start_date or not end_date:
+            return jsonify({'error': 'start_date and end_date are required'}), 400
+
+        try:
+            start = date.fromisoformat(start_date)
+            # End date is inclusive
+            end = date.fromisoformat(end_date) + timedelta(days=1)
+        except ValueError:
+            return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+
+        if end <= start or (end - start).days > MAX_ARCHIVE_RANGE_DAYS:
+            return jsonify({'error': f'Date range must be 1 to {MAX_ARCHIVE_RANGE_DAYS} days'}), 400
+
+        if event_type and event_type not in [e.value for e in EventType]:
+            return jsonify({'error': 'Invalid event type'}), 400
+
+        def generate():
+            for event in read_archived_events(start, end, event_type=event_type or None,
+                                              user_id=user_id, book_id=book_id):
+                yield json.dumps(event) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to read archived events', 'details': str(e)}), 500
+
+@analytics_bp.route('/analytics/events/archive/days', methods=['GET'])
+@token_required
+@admin_required
+def get_archived_days():
+    """List days whose events have been moved to the archive"""
+    try:
+        return jsonify({
+            'days': [day.isoformat() for day in archived_days()],
+            'retention_horizon': retention_horizon().isoformat()
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to list archived days', 'details': str(e)}), 500
+
+@analytics_bp.route('/analytics/events/aggregate', methods=['GET'])
+@token_required
+@admin_required
+def aggregate_events():
+    """Count events per group over a date range from the columnar event store"""
+    try:
+        days = request.args.get('days', 30, type=int)
+        group_by = [name for name in request.args.get('group_by', 'day', type=str).split(',') if name]
+        event_types = [name for name in request.args.get('event_type', '', type=str).split(',') if name]
+        user_id = request.args.get('user_id', type=int)
+        book_id = request.args.get('book_id', type=int)
+        limit = request.args.get('limit', type=int)
+
+        invalid = [name for name in group_by if name not in AGGREGATE_GROUP_COLUMNS]
+        if not group_by or invalid:
+            return jsonify({'error': f"group_by must be a comma-separated list of {', '.join(AGGREGATE_GROUP_COLUMNS)}"}), 400
+
+        valid_types = [e.value for e in EventType]
+        if any(name not in valid_types for name in event_types):
+            return jsonify({'error': 'Invalid event type'}), 400
+
+        try:
+            start_date, end_date = requested_date_range(days)
+        except ValueError:
+            return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+
+        keys, counts = event_store.group_count(
+            start_date, end_date, group_by,
+            event_types=[EventType(name) for name in event_types] or None,
+            user_id=user_id, book_id=book_id
+        )
+
+        # Largest groups first when a limit is given, otherwise in key order
+        order = np.argsort(-counts, kind='stable')[:limit] if limit else np.arange(len(counts))
+        rows = []
+        for i in order:
+            row = {name: decode_key(name, keys[name][i]) for name in group_by}
+            row['count'] = int(counts[i])
+            rows.append(row)
+
+        return jsonify({
+            'rows': rows,
+            'total': int(counts.sum()),
+            'group_by': group_by,
+            'date_range': {
+                'start_date': start_date.isoformat(),
+                'end_date': (end_date - timedelta(days=1)).isoformat()
+            },
+            'last_event_id': event_store.last_event_id
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to aggregate events', 'details': str(e)}), 500
+
+@analytics_bp.route('/analytics/unique-visitors', methods=['GET'])
+@token_required
+@admin_required
+def get_unique_visitors():
+    """Approximate distinct visitors over a date range, merged from daily HyperLogLog sketches"""
+    try:
+        days = request.args.get('days', 30, type=int)
+        try:
+            start_date, end_date = requested_date_range(days)
+        except ValueError:
+            return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+
+        return jsonify({
+            'unique_visitors': unique_visitors(start_date, end_date),
+            'date_range': {
+                'start_date': start_date.isoformat(),
+                'end_date': (end_date - timedelta(days=1)).isoformat()
+            }
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to get unique visitors', 'details': str(e)}), 500
+
+@analytics_bp.route('/analytics/books/<int:book_id>/unique-readers', methods=['GET'])
+@token_required
+@admin_required
+def get_unique_readers(book_id):
+    """Approximate distinct visitors who viewed or downloaded a book over a date range"""
+    try:
+        days = request.args.get('days', 30, type=int)
+        try:
+            start_date, end_date = requested_date_range(days)
+        except ValueError:
+            return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+
+        return jsonify({
+            'book_id': book_id,
+            'unique_readers': unique_readers(book_id, start_date, end_date),
+            'date_range': {
+                'start_date': start_date.isoformat(),
+                'end_date': (end_date - timedelta(days=1)).isoformat()
+            }
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to get unique readers', 'details': str(e)}), 500
+
+@analytics_bp.route('/analytics/funnels', methods=['GET'])
+@token_required
+@admin_required
+def get_conversion_funnels():
+    """View -> purchase -> download conversion overall, per book and per category"""
+    try:
+        days = request.args.get('days', 30, type=int)
+        attribution = request.args.get('attribution', 'user', type=str)
+        purchase_window = request.args.get('purchase_window_hours', type=float)
+        download_window = request.args.get('download_window_hours', type=float)
+        limit = request.args.get('limit', 50, type=int)
+
+        if attribution not in ATTRIBUTIONS:
+            return jsonify({'error': f"attribution must be one of {', '.join(ATTRIBUTIONS)}"}), 400
+        if (purchase_window is not None and purchase_window <= 0) or (download_window is not None and download_window <= 0):
+            return jsonify({'error': 'Funnel windows must be positive'}), 400
+
+        try:
+            start_date, end_date = requested_date_range(days)
+        except ValueError:
+            return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+        if (end_date - start_date).days > MAX_FUNNEL_RANGE_DAYS:
+            return jsonify({'error': f'Date range cannot exceed {MAX_FUNNEL_RANGE_DAYS} days'}), 400
+
+        purchase_window = timedelta(hours=purchase_window) if purchase_window else DEFAULT_PURCHASE_WINDOW
+        download_window = timedelta(hours=download_window) if download_window else DEFAULT_DOWNLOAD_WINDOW
+        funnels = conversion_funnels(start_date, end_date, attribution, purchase_window, download_window)
+
+        # Largest funnels first
+        book_ids = sorted(funnels['books'], key=lambda book_id: -funnels['books'][book_id]['viewers'])[:limit]
+        category_ids = sorted(funnels['categories'], key=lambda category_id: -funnels['categories'][category_id]['viewers'])
+        titles = dict(db.session.query(Book.id, Book.title).filter(Book.id.in_(book_ids)).all()) if book_ids else {}
+        names = dict(db.session.query(Category.id, Category.name).filter(Category.id.in_(category_ids)).all()) if category_ids else {}
+
+        return jsonify({
+            'steps': list(FUNNEL_STEPS),
+            'attribution': attribution,
+            'windows': {
+                'purchase_hours': purchase_window.total_seconds() / 3600,
+                'download_hours': download_window.total_seconds() / 3600
+            },
+            'overall': funnels['overall'],
+            'books': [
+                {'id': book_id, 'title': titles.get(book_id), **funnels['books'][book_id]}
+                for book_id in book_ids
+            ],
+            'categories': [
+                {'id': category_id, 'name': names.get(category_id), **funnels['categories'][category_id]}
+                for category_id in category_ids
+            ],
+            'date_range': {
+                'start_date': start_date.isoformat(),
+                'end_date': (end_date - timedelta(days=1)).isoformat()
+            }
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to get conversion funnels', 'details': str(e)}), 500
+
+@analytics_bp.route('/analytics/cohorts', methods=['GET'])
+@token_required
+@admin_required
+def get_cohort_retention():
+    """Weekly or monthly signup cohorts with the share placing a completed order in each later period"""
+    try:
+        period = request.args.get('period', 'month', type=str)
+        cohorts = request.args.get('cohorts', 12, type=int)
+
+        if period not in PERIODS:
+            return jsonify({'error': f"period must be one of {', '.join(PERIODS)}"}), 400
+        if cohorts < 1 or cohorts > MAX_COHORTS:
+            return jsonify({'error': f'cohorts must be between 1 and {MAX_COHORTS}'}), 400
+
+        return jsonify({
+            'period': period,
+            'cohorts': cohort_retention(period, cohorts)
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to get cohort retention', 'details': str(e)}), 500
+
+@analytics_bp.route('/analytics/revenue', methods=['GET'])
+@token_required
+@admin_required
+def get_revenue_series():
+    """Completed orders, revenue and items per hour, day, week or month from the hourly revenue table"""
+    try:
+        days = request.args.get('days', 30, type=int)
+        granularity = request.args.get('granularity', 'day', type=str)
+        currency = request.args.get('currency', '', type=str)
+
+        if granularity not in GRANULARITIES:
+            return jsonify({'error': f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+        if currency and currency not in [c.value for c in Currency]:
+            return jsonify({'error': 'Invalid currency'}), 400
+
+        try:
+            start_date, end_date = requested_date_range(days)
+        except ValueError:
+            return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+
+        start = datetime.combine(start_date, datetime.min.time())
+        end = datetime.combine(end_date, datetime.min.time())
+        currency = Currency(currency) if currency else None
+        series = revenue_series(start, end, granularity, currency)
+
+        return jsonify({
+            'series': series,
+            'granularity': granularity,
+            'summary': {
+                'orders': sum(period['orders'] for period in series),
+                'revenue': round(sum(period['revenue'] for period in series), 2),
+                'items': sum(period['items'] for period in series)
+            },
+            'date_range': {
+                'start_date': start_date.isoformat(),
+                'end_date': (end_date - timedelta(days=1)).isoformat()
+            }
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to get revenue series', 'details': str(e)}), 500
+
+@analytics_bp.route('/analytics/live', methods=['GET'])
+@token_required
+@admin_required
+def stream_live_metrics():
+    """Server-Sent Events stream of live dashboard deltas (new orders, revenue, events per minute)"""
+    try:
+        if live_metrics.at_capacity():
+            return jsonify({'error': 'Too many live dashboard connections'}), 503, {'Retry-After': '30'}
+
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        # End the stream when the access token expires; the client reconnects with a new one
+        payload = verify_token(request.headers['Authorization'].split(' ')[1])
+        expires_at = payload.get('exp') if payload else None
+
+        return Response(
+            stream_with_context(live_metrics.stream(last_event_id, expires_at)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to open live metrics stream', 'details': str(e)}), 500
+
 @analytics_bp.route('/analytics/reports/export', methods=['POST'])
 @token_required
 @admin_required
 def export_analytics_report():
-    """Export analytics report in various formats"""
+    """Queue a report export; poll the returned job and download its file when completed"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         
         report_type = data.get('report_type', 'dashboard')
-        format_type = data.get('format', 'json')  # json, csv
+        format_type = data.get('format', 'csv')
         days = data.get('days', 30)
         
-        if report_type == 'dashboard':
-            # Get dashboard data
-            dashboard_response = get_dashboard_data()
-            report_data = dashboard_response[0].get_json()
-        elif report_type == 'users':
-            user_response = get_user_analytics()
-            report_data = user_response[0].get_json()
-        elif report_type == 'books':
-            book_response = get_book_analytics()
-            report_data = book_response[0].get_json()
-        elif report_type == 'sales':
-            sales_response = get_sales_analytics()
-            report_data = sales_response[0].get_json()
-        else:
-            return jsonify({'error': 'Invalid report type'}), 400
-        
-        # Add export metadata
-        export_data = {
-            'report_type': report_type,
-            'generated_at': datetime.utcnow().isoformat(),
-            'generated_by': request.current_user.email,
-            'period_days': days,
-            'data': report_data
-        }
-        
-        if format_type == 'json':
-            return jsonify(export_data), 200
-        else:
-            return jsonify({'error': 'Format not supported yet'}), 400
+        if report_type not in REPORTS:
+            return jsonify({'error': 'Invalid report type', 'report_types': list(REPORTS)}), 400
+        if format_type not in REPORT_FORMATS:
+            return jsonify({'error': 'Invalid export format', 'formats': list(REPORT_FORMATS)}), 400
+        if not isinstance(days, int) or days < 1:
+            return jsonify({'error': 'days must be a positive integer'}), 400
+        
+        # Same range semantics as the GET endpoints: end_date inclusive, defaulting to today
+        try:
+            end_date = date.fromisoformat(data['end_date']) + timedelta(days=1) \
+                if data.get('end_date') else datetime.utcnow().date() + timedelta(days=1)
+            start_date = date.fromisoformat(data['start_date']) \
+                if data.get('start_date') else end_date - timedelta(days=days)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+        if start_date >= end_date:
+            return jsonify({'error': 'start_date must not be after end_date'}), 400
+        if (end_date - start_date).days > MAX_REPORT_RANGE_DAYS:
+            return jsonify({'error': f'Date range cannot exceed {MAX_REPORT_RANGE_DAYS} days'}), 400
+        
+        job, created = enqueue_report(
+            report_type, format_type, start_date, end_date, requested_by=request.current_user.id
+        )
+        
+        if created:
+            AuditLog.log_action(
+                user_id=request.current_user.id,
+                action='export_report',
+                resource_type='report_job',
+                new_values={
+                    'job_id': job.job_id,
+                    'report_type': report_type,
+                    'format': format_type,
+                    'start_date': start_date.isoformat(),
+                    'end_date': end_date.isoformat()
+                },
+                ip_address=request.remote_addr,
+                user_agent=request.headers.get('User-Agent')
+            )
+        
+        status_code = 200 if job.status == ReportJobStatus.COMPLETED else 202
+        return jsonify({'job': job.to_dict(), 'cached': not created}), status_code
         
     except Exception as e:
         return jsonify({'error': 'Failed to export report', 'details': str(e)}), 500
 
+@analytics_bp.route('/analytics/reports/<job_id>', methods=['GET'])
+@token_required
+@admin_required
+def get_report_job(job_id):
+    """Status of a report export job"""
+    try:
+        job = ReportJob.query.filter_by(job_id=job_id).first()
+        if not job:
+            return jsonify({'error': 'Report job not found'}), 404
+        
+        return jsonify({'job': job.to_dict()}), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to get report job', 'details': str(e)}), 500
+
+@analytics_bp.route('/analytics/reports/<job_id>/download', methods=['GET'])
+@token_required
+@admin_required
+def download_report(job_id):
+    """Download the file of a completed report export job"""
+    try:
+        job = ReportJob.query.filter_by(job_id=job_id).first()
+        if not job:
+            return jsonify({'error': 'Report job not found'}), 404
+        
+        if job.status != ReportJobStatus.COMPLETED:
+            return jsonify({'error': 'Report is not ready', 'job': job.to_dict()}), 409
+        if not job.file_path or not os.path.exists(job.file_path):
+            return jsonify({'error': 'Report has expired, export it again'}), 410
+        
+        last_day = job.end_date - timedelta(days=1)
+        return send_file(
+            job.file_path,
+            mimetype=REPORT_FORMATS[job.format],
+            as_attachment=True,
+            download_name=f'{job.report_type}_{job.start_date.isoformat()}_{last_day.isoformat()}.{job.format}'
+        )
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to download report', 'details': str(e)}), 500
@@ -1,24 +1,72 @@
 from flask import Blueprint, request, jsonify, current_app
-from werkzeug.security import check_password_hash
 from datetime import datetime, timedelta
 import jwt
 import functools
+import os
+import uuid
 from src.models.user import db, User, UserRole
 from src.models.analytics import AuditLog
+from src.services.principal_cache import principal_cache, Principal, PrincipalRecord
+from src.services.token_revocation import revocation_list
+from src.services.password_hasher import PasswordHashingBusy
+from src.services.rate_limiter import rate_limit
+from src.services.stats import invalidate_stats
 
 auth_bp = Blueprint('auth', __name__)
 
-def generate_token(user):
-    """Generate JWT token for user"""
+# 'stateless' trusts the role in short-lived access tokens and checks only the
+# in-memory revocation list; 'stateful' also reads role/active via the principal cache
+AUTH_MODE = os.getenv('AUTH_MODE', 'stateful')
+
+ACCESS_TOKEN_TTL = timedelta(seconds=int(os.getenv('ACCESS_TOKEN_TTL', 900)))
+STATEFUL_TOKEN_TTL = timedelta(hours=24)
+REFRESH_TOKEN_TTL = timedelta(days=int(os.getenv('REFRESH_TOKEN_TTL_DAYS', 30)))
+
+def access_token_ttl():
+    """Get access token lifetime for the current auth mode"""
+    return ACCESS_TOKEN_TTL if AUTH_MODE == 'stateless' else STATEFUL_TOKEN_TTL
+
+def generate_token(user, session_id=None, version=None):
+    """Generate JWT access token for user"""
     payload = {
         'user_id': user.id,
         'email': user.email,
         'role': user.role.value,
-        'exp': datetime.utcnow() + timedelta(hours=24),  # Token expires in 24 hours
+        'ver': revocation_list.issue_version(user.id) if version is None else version,
+        'sid': session_id,
+        'type': 'access',
+        'exp': datetime.utcnow() + access_token_ttl(),
         'iat': datetime.utcnow()
     }
     return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
 
+def generate_refresh_token(user, session_id=None, version=None):
+    """Generate long-lived JWT refresh token for user"""
+    payload = {
+        'user_id': user.id,
+        'ver': revocation_list.issue_version(user.id) if version is None else version,
+        'sid': session_id,
+        'type': 'refresh',
+        'exp': datetime.utcnow() + REFRESH_TOKEN_TTL,
+        'iat': datetime.utcnow()
+    }
+    return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
+
+def token_response(user):
+    """Get the token fields returned by login and register; starts a new session"""
+    session_id = uuid.uuid4().hex
+    version = revocation_list.issue_version(user.id)
+    return {
+        'token': generate_token(user, session_id, version),
+        'refresh_token': generate_refresh_token(user, session_id, version),
+        'expires_in': int(access_token_ttl().total_seconds())
+    }
+
+def revoke_user_tokens(user_id):
+    """Revoke all of a user's tokens and drop their cached principal"""
+    revocation_list.revoke(user_id)
+    principal_cache.invalidate(user_id)
+
 def verify_token(token):
     """Verify JWT token and return user data"""
     try:
@@ -48,16 +96,24 @@ def token_required(f):
         
         # Verify token
         payload = verify_token(token)
-        if not payload:
+        if not payload or payload.get('type', 'access') != 'access':
             return jsonify({'error': 'Token is invalid or expired'}), 401
         
-        # Get user from database
-        current_user = User.query.get(payload['user_id'])
-        if not current_user or not current_user.is_active:
-            return jsonify({'error': 'User not found or inactive'}), 401
+        if revocation_list.is_revoked(payload['user_id'], payload.get('ver'), payload.get('sid')):
+            return jsonify({'error': 'Token has been revoked'}), 401
+        
+        if AUTH_MODE == 'stateless' and 'ver' in payload:
+            # Role comes from the token; deactivation and role changes revoke it
+            principal = PrincipalRecord(payload['user_id'], payload['email'], UserRole(payload['role']), True, payload['ver'])
+        else:
+            # Get role and active flag from the principal cache; the full user loads lazily
+            principal = principal_cache.get(payload['user_id'])
+            if not principal or not principal.is_active:
+                return jsonify({'error': 'User not found or inactive'}), 401
         
         # Add current_user to request context
-        request.current_user = current_user
+        request.current_user = Principal(principal)
+        request.session_id = payload.get('sid')
         return f(*args, **kwargs)
     
     return decorated
@@ -91,6 +147,7 @@ def editor_or_admin_required(f):
     return decorated
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limit('login')
 def login():
     """User login endpoint"""
     try:
@@ -115,12 +172,16 @@ def login():
         if not user.check_password(password):
             return jsonify({'error': 'Invalid email or password'}), 401
         
+        # Upgrade hashes made with older hash parameters
+        if user.password_needs_rehash():
+            user.set_password(password)
+        
         # Update last login
         user.last_login = datetime.utcnow()
         db.session.commit()
         
-        # Generate token
-        token = generate_token(user)
+        # Generate access and refresh tokens
+        tokens = token_response(user)
         
         # Log the login
         AuditLog.log_action(
@@ -134,14 +195,17 @@ def login():
         
         return jsonify({
             'message': 'Login successful',
-            'token': token,
+            **tokens,
             'user': user.to_dict()
         }), 200
         
+    except PasswordHashingBusy:
+        return jsonify({'error': 'Server is busy, please try again'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': 'Login failed', 'details': str(e)}), 500
 
 @auth_bp.route('/register', methods=['POST'])
+@rate_limit('register')
 def register():
     """User registration endpoint"""
     try:
@@ -177,9 +241,10 @@ def register():
         
         db.session.add(user)
         db.session.commit()
+        invalidate_stats('users')
         
-        # Generate token
-        token = generate_token(user)
+        # Generate access and refresh tokens
+        tokens = token_response(user)
         
         # Log the registration
         AuditLog.log_action(
@@ -193,10 +258,13 @@ def register():
         
         return jsonify({
             'message': 'Registration successful',
-            'token': token,
+            **tokens,
             'user': user.to_dict()
         }), 201
         
+    except PasswordHashingBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Server is busy, please try again'}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Registration failed', 'details': str(e)}), 500
@@ -218,7 +286,7 @@ def update_current_user():
     """Update current user information"""
     try:
         data = request.get_json()
-        user = request.current_user
+        user = request.current_user.user
         
         # Store old values for audit log
         old_values = user.to_dict()
@@ -230,12 +298,18 @@ def update_current_user():
                 setattr(user, field, data[field].strip() if isinstance(data[field], str) else data[field])
         
         # Handle password change
+        password_changed = False
         if 'current_password' in data and 'new_password' in data:
             if not user.check_password(data['current_password']):
                 return jsonify({'error': 'Current password is incorrect'}), 400
             user.set_password(data['new_password'])
+            password_changed = True
         
         db.session.commit()
+        if password_changed:
+            revoke_user_tokens(user.id)
+        else:
+            principal_cache.invalidate(user.id)
         
         # Log the update
         AuditLog.log_action(
@@ -249,11 +323,19 @@ def update_current_user():
             user_agent=request.headers.get('User-Agent')
         )
         
-        return jsonify({
+        response = {
             'message': 'Profile updated successfully',
             'user': user.to_dict()
-        }), 200
+        }
+        if password_changed:
+            # Other sessions were signed out; keep this one going
+            response.update(token_response(user))
         
+        return jsonify(response), 200
+        
+    except PasswordHashingBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Server is busy, please try again'}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to update profile', 'details': str(e)}), 500
@@ -268,15 +350,16 @@ def change_password():
         if not data or not data.get('current_password') or not data.get('new_password'):
             return jsonify({'error': 'Current password and new password are required'}), 400
         
-        user = request.current_user
+        user = request.current_user.user
         
         # Verify current password
         if not user.check_password(data['current_password']):
             return jsonify({'error': 'Current password is incorrect'}), 400
         
-        # Set new password
+        # Set new password and sign out all existing sessions
         user.set_password(data['new_password'])
         db.session.commit()
+        revoke_user_tokens(user.id)
         
         # Log the password change
         AuditLog.log_action(
@@ -288,8 +371,14 @@ def change_password():
             user_agent=request.headers.get('User-Agent')
         )
         
-        return jsonify({'message': 'Password changed successfully'}), 200
+        return jsonify({
+            'message': 'Password changed successfully',
+            **token_response(user)
+        }), 200
         
+    except PasswordHashingBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Server is busy, please try again'}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to change password', 'details': str(e)}), 500
@@ -308,6 +397,9 @@ def verify_user_token():
         if not payload:
             return jsonify({'valid': False, 'error': 'Invalid or expired token'}), 401
         
+        if revocation_list.is_revoked(payload['user_id'], payload.get('ver'), payload.get('sid')):
+            return jsonify({'valid': False, 'error': 'Token has been revoked'}), 401
+        
         # Check if user still exists and is active
         user = User.query.get(payload['user_id'])
         if not user or not user.is_active:
@@ -321,11 +413,60 @@ def verify_user_token():
     except Exception as e:
         return jsonify({'valid': False, 'error': str(e)}), 500
 
+@auth_bp.route('/refresh', methods=['POST'])
+@rate_limit('refresh')
+def refresh_token():
+    """Exchange a refresh token for a new access token"""
+    try:
+        data = request.get_json()
+        token = data.get('refresh_token') if data else None
+        
+        if not token:
+            return jsonify({'error': 'Refresh token is required'}), 400
+        
+        payload = verify_token(token)
+        if not payload or payload.get('type') != 'refresh':
+            return jsonify({'error': 'Refresh token is invalid or expired'}), 401
+        
+        if revocation_list.is_revoked(payload['user_id'], payload.get('ver'), payload.get('sid')):
+            return jsonify({'error': 'Refresh token has been revoked'}), 401
+        
+        # Role and active flag are re-read here, once per access token lifetime
+        user = db.session.get(User, payload['user_id'])
+        if not user or not user.is_active:
+            return jsonify({'error': 'User not found or inactive'}), 401
+        
+        return jsonify({
+            'token': generate_token(user, payload.get('sid')),
+            'expires_in': int(access_token_ttl().total_seconds())
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Token refresh failed', 'details': str(e)}), 500
+
 @auth_bp.route('/logout', methods=['POST'])
 @token_required
 def logout():
-    """User logout endpoint (mainly for logging purposes)"""
+    """User logout endpoint; revokes the tokens of the current session only"""
     try:
+        data = request.get_json(silent=True) or {}
+        session_id = request.session_id
+        expires_at = datetime.utcnow() + REFRESH_TOKEN_TTL
+        
+        # Prefer the session of the presented refresh token so it stops working too
+        refresh_payload = verify_token(data['refresh_token']) if data.get('refresh_token') else None
+        if (refresh_payload and refresh_payload.get('type') == 'refresh'
+                and refresh_payload.get('user_id') == request.current_user.id
+                and refresh_payload.get('sid')):
+            session_id = refresh_payload['sid']
+            expires_at = datetime.utcfromtimestamp(refresh_payload['exp'])
+        
+        if session_id:
+            revocation_list.revoke_session(session_id, request.current_user.id, expires_at)
+        else:
+            # Tokens issued before sessions existed can only be revoked all at once
+            revoke_user_tokens(request.current_user.id)
+        
         # Log the logout
         AuditLog.log_action(
             user_id=request.current_user.id,
@@ -341,3 +482,24 @@ def logout():
     except Exception as e:
         return jsonify({'error': 'Logout failed', 'details': str(e)}), 500
 
+@auth_bp.route('/logout-all', methods=['POST'])
+@token_required
+def logout_all():
+    """Sign the user out on every device; revokes all their access and refresh tokens"""
+    try:
+        revoke_user_tokens(request.current_user.id)
+        
+        AuditLog.log_action(
+            user_id=request.current_user.id,
+            action='logout_all',
+            resource_type='user',
+            resource_id=request.current_user.id,
+            ip_address=request.remote_addr,
+            user_agent=request.headers.get('User-Agent')
+        )
+        
+        return jsonify({'message': 'Logged out on all devices'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Logout failed', 'details': str(e)}), 500
+
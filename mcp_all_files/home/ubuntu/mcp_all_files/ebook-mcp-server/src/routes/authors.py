@@ -4,6 +4,7 @@ from src.models.user import db
 from src.models.book import Author, Book
 from src.models.analytics import AuditLog
 from src.routes.auth import token_required, admin_required, editor_or_admin_required
+from src.services.stats import get_stats, invalidate_stats
 
 authors_bp = Blueprint('authors', __name__)
 
@@ -105,6 +106,7 @@ def create_author():
         
         db.session.add(author)
         db.session.commit()
+        invalidate_stats('authors')
         
         # Log the creation
         AuditLog.log_action(
@@ -155,6 +157,7 @@ def update_author(author_id):
                 return jsonify({'error': 'Author with this name already exists'}), 409
         
         db.session.commit()
+        invalidate_stats('authors')
         
         # Log the update
         AuditLog.log_action(
@@ -197,6 +200,7 @@ def delete_author(author_id):
         
         db.session.delete(author)
         db.session.commit()
+        invalidate_stats('authors')
         
         # Log the deletion
         AuditLog.log_action(
@@ -221,36 +225,7 @@ def delete_author(author_id):
 def get_author_stats():
     """Get author statistics"""
     try:
-        total_authors = Author.query.count()
-        
-        # Authors with books
-        from sqlalchemy import func
-        authors_with_books = db.session.query(Author.id).join(Book).distinct().count()
-        
-        # Top authors by book count
-        top_authors = db.session.query(
-            Author.id,
-            Author.name,
-            func.count(Book.id).label('book_count')
-        ).outerjoin(Book).group_by(Author.id, Author.name).order_by(
-            func.count(Book.id).desc()
-        ).limit(5).all()
-        
-        top_authors_data = [
-            {
-                'id': author.id,
-                'name': author.name,
-                'book_count': author.book_count
-            }
-            for author in top_authors
-        ]
-        
-        return jsonify({
-            'total_authors': total_authors,
-            'authors_with_books': authors_with_books,
-            'authors_without_books': total_authors - authors_with_books,
-            'top_authors': top_authors_data
-        }), 200
+        return jsonify(get_stats('authors')), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to get author stats', 'details': str(e)}), 500
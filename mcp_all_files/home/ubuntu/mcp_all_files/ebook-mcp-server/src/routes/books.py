@@ -1,13 +1,19 @@
 from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
 from sqlalchemy import or_, desc, asc
+from sqlalchemy.orm import selectinload
 import os
 import uuid
 from datetime import datetime
 from src.models.user import db
 from src.models.book import Book, Author, Category, BookStatus
+from src.models.order import Currency
+from src.models.pricing import BookPrice
 from src.models.analytics import AuditLog, AnalyticsEvent, EventType
 from src.routes.auth import token_required, admin_required, editor_or_admin_required
+from src.services.stats import get_stats, invalidate_stats
+from src.services.rate_limiter import rate_limit
+from src.services.trending import trending_tracker, TRENDING_WINDOWS, DEFAULT_TRENDING_WINDOW, TRENDING_MAX_RESULTS
 
 books_bp = Blueprint('books', __name__)
 
@@ -40,6 +46,11 @@ def save_uploaded_file(file, folder='books'):
         return f"/{UPLOAD_FOLDER}/{folder}/{unique_filename}"
     return None
 
+def requested_currency():
+    """Get the ?currency= price list requested, None if absent; raises ValueError if unsupported"""
+    code = request.args.get('currency', '', type=str).strip().upper()
+    return Currency(code) if code else None
+
 @books_bp.route('/books', methods=['GET'])
 def get_books():
     """Get all books with pagination, filtering, and search"""
@@ -55,8 +66,16 @@ def get_books():
         sort_by = request.args.get('sort_by', 'created_at', type=str)
         sort_order = request.args.get('sort_order', 'desc', type=str)
         
+        try:
+            currency = requested_currency()
+        except ValueError:
+            return jsonify({'error': f'Unsupported currency. Use one of: {", ".join(c.value for c in Currency)}'}), 400
+        
         # Build query
         query = Book.query
+        if currency:
+            # Precomputed prices for the whole page in one extra query
+            query = query.options(selectinload(Book.prices))
         
         # Apply search filter
         if search:
@@ -109,7 +128,7 @@ def get_books():
         books = pagination.items
         
         return jsonify({
-            'books': [book.to_dict() for book in books],
+            'books': [book.to_dict(currency=currency) for book in books],
             'pagination': {
                 'page': page,
                 'per_page': per_page,
@@ -123,10 +142,37 @@ def get_books():
     except Exception as e:
         return jsonify({'error': 'Failed to get books', 'details': str(e)}), 500
 
+@books_bp.route('/books/trending', methods=['GET'])
+def get_trending_books():
+    """Get books with the most recent momentum (views, downloads and purchases with time decay)"""
+    try:
+        window = request.args.get('window', DEFAULT_TRENDING_WINDOW, type=str)
+        limit = min(request.args.get('limit', 20, type=int), TRENDING_MAX_RESULTS)
+        
+        if window not in TRENDING_WINDOWS:
+            return jsonify({'error': f'Invalid window. Use one of: {", ".join(TRENDING_WINDOWS)}'}), 400
+        
+        trending_tracker.poll_if_stale()
+        
+        return jsonify({
+            'window': window,
+            'half_life_seconds': TRENDING_WINDOWS[window],
+            'books': trending_tracker.trending(window, limit)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to get trending books', 'details': str(e)}), 500
+
 @books_bp.route('/books/<int:book_id>', methods=['GET'])
+@rate_limit('book_view')
 def get_book(book_id):
     """Get specific book by ID"""
     try:
+        try:
+            currency = requested_currency()
+        except ValueError:
+            return jsonify({'error': f'Unsupported currency. Use one of: {", ".join(c.value for c in Currency)}'}), 400
+        
         book = Book.query.get_or_404(book_id)
         
         # Increment view count
@@ -144,7 +190,7 @@ def get_book(book_id):
             user_agent=request.headers.get('User-Agent')
         )
         
-        return jsonify({'book': book.to_dict(include_analytics=True)}), 200
+        return jsonify({'book': book.to_dict(include_analytics=True, currency=currency)}), 200
     except Exception as e:
         return jsonify({'error': 'Failed to get book', 'details': str(e)}), 500
 
@@ -216,6 +262,10 @@ def create_book():
             book.categories = categories
         
         db.session.commit()
+        invalidate_stats('books', 'categories', 'authors')
+        
+        # Materialize the book's price in every currency
+        BookPrice.recompute([book.id])
         
         # Log the creation
         AuditLog.log_action(
@@ -299,6 +349,10 @@ def update_book(book_id):
             book.published_at = datetime.utcnow()
         
         db.session.commit()
+        invalidate_stats('books', 'categories', 'authors')
+        
+        if any(field in data for field in ('price_usd', 'sale_price_usd', 'is_on_sale')):
+            BookPrice.recompute([book.id])
         
         # Log the update
         AuditLog.log_action(
@@ -334,6 +388,7 @@ def delete_book(book_id):
         
         db.session.delete(book)
         db.session.commit()
+        invalidate_stats('books', 'categories', 'authors')
         
         # Log the deletion
         AuditLog.log_action(
@@ -401,30 +456,7 @@ def upload_book_files():
 def get_book_stats():
     """Get book statistics"""
     try:
-        total_books = Book.query.count()
-        active_books = Book.query.filter_by(status=BookStatus.ACTIVE).count()
-        draft_books = Book.query.filter_by(status=BookStatus.DRAFT).count()
-        featured_books = Book.query.filter_by(is_featured=True).count()
-        bestseller_books = Book.query.filter_by(is_bestseller=True).count()
-        
-        # Average rating
-        from sqlalchemy import func
-        avg_rating = db.session.query(func.avg(Book.rating)).scalar() or 0
-        
-        # Total views and downloads
-        total_views = db.session.query(func.sum(Book.view_count)).scalar() or 0
-        total_downloads = db.session.query(func.sum(Book.download_count)).scalar() or 0
-        
-        return jsonify({
-            'total_books': total_books,
-            'active_books': active_books,
-            'draft_books': draft_books,
-            'featured_books': featured_books,
-            'bestseller_books': bestseller_books,
-            'average_rating': round(float(avg_rating), 2),
-            'total_views': total_views,
-            'total_downloads': total_downloads
-        }), 200
+        return jsonify(get_stats('books')), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to get book stats', 'details': str(e)}), 500
@@ -4,6 +4,7 @@ from src.models.user import db
 from src.models.book import Category, Book, book_categories
 from src.models.analytics import AuditLog
 from src.routes.auth import token_required, admin_required, editor_or_admin_required
+from src.services.stats import get_stats, invalidate_stats
 
 categories_bp = Blueprint('categories', __name__)
 
@@ -136,6 +137,7 @@ def create_category():
         
         db.session.add(category)
         db.session.commit()
+        invalidate_stats('categories')
         
         # Log the creation
         AuditLog.log_action(
@@ -198,6 +200,7 @@ def update_category(category_id):
                 return jsonify({'error': 'Category with this slug already exists'}), 409
         
         db.session.commit()
+        invalidate_stats('categories')
         
         # Log the update
         AuditLog.log_action(
@@ -240,6 +243,7 @@ def delete_category(category_id):
         
         db.session.delete(category)
         db.session.commit()
+        invalidate_stats('categories')
         
         # Log the deletion
         AuditLog.log_action(
@@ -272,6 +276,7 @@ def toggle_category_status(category_id):
         # Toggle status
         category.is_active = not category.is_active
         db.session.commit()
+        invalidate_stats('categories')
         
         # Log the status change
         AuditLog.log_action(
@@ -301,43 +306,7 @@ def toggle_category_status(category_id):
 def get_category_stats():
     """Get category statistics"""
     try:
-        total_categories = Category.query.count()
-        active_categories = Category.query.filter_by(is_active=True).count()
-        inactive_categories = Category.query.filter_by(is_active=False).count()
-        
-        # Categories with books
-        categories_with_books = db.session.query(Category.id).join(
-            book_categories, Category.id == book_categories.c.category_id
-        ).distinct().count()
-        
-        # Top categories by book count
-        top_categories = db.session.query(
-            Category.id,
-            Category.name,
-            func.count(book_categories.c.book_id).label('book_count')
-        ).outerjoin(book_categories).group_by(
-            Category.id, Category.name
-        ).order_by(
-            func.count(book_categories.c.book_id).desc()
-        ).limit(5).all()
-        
-        top_categories_data = [
-            {
-                'id': category.id,
-                'name': category.name,
-                'book_count': category.book_count
-            }
-            for category in top_categories
-        ]
-        
-        return jsonify({
-            'total_categories': total_categories,
-            'active_categories': active_categories,
-            'inactive_categories': inactive_categories,
-            'categories_with_books': categories_with_books,
-            'categories_without_books': total_categories - categories_with_books,
-            'top_categories': top_categories_data
-        }), 200
+        return jsonify(get_stats('categories')), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to get category stats', 'details': str(e)}), 500
@@ -0,0 +1,276 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from sqlalchemy import select, func
+from datetime import datetime, date, timedelta
+import enum
+import csv
+import io
+import json
+from src.models.user import db, User, UserRole
+from src.models.order import Order, OrderItem, Payment, OrderStatus, PaymentStatus, PaymentMethod
+from src.models.analytics import AuditLog
+from src.routes.auth import token_required, admin_required
+
+exports_bp = Blueprint('exports', __name__)
+
+# Rows fetched per round-trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+# Rows buffered before a chunk is flushed to the client
+EXPORT_FLUSH_ROWS = 200
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+def parse_date_range():
+    """Parse start_date/end_date query parameters (ISO format, end date inclusive)"""
+    start_date = request.args.get('start_date', '', type=str)
+    end_date = request.args.get('end_date', '', type=str)
+
+    start = datetime.fromisoformat(start_date) if start_date else None
+    end = None
+    if end_date:
+        end = datetime.fromisoformat(end_date)
+        # A bare date covers the whole day
+        if len(end_date) <= 10:
+            end = end + timedelta(days=1)
+
+    return start, end
+
+def serialize_value(value):
+    """Convert a column value to a plain export value"""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def stream_rows(statement, columns, format_type):
+    """Stream the result of a statement as CSV or NDJSON chunks"""
+    result = db.session.execute(
+        statement.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if format_type == 'csv' else None
+
+    if writer:
+        writer.writerow(columns)
+
+    try:
+        buffered = 0
+        for row in result:
+            values = [serialize_value(value) for value in row]
+            if writer:
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(columns, values))))
+                buffer.write('\n')
+
+            buffered += 1
+            if buffered >= EXPORT_FLUSH_ROWS:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+                buffered = 0
+
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        result.close()
+
+def export_response(statement, columns, resource_type):
+    """Build a streaming export response for the requested format"""
+    format_type = request.args.get('format', 'csv', type=str)
+    if format_type not in EXPORT_FORMATS:
+        return jsonify({'error': 'Invalid export format'}), 400
+
+    # Log the export before streaming starts
+    AuditLog.log_action(
+        user_id=request.current_user.id,
+        action=f'export_{resource_type}',
+        resource_type=resource_type,
+        new_values={'format': format_type, 'filters': request.args.to_dict()},
+        ip_address=request.remote_addr,
+        user_agent=request.headers.get('User-Agent')
+    )
+
+    filename = f"{resource_type}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{format_type}"
+
+    return Response(
+        stream_with_context(stream_rows(statement, columns, format_type)),
+        mimetype=EXPORT_FORMATS[format_type],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@exports_bp.route('/export/orders', methods=['GET'])
+@token_required
+@admin_required
+def export_orders():
+    """Stream all orders matching the filters as CSV or NDJSON"""
+    try:
+        start, end = parse_date_range()
+        status = request.args.get('status', '', type=str)
+        payment_status = request.args.get('payment_status', '', type=str)
+
+        item_count = select(func.count(OrderItem.id)).where(
+            OrderItem.order_id == Order.id
+        ).correlate(Order).scalar_subquery()
+
+        columns = [
+            'id', 'order_number', 'customer_id', 'customer_email', 'customer_name',
+            'billing_country', 'subtotal', 'tax_amount', 'discount_amount', 'total_amount',
+            'currency', 'status', 'payment_status', 'payment_method', 'payment_gateway_id',
+            'payment_gateway_order_id', 'item_count', 'created_at', 'completed_at'
+        ]
+        statement = select(
+            Order.id, Order.order_number, Order.customer_id, Order.customer_email,
+            Order.customer_name, Order.billing_country, Order.subtotal, Order.tax_amount,
+            Order.discount_amount, Order.total_amount, Order.currency, Order.status,
+            Order.payment_status, Order.payment_method, Order.payment_gateway_id,
+            Order.payment_gateway_order_id, item_count, Order.created_at, Order.completed_at
+        )
+
+        # Apply filters
+        if start:
+            statement = statement.where(Order.created_at >= start)
+        if end:
+            statement = statement.where(Order.created_at < end)
+        if status and status in [s.value for s in OrderStatus]:
+            statement = statement.where(Order.status == OrderStatus(status))
+        if payment_status and payment_status in [s.value for s in PaymentStatus]:
+            statement = statement.where(Order.payment_status == PaymentStatus(payment_status))
+
+        statement = statement.order_by(Order.id)
+
+        return export_response(statement, columns, 'orders')
+
+    except ValueError as e:
+        return jsonify({'error': 'Invalid date filter', 'details': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to export orders', 'details': str(e)}), 500
+
+@exports_bp.route('/export/payments', methods=['GET'])
+@token_required
+@admin_required
+def export_payments():
+    """Stream all payments matching the filters as CSV or NDJSON"""
+    try:
+        start, end = parse_date_range()
+        status = request.args.get('status', '', type=str)
+        method = request.args.get('method', '', type=str)
+
+        columns = [
+            'id', 'order_id', 'amount', 'currency', 'payment_method', 'status',
+            'gateway_payment_id', 'gateway_order_id', 'refund_amount', 'refund_reason',
+            'created_at', 'processed_at'
+        ]
+        statement = select(
+            Payment.id, Payment.order_id, Payment.amount, Payment.currency,
+            Payment.payment_method, Payment.status, Payment.gateway_payment_id,
+            Payment.gateway_order_id, Payment.refund_amount, Payment.refund_reason,
+            Payment.created_at, Payment.processed_at
+        )
+
+        # Apply filters
+        if start:
+            statement = statement.where(Payment.created_at >= start)
+        if end:
+            statement = statement.where(Payment.created_at < end)
+        if status and status in [s.value for s in PaymentStatus]:
+            statement = statement.where(Payment.status == PaymentStatus(status))
+        if method and method in [m.value for m in PaymentMethod]:
+            statement = statement.where(Payment.payment_method == PaymentMethod(method))
+
+        statement = statement.order_by(Payment.id)
+
+        return export_response(statement, columns, 'payments')
+
+    except ValueError as e:
+        return jsonify({'error': 'Invalid date filter', 'details': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to export payments', 'details': str(e)}), 500
+
+@exports_bp.route('/export/users', methods=['GET'])
+@token_required
+@admin_required
+def export_users():
+    """Stream all users matching the filters as CSV or NDJSON"""
+    try:
+        start, end = parse_date_range()
+        role = request.args.get('role', '', type=str)
+        status = request.args.get('status', '', type=str)
+
+        columns = [
+            'id', 'email', 'first_name', 'last_name', 'phone', 'city', 'state',
+            'country', 'role', 'is_active', 'email_verified', 'created_at', 'last_login'
+        ]
+        statement = select(
+            User.id, User.email, User.first_name, User.last_name, User.phone, User.city,
+            User.state, User.country, User.role, User.is_active, User.email_verified,
+            User.created_at, User.last_login
+        )
+
+        # Apply filters
+        if start:
+            statement = statement.where(User.created_at >= start)
+        if end:
+            statement = statement.where(User.created_at < end)
+        if role and role in [r.value for r in UserRole]:
+            statement = statement.where(User.role == UserRole(role))
+        if status == 'active':
+            statement = statement.where(User.is_active == True)
+        elif status == 'inactive':
+            statement = statement.where(User.is_active == False)
+
+        statement = statement.order_by(User.id)
+
+        return export_response(statement, columns, 'users')
+
+    except ValueError as e:
+        return jsonify({'error': 'Invalid date filter', 'details': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to export users', 'details': str(e)}), 500
+
+@exports_bp.route('/export/audit-logs', methods=['GET'])
+@token_required
+@admin_required
+def export_audit_logs():
+    """Stream all audit logs matching the filters as CSV or NDJSON"""
+    try:
+        start, end = parse_date_range()
+        action = request.args.get('action', '', type=str)
+        resource_type = request.args.get('resource_type', '', type=str)
+        user_id = request.args.get('user_id', type=int)
+
+        columns = [
+            'id', 'user_id', 'action', 'resource_type', 'resource_id',
+            'old_values', 'new_values', 'ip_address', 'user_agent', 'created_at'
+        ]
+        statement = select(
+            AuditLog.id, AuditLog.user_id, AuditLog.action, AuditLog.resource_type,
+            AuditLog.resource_id, AuditLog.old_values, AuditLog.new_values,
+            AuditLog.ip_address, AuditLog.user_agent, AuditLog.created_at
+        )
+
+        # Apply filters
+        if start:
+            statement = statement.where(AuditLog.created_at >= start)
+        if end:
+            statement = statement.where(AuditLog.created_at < end)
+        if action:
+            statement = statement.where(AuditLog.action == action)
+        if resource_type:
+            statement = statement.where(AuditLog.resource_type == resource_type)
+        if user_id:
+            statement = statement.where(AuditLog.user_id == user_id)
+
+        statement = statement.order_by(AuditLog.id)
+
+        return export_response(statement, columns, 'audit_logs')
+
+    except ValueError as e:
+        return jsonify({'error': 'Invalid date filter', 'details': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to export audit logs', 'details': str(e)}), 500
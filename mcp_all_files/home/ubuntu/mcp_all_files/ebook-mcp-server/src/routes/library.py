@@ -0,0 +1,42 @@
+from flask import Blueprint, request, jsonify
+from sqlalchemy import desc
+from src.models.user import db
+from src.models.book import Book
+from src.models.order import Entitlement
+from src.routes.auth import token_required
+
+library_bp = Blueprint('library', __name__)
+
+@library_bp.route('/library', methods=['GET'])
+@token_required
+def get_library():
+    """Get current user's purchased books with remaining downloads"""
+    try:
+        # Single indexed lookup on (user_id, book_id)
+        rows = db.session.query(
+            Entitlement,
+            Book.title,
+            Book.slug,
+            Book.cover_image_url
+        ).outerjoin(Book, Book.id == Entitlement.book_id).filter(
+            Entitlement.user_id == request.current_user.id
+        ).order_by(desc(Entitlement.created_at)).all()
+
+        library = []
+        for entitlement, title, slug, cover_image_url in rows:
+            entry = entitlement.to_dict()
+            entry['book'] = {
+                'id': entitlement.book_id,
+                'title': title or entitlement.book_title,
+                'slug': slug,
+                'cover_image_url': cover_image_url
+            } if slug else None
+            library.append(entry)
+
+        return jsonify({
+            'library': library,
+            'total': len(library)
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to get library', 'details': str(e)}), 500
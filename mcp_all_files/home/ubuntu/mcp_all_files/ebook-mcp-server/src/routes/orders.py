@@ -5,9 +5,10 @@ import uuid
 import json
 from src.models.user import db, User
 from src.models.book import Book
-from src.models.order import Order, OrderItem, Payment, OrderStatus, PaymentStatus, PaymentMethod, Currency
+from src.models.order import Order, OrderItem, Payment, Entitlement, OrderStatus, PaymentStatus, PaymentMethod, Currency
 from src.models.analytics import AuditLog, AnalyticsEvent, EventType
 from src.routes.auth import token_required, admin_required
+from src.services.stats import get_stats, invalidate_stats
 
 orders_bp = Blueprint('orders', __name__)
 
@@ -115,8 +116,14 @@ def create_order():
             if book.status.value != 'active':
                 return jsonify({'error': f'Book "{book.title}" is not available for purchase'}), 400
             
-            # Use current price (sale price if on sale)
-            unit_price = book.current_price
+            # Use current price (sale price if on sale) from the order currency's price list
+            price = book.price_in(order.currency)
+            if price:
+                unit_price = price.current_price
+            elif order.currency == Currency.USD:
+                unit_price = book.current_price
+            else:
+                return jsonify({'error': f'Book "{book.title}" has no {order.currency.value} price'}), 400
             total_price = unit_price * quantity
             total_amount += total_price
             
@@ -137,6 +144,7 @@ def create_order():
         order.total_amount = total_amount  # No tax or discount for now
         
         db.session.commit()
+        invalidate_stats('orders')
         
         # Log the order creation
         AuditLog.log_action(
@@ -206,6 +214,7 @@ def process_payment():
         order.mark_as_completed()
         
         db.session.commit()
+        invalidate_stats('orders')
         
         # Log analytics event
         AnalyticsEvent.log_event(
@@ -255,8 +264,13 @@ def download_book(order_id, item_id):
         # Get order item
         order_item = OrderItem.query.filter_by(id=item_id, order_id=order.id).first_or_404()
         
-        # Check if download is allowed
-        if not order_item.can_download():
+        # Get book file URL
+        book = order_item.book
+        if not book or not book.file_url:
+            return jsonify({'error': 'Book file not available'}), 404
+        
+        # Consume one download; limit and expiry are enforced atomically
+        if not OrderItem.consume_download(order_item.id):
             return jsonify({
                 'error': 'Download limit exceeded or expired',
                 'download_count': order_item.download_count,
@@ -264,14 +278,10 @@ def download_book(order_id, item_id):
                 'expires_at': order_item.download_expires_at.isoformat() if order_item.download_expires_at else None
             }), 403
         
-        # Record download
-        if not order_item.record_download():
-            return jsonify({'error': 'Failed to record download'}), 500
-        
-        # Get book file URL
-        book = order_item.book
-        if not book or not book.file_url:
-            return jsonify({'error': 'Book file not available'}), 404
+        # Move the library entry on to another purchase once this one is used up
+        if order_item.download_count >= order_item.download_limit:
+            Entitlement.sync(order.customer_id, [order_item.book_id])
+            db.session.commit()
         
         # Log analytics event
         AnalyticsEvent.log_event(
@@ -381,7 +391,11 @@ def update_order_status(order_id):
             not order.completed_at):
             order.completed_at = datetime.utcnow()
         
+        # Status changes grant or revoke library entitlements
+        Entitlement.sync_order(order)
+        
         db.session.commit()
+        invalidate_stats('orders')
         
         # Log the update
         AuditLog.log_action(
@@ -410,42 +424,7 @@ def update_order_status(order_id):
 def get_order_stats():
     """Get order statistics (admin only)"""
     try:
-        from sqlalchemy import func
-        
-        # Basic counts
-        total_orders = Order.query.count()
-        completed_orders = Order.query.filter_by(status=OrderStatus.COMPLETED).count()
-        pending_orders = Order.query.filter_by(status=OrderStatus.PENDING).count()
-        failed_orders = Order.query.filter_by(status=OrderStatus.FAILED).count()
-        
-        # Revenue calculations
-        total_revenue = db.session.query(func.sum(Order.total_amount)).filter(
-            Order.payment_status == PaymentStatus.COMPLETED
-        ).scalar() or 0
-        
-        # Recent orders (last 30 days)
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        recent_orders = Order.query.filter(Order.created_at >= thirty_days_ago).count()
-        recent_revenue = db.session.query(func.sum(Order.total_amount)).filter(
-            Order.created_at >= thirty_days_ago,
-            Order.payment_status == PaymentStatus.COMPLETED
-        ).scalar() or 0
-        
-        # Average order value
-        avg_order_value = db.session.query(func.avg(Order.total_amount)).filter(
-            Order.payment_status == PaymentStatus.COMPLETED
-        ).scalar() or 0
-        
-        return jsonify({
-            'total_orders': total_orders,
-            'completed_orders': completed_orders,
-            'pending_orders': pending_orders,
-            'failed_orders': failed_orders,
-            'total_revenue': round(float(total_revenue), 2),
-            'recent_orders': recent_orders,
-            'recent_revenue': round(float(recent_revenue), 2),
-            'average_order_value': round(float(avg_order_value), 2)
-        }), 200
+        return jsonify(get_stats('orders')), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to get order stats', 'details': str(e)}), 500
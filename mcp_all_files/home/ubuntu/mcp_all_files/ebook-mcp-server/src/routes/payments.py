@@ -5,8 +5,13 @@ import hashlib
 from datetime import datetime
 from src.models.user import db
 from src.models.order import Order, Payment, PaymentStatus, PaymentMethod
+from src.models.pricing import to_minor_units
 from src.models.analytics import SystemSetting, AuditLog, AnalyticsEvent, EventType
 from src.routes.auth import token_required
+from src.services.webhook_inbox import store_webhook_event
+from src.services.payment_gateway import get_gateway_client, GatewayError, GatewayUnavailable
+from src.services.rate_limiter import rate_limit
+from src.services.stats import invalidate_stats
 
 payments_bp = Blueprint('payments', __name__)
 
@@ -61,7 +66,7 @@ def create_razorpay_order():
         
         # Create Razorpay order data
         razorpay_order_data = {
-            'amount': int(order.total_amount * 100),  # Amount in paise
+            'amount': to_minor_units(order.total_amount),  # Amount in paise/cents
             'currency': order.currency.value,
             'receipt': order.order_number,
             'notes': {
@@ -71,17 +76,26 @@ def create_razorpay_order():
             }
         }
         
-        # In a real implementation, you would call Razorpay API here
-        # For now, we'll simulate the response
-        mock_razorpay_order_id = f"order_{order.order_number}_{int(datetime.utcnow().timestamp())}"
+        # Create the order at the gateway; simulate it when no secret is configured
+        client = get_gateway_client()
+        if client:
+            try:
+                gateway_order = client.create_order(**razorpay_order_data)
+            except GatewayUnavailable as e:
+                return jsonify({'error': 'Payment gateway unavailable', 'details': str(e)}), 503
+            except GatewayError as e:
+                return jsonify({'error': 'Payment gateway rejected the order', 'details': str(e)}), 502
+            razorpay_order_id = gateway_order['id']
+        else:
+            razorpay_order_id = f"order_{order.order_number}_{int(datetime.utcnow().timestamp())}"
         
         # Update order with Razorpay order ID
-        order.payment_gateway_order_id = mock_razorpay_order_id
+        order.payment_gateway_order_id = razorpay_order_id
         order.payment_status = PaymentStatus.PROCESSING
         db.session.commit()
         
         return jsonify({
-            'razorpay_order_id': mock_razorpay_order_id,
+            'razorpay_order_id': razorpay_order_id,
             'razorpay_key_id': razorpay_key_id,
             'amount': razorpay_order_data['amount'],
             'currency': razorpay_order_data['currency'],
@@ -142,6 +156,7 @@ def verify_razorpay_payment():
         order.mark_as_completed()
         
         db.session.commit()
+        invalidate_stats('orders')
         
         # Log analytics event
         AnalyticsEvent.log_event(
@@ -174,76 +189,25 @@ def verify_razorpay_payment():
         return jsonify({'error': 'Failed to verify payment', 'details': str(e)}), 500
 
 @payments_bp.route('/payments/webhook/razorpay', methods=['POST'])
+@rate_limit('razorpay_webhook')
 def razorpay_webhook():
-    """Handle Razorpay webhooks"""
+    """Receive Razorpay webhooks into the inbox; processing happens in the background"""
     try:
-        data = request.get_json()
+        raw_body = request.get_data(as_text=True)
+        data = request.get_json(silent=True)
         
         if not data or not data.get('event'):
             return jsonify({'error': 'Invalid webhook data'}), 400
         
-        event = data['event']
-        payload = data.get('payload', {})
-        
-        # Handle different webhook events
-        if event == 'payment.captured':
-            payment_entity = payload.get('payment', {}).get('entity', {})
-            order_id = payment_entity.get('order_id')
-            payment_id = payment_entity.get('id')
-            
-            if order_id and payment_id:
-                # Find order by Razorpay order ID
-                order = Order.query.filter_by(payment_gateway_order_id=order_id).first()
-                
-                if order and order.payment_status != PaymentStatus.COMPLETED:
-                    # Update order status
-                    order.payment_status = PaymentStatus.COMPLETED
-                    order.payment_gateway_id = payment_id
-                    order.mark_as_completed()
-                    
-                    # Create payment record if not exists
-                    existing_payment = Payment.query.filter_by(
-                        order_id=order.id,
-                        gateway_payment_id=payment_id
-                    ).first()
-                    
-                    if not existing_payment:
-                        payment = Payment(
-                            order_id=order.id,
-                            amount=order.total_amount,
-                            currency=order.currency,
-                            payment_method=PaymentMethod.RAZORPAY,
-                            gateway_payment_id=payment_id,
-                            gateway_order_id=order_id,
-                            gateway_response=json.dumps(payload),
-                            status=PaymentStatus.COMPLETED,
-                            processed_at=datetime.utcnow()
-                        )
-                        db.session.add(payment)
-                    
-                    db.session.commit()
-                    
-                    # Log analytics event
-                    AnalyticsEvent.log_event(
-                        event_type=EventType.PURCHASE,
-                        user_id=order.customer_id,
-                        order_id=order.id
-                    )
-        
-        elif event == 'payment.failed':
-            payment_entity = payload.get('payment', {}).get('entity', {})
-            order_id = payment_entity.get('order_id')
-            
-            if order_id:
-                order = Order.query.filter_by(payment_gateway_order_id=order_id).first()
-                if order:
-                    order.payment_status = PaymentStatus.FAILED
-                    order.status = OrderStatus.FAILED
-                    db.session.commit()
-        
-        return jsonify({'status': 'success'}), 200
+        # Razorpay sends a unique id per event; retries reuse it
+        event_id = request.headers.get('X-Razorpay-Event-Id') or hashlib.sha256(raw_body.encode('utf-8')).hexdigest()
+        
+        _, created = store_webhook_event('razorpay', event_id, data['event'], raw_body)
+        
+        return jsonify({'status': 'received' if created else 'duplicate'}), 200
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': 'Webhook processing failed', 'details': str(e)}), 500
 
 @payments_bp.route('/payments/methods', methods=['GET'])
@@ -0,0 +1,99 @@
+import threading
+import time
+
+class TTLCache:
+    """Small thread-safe in-process cache with per-entry expiry and request coalescing.
+
+    Concurrent misses for the same key are coalesced: the first caller computes
+    the value while the others wait for its result instead of recomputing it.
+    """
+
+    def __init__(self, ttl=15, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}  # key -> (expires_at, value)
+        self._inflight = {}  # key -> _Flight
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get cached value if present and not expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Store value for key"""
+        with self._lock:
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                self._evict_expired()
+                if len(self._entries) >= self.max_entries:
+                    # Drop the entry closest to expiry
+                    oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                    del self._entries[oldest]
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """Return cached value or compute it once for all concurrent callers"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+
+        if not leader:
+            return flight.wait()
+
+        try:
+            value = compute()
+        except Exception as e:
+            flight.fail(e)
+            raise
+        else:
+            self.set(key, value, ttl)
+            flight.resolve(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when key is None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+
+class _Flight:
+    """Result handle shared by callers waiting on the same computation"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._value = None
+        self._error = None
+
+    def resolve(self, value):
+        self._value = value
+        self._event.set()
+
+    def fail(self, error):
+        self._error = error
+        self._event.set()
+
+    def wait(self):
+        self._event.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
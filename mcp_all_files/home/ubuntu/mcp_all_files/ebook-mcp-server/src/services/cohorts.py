@@ -0,0 +1,186 @@
+from sqlalchemy import select
+from datetime import datetime, date, timedelta
+import threading
+import time
+import numpy as np
+from src.models.user import db, User
+from src.models.order import Order, PaymentStatus
+from src.services.metrics import metrics
+
+PERIODS = ('week', 'month')
+
+# Cached tables pick up new users and orders at most this often
+COHORT_REFRESH_SECONDS = 60
+
+# 1970-01-01 was a Thursday; weeks start on Monday 1970-01-05
+_WEEK_OFFSET_DAYS = 4
+
+_EPOCH = date(1970, 1, 1)
+
+def period_index(timestamps, period):
+    """Integer period number of each datetime64 value: weeks or months since the epoch"""
+    if period == 'month':
+        return timestamps.astype('datetime64[M]').astype(np.int64)
+    return (timestamps.astype('datetime64[D]').astype(np.int64) - _WEEK_OFFSET_DAYS) // 7
+
+def period_start(index, period):
+    """First day of a period number"""
+    if period == 'month':
+        return date(1970 + index // 12, index % 12 + 1, 1)
+    return _EPOCH + timedelta(days=_WEEK_OFFSET_DAYS + 7 * index)
+
+def _datetimes(values):
+    return np.array(values, dtype='datetime64[us]')
+
+class CohortTable:
+    """Signup cohorts and their ordering customers per period, refreshed incrementally.
+
+    Holds every user's signup period as compact arrays and, per order
+    period, the sorted ids of customers with a completed order placed in
+    it. A refresh only appends users registered since the last one and
+    reloads the periods whose orders changed (plus the current period), so
+    closed periods are read from the database once. The retention matrix
+    is assembled from these arrays with a single bincount.
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.user_ids = np.empty(0, dtype=np.int64)  # Ascending
+        self.signup_periods = np.empty(0, dtype=np.int32)
+        self.columns = {}  # order period -> sorted customer ids
+        self.refreshed_at = None  # Order changes after this are not loaded yet
+        self.last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def _load_new_users(self):
+        last_user_id = int(self.user_ids[-1]) if len(self.user_ids) else 0
+        rows = db.session.execute(
+            select(User.id, User.created_at).where(User.id > last_user_id).order_by(User.id)
+        ).all()
+        if rows:
+            self.user_ids = np.concatenate([self.user_ids, np.array([row.id for row in rows], dtype=np.int64)])
+            self.signup_periods = np.concatenate([
+                self.signup_periods,
+                period_index(_datetimes([row.created_at for row in rows]), self.period).astype(np.int32)
+            ])
+        return len(rows)
+
+    def _load_all_orders(self):
+        rows = db.session.execute(select(Order.customer_id, Order.created_at).where(
+            Order.payment_status == PaymentStatus.COMPLETED
+        )).all()
+        self.columns = {}
+        if not rows:
+            return
+        customers = np.array([row.customer_id for row in rows], dtype=np.int64)
+        periods = period_index(_datetimes([row.created_at for row in rows]), self.period)
+
+        # Distinct (period, customer) pairs sorted by period, then split into one column per period
+        pairs = np.unique((periods << 32) | customers)
+        pair_periods, pair_customers = pairs >> 32, pairs & 0xFFFFFFFF
+        values, starts = np.unique(pair_periods, return_index=True)
+        for value, chunk in zip(values, np.split(pair_customers, starts[1:])):
+            self.columns[int(value)] = chunk
+
+    def _load_column(self, index):
+        start = datetime.combine(period_start(index, self.period), datetime.min.time())
+        end = datetime.combine(period_start(index + 1, self.period), datetime.min.time())
+        customers = db.session.execute(select(Order.customer_id).distinct().where(
+            Order.payment_status == PaymentStatus.COMPLETED,
+            Order.created_at >= start,
+            Order.created_at < end
+        )).scalars().all()
+        return np.unique(np.array(customers, dtype=np.int64))
+
+    def _dirty_periods(self, since):
+        """Periods of orders paid, refunded or cancelled since the last refresh"""
+        created = db.session.execute(
+            select(Order.created_at).where(Order.updated_at >= since)
+        ).scalars().all()
+        return {int(value) for value in np.unique(period_index(_datetimes(created), self.period))} if created else set()
+
+    def refresh(self):
+        """Load users and orders changed since the last refresh; returns periods reloaded"""
+        with self._lock:
+            now = datetime.utcnow()
+            self._load_new_users()
+            if self.refreshed_at is None:
+                self._load_all_orders()
+                reloaded = len(self.columns)
+            else:
+                current = int(period_index(_datetimes([now]), self.period)[0])
+                dirty = self._dirty_periods(self.refreshed_at) | {current}
+                for index in dirty:
+                    column = self._load_column(index)
+                    if len(column):
+                        self.columns[index] = column
+                    else:
+                        self.columns.pop(index, None)
+                reloaded = len(dirty)
+            self.refreshed_at = now
+            self.last_refresh = time.monotonic()
+
+        metrics.increment(f'cohorts.{self.period}.periods_reloaded', reloaded)
+        return reloaded
+
+    def refresh_if_stale(self):
+        if time.monotonic() - self.last_refresh > COHORT_REFRESH_SECONDS:
+            self.refresh()
+
+    def retention(self, cohorts):
+        """Cohort sizes and active customers for the last `cohorts` signup periods.
+
+        Returns (first period, sizes, active) where active[i, k] is the number
+        of customers from cohort i with a completed order k periods after
+        signing up.
+        """
+        with self._lock:
+            user_ids, signup_periods = self.user_ids, self.signup_periods
+            columns = list(self.columns.items())
+
+        current = int(period_index(_datetimes([datetime.utcnow()]), self.period)[0])
+        first = current - cohorts + 1
+
+        in_range = signup_periods >= first
+        sizes = np.bincount(signup_periods[in_range] - first, minlength=cohorts)[:cohorts]
+
+        active = np.zeros((cohorts, cohorts), dtype=np.int64)
+        columns = [(index, customers) for index, customers in columns if index >= first]
+        if columns and len(user_ids):
+            customers = np.concatenate([customers for _, customers in columns])
+            order_periods = np.concatenate([np.full(len(customers), index) for index, customers in columns])
+
+            # Signup period of each ordering customer (customers without a user row are dropped)
+            position = np.minimum(np.searchsorted(user_ids, customers), len(user_ids) - 1)
+            known = user_ids[position] == customers
+            cohort = signup_periods[position[known]].astype(np.int64) - first
+            offset = order_periods[known] - cohort - first
+            valid = (cohort >= 0) & (offset >= 0) & (offset < cohorts)
+            active = np.bincount(
+                cohort[valid] * cohorts + offset[valid], minlength=cohorts * cohorts
+            ).reshape(cohorts, cohorts)
+
+        return first, sizes, active
+
+_tables = {period: CohortTable(period) for period in PERIODS}
+
+def cohort_retention(period='month', cohorts=12):
+    """Retention table for the last `cohorts` signup periods (weeks or months)"""
+    if period not in PERIODS:
+        raise ValueError(f'period must be one of {", ".join(PERIODS)}')
+    table = _tables[period]
+    table.refresh_if_stale()
+    first, sizes, active = table.retention(cohorts)
+
+    rows = []
+    for i in range(cohorts):
+        # Only periods that have started so far
+        elapsed = cohorts - i
+        size = int(sizes[i])
+        rows.append({
+            'cohort': period_start(first + i, period).isoformat(),
+            'size': size,
+            'active': [int(value) for value in active[i, :elapsed]],
+            'retention': [round(int(value) / size * 100, 2) if size else 0.0 for value in active[i, :elapsed]]
+        })
+    return rows
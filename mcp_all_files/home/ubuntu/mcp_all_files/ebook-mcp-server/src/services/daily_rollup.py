@@ -0,0 +1,267 @@
+from sqlalchemy import select, func, distinct, literal, cast, String
+from datetime import datetime, date, timedelta
+import logging
+from src.models.user import db, User
+from src.models.order import Order, OrderItem, PaymentStatus
+from src.models.pricing import usd_amount
+from src.models.analytics import AnalyticsEvent, DailySummary, RollupState, EventType, dialect_insert
+from src.services.scheduler import job_lock
+from src.services.unique_counts import build_day_sketches
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_NAME = 'daily_summaries'
+
+# Set by the event archiver; last_run_at is the end of the newest archived day
+ARCHIVE_STATE_NAME = 'analytics_events_archive'
+
+# Summary fields computed from analytics_events, kept as-is once a day's events are archived
+EVENT_FIELDS = ('active_users', 'unique_visitors', 'page_views', 'book_views', 'top_search_query')
+
+# Days aggregated per set of GROUP BY queries
+ROLLUP_CHUNK_DAYS = 31
+
+def _day(value):
+    """Normalize a func.date() result (string on SQLite) to a date"""
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def _day_start(day):
+    return datetime.combine(day, datetime.min.time())
+
+def _daterange(start, end):
+    day = start
+    while day < end:
+        yield day
+        day += timedelta(days=1)
+
+def _earliest_day():
+    candidates = [
+        db.session.execute(select(func.min(User.created_at))).scalar(),
+        db.session.execute(select(func.min(Order.created_at))).scalar(),
+        db.session.execute(select(func.min(AnalyticsEvent.created_at))).scalar()
+    ]
+    candidates = [value for value in candidates if value is not None]
+    return min(candidates).date() if candidates else None
+
+def dirty_days(state, today, max_event_id):
+    """Days before today whose summary must be (re)computed"""
+    if state is None or state.last_run_at is None:
+        earliest = _earliest_day()
+        return set(_daterange(earliest, today)) if earliest else set()
+
+    # Everything since the last run, including the rest of that day
+    days = set(_daterange(state.last_run_at.date(), today))
+
+    # Late events: new ids whose created_at falls on an already rolled-up day
+    days.update(_day(value) for value in db.session.execute(
+        select(func.date(AnalyticsEvent.created_at)).distinct().where(
+            AnalyticsEvent.id > state.last_event_id,
+            AnalyticsEvent.id <= max_event_id
+        )
+    ).scalars())
+
+    # Orders paid, refunded or cancelled since the last run count on their revenue day
+    days.update(_day(value) for value in db.session.execute(
+        select(func.date(Order.revenue_at)).distinct().where(Order.updated_at >= state.last_run_at)
+    ).scalars())
+
+    return {day for day in days if day < today}
+
+def compute_summaries(days):
+    """Aggregate metrics for the given days with one GROUP BY query per metric"""
+    start = _day_start(min(days))
+    end = _day_start(max(days) + timedelta(days=1))
+    results = {day: {
+        'new_users': 0, 'active_users': 0, 'total_users': 0,
+        'page_views': 0, 'unique_visitors': 0, 'book_views': 0,
+        'orders_count': 0, 'revenue_usd': 0.0, 'books_sold': 0,
+        'top_book_id': None, 'top_search_query': None
+    } for day in days}
+
+    def rows(query):
+        for row in db.session.execute(query):
+            day = _day(row[0])
+            if day in results:
+                yield day, row
+
+    # Users
+    user_day = func.date(User.created_at)
+    new_by_day = {
+        _day(row[0]): row[1]
+        for row in db.session.execute(select(user_day, func.count(User.id)).where(
+            User.created_at >= start, User.created_at < end
+        ).group_by(user_day))
+    }
+    running_total = db.session.execute(select(func.count(User.id)).where(User.created_at < start)).scalar()
+    for day in _daterange(min(days), max(days) + timedelta(days=1)):
+        running_total += new_by_day.get(day, 0)
+        if day in results:
+            results[day]['new_users'] = new_by_day.get(day, 0)
+            results[day]['total_users'] = running_total
+
+    # Traffic
+    event_day = func.date(AnalyticsEvent.created_at)
+    visitor = func.coalesce(
+        literal('u:') + cast(AnalyticsEvent.user_id, String),
+        literal('s:') + AnalyticsEvent.session_id,
+        literal('ip:') + AnalyticsEvent.ip_address
+    )
+    event_range = (AnalyticsEvent.created_at >= start, AnalyticsEvent.created_at < end)
+    for day, row in rows(select(
+        event_day,
+        func.count(distinct(AnalyticsEvent.user_id)),
+        func.count(distinct(visitor))
+    ).where(*event_range).group_by(event_day)):
+        results[day]['active_users'] = row[1]
+        results[day]['unique_visitors'] = row[2]
+
+    for day, row in rows(select(event_day, AnalyticsEvent.event_type, func.count(AnalyticsEvent.id)).where(
+        *event_range,
+        AnalyticsEvent.event_type.in_([EventType.PAGE_VIEW, EventType.BOOK_VIEW])
+    ).group_by(event_day, AnalyticsEvent.event_type)):
+        key = 'page_views' if row[1] == EventType.PAGE_VIEW else 'book_views'
+        results[day][key] = row[2]
+
+    search_counts = {}
+    for day, row in rows(select(event_day, AnalyticsEvent.search_query, func.count(AnalyticsEvent.id)).where(
+        *event_range,
+        AnalyticsEvent.event_type == EventType.SEARCH,
+        AnalyticsEvent.search_query.isnot(None)
+    ).group_by(event_day, AnalyticsEvent.search_query)):
+        if row[2] > search_counts.get(day, 0):
+            search_counts[day] = row[2]
+            results[day]['top_search_query'] = row[1]
+
+    view_counts = {}
+    top_viewed = {}
+    for day, row in rows(select(event_day, AnalyticsEvent.book_id, func.count(AnalyticsEvent.id)).where(
+        *event_range,
+        AnalyticsEvent.event_type == EventType.BOOK_VIEW,
+        AnalyticsEvent.book_id.isnot(None)
+    ).group_by(event_day, AnalyticsEvent.book_id)):
+        if row[2] > view_counts.get(day, 0):
+            view_counts[day] = row[2]
+            top_viewed[day] = row[1]
+
+    # Sales (completed payments in USD, counted on the day they completed like RevenueHour)
+    order_day = func.date(Order.revenue_at)
+    order_range = (Order.revenue_at >= start, Order.revenue_at < end,
+                   Order.payment_status == PaymentStatus.COMPLETED)
+    revenue_usd = func.sum(usd_amount(Order.total_amount, Order.currency))
+    for day, row in rows(select(order_day, func.count(Order.id), revenue_usd).where(
+        *order_range
+    ).group_by(order_day)):
+        results[day]['orders_count'] = row[1]
+        results[day]['revenue_usd'] = round(float(row[2] or 0), 2)
+
+    sales_counts = {}
+    for day, row in rows(select(order_day, OrderItem.book_id, func.sum(OrderItem.quantity)).join(
+        Order, OrderItem.order_id == Order.id
+    ).where(*order_range).group_by(order_day, OrderItem.book_id)):
+        results[day]['books_sold'] += row[2] or 0
+        if (row[2] or 0) > sales_counts.get(day, 0):
+            sales_counts[day] = row[2]
+            results[day]['top_book_id'] = row[1]
+
+    # Most sold book, or the most viewed one on days without sales
+    for day, values in results.items():
+        if values['top_book_id'] is None:
+            values['top_book_id'] = top_viewed.get(day)
+
+    return results
+
+def _upsert_summaries(rows, keep_event_fields):
+    """Insert or overwrite DailySummary rows by date in one statement"""
+    statement = dialect_insert(DailySummary.__table__).values(rows)
+    columns = DailySummary.__table__.c
+    update = {name: statement.excluded[name] for name in rows[0] if name != 'date'}
+    if keep_event_fields:
+        # Raw events for archived days are gone; keep what was rolled up from them
+        for name in EVENT_FIELDS:
+            update.pop(name)
+        update['top_book_id'] = func.coalesce(statement.excluded.top_book_id, columns.top_book_id)
+    db.session.execute(statement.on_conflict_do_update(index_elements=['date'], set_=update))
+
+def rollup_daily_summaries(full=False, wait=False):
+    """Fill and update DailySummary rows for days with new data.
+
+    Days before today are rolled up; today is always read from the raw
+    tables. Late events are found by event id, late order changes by
+    updated_at. One process rolls up at a time: without `wait`, a call
+    while another rollup runs returns 0. Returns the number of days written.
+    """
+    with job_lock(ROLLUP_NAME, blocking=wait) as locked:
+        if not locked:
+            return 0
+        return _rollup_daily_summaries(full)
+
+def _rollup_daily_summaries(full):
+    now = datetime.utcnow()
+    today = now.date()
+    max_event_id = db.session.execute(select(func.max(AnalyticsEvent.id))).scalar() or 0
+
+    state = db.session.get(RollupState, ROLLUP_NAME)
+    days = sorted(dirty_days(None if full else state, today, max_event_id))
+    archive_state = db.session.get(RollupState, ARCHIVE_STATE_NAME)
+    archived_until = archive_state.last_run_at.date() if archive_state and archive_state.last_run_at else None
+
+    for offset in range(0, len(days), ROLLUP_CHUNK_DAYS):
+        chunk = days[offset:offset + ROLLUP_CHUNK_DAYS]
+        computed = compute_summaries(chunk)
+        written_at = datetime.utcnow()
+        rows = {False: [], True: []}
+        for day in chunk:
+            archived = archived_until is not None and day < archived_until
+            rows[archived].append({'date': day, **computed[day], 'updated_at': written_at})
+        for archived, day_rows in rows.items():
+            if day_rows:
+                _upsert_summaries(day_rows, keep_event_fields=archived)
+        db.session.commit()
+
+        # Distinct-count sketches need raw events, which archived days no longer have
+        build_day_sketches([day for day in chunk if archived_until is None or day >= archived_until])
+
+    if state is None:
+        state = RollupState(name=ROLLUP_NAME)
+        db.session.add(state)
+    state.last_event_id = max_event_id
+    state.last_run_at = now
+    db.session.commit()
+
+    metrics.increment('daily_rollup.days_written', len(days))
+    metrics.set_gauge('daily_rollup.last_run_at', now.isoformat())
+    if days:
+        logger.info('Rolled up %d days (%s to %s)', len(days), days[0], days[-1])
+    return len(days)
+
+def ensure_rollup_current():
+    """Roll up synchronously if yesterday has not been summarized yet (background work only)"""
+    state = db.session.get(RollupState, ROLLUP_NAME)
+    if state is None or state.last_run_at is None or state.last_run_at.date() < datetime.utcnow().date():
+        rollup_daily_summaries()
+
+def summaries_between(start_date, end_date):
+    """DailySummary rows with start_date <= date < end_date, oldest first"""
+    return DailySummary.query.filter(
+        DailySummary.date >= start_date,
+        DailySummary.date < end_date
+    ).order_by(DailySummary.date).all()
+
+def today_sales():
+    """Orders and USD revenue completed today, from the raw tables"""
+    today_start = _day_start(datetime.utcnow().date())
+    orders, revenue = db.session.execute(select(
+        func.count(Order.id), func.sum(usd_amount(Order.total_amount, Order.currency))
+    ).where(
+        Order.payment_status == PaymentStatus.COMPLETED,
+        Order.revenue_at >= today_start
+    )).one()
+    return {'orders': orders, 'revenue': float(revenue or 0)}
+
+def today_new_users():
+    """Users registered today from the raw table"""
+    today_start = _day_start(datetime.utcnow().date())
+    return db.session.execute(select(func.count(User.id)).where(User.created_at >= today_start)).scalar()
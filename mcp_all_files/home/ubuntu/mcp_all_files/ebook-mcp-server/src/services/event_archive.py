@@ -0,0 +1,290 @@
+from sqlalchemy import select, delete, func
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+import fcntl
+import gzip
+import json
+import logging
+import os
+from src.models.user import db
+from src.models.analytics import AnalyticsEvent, DailySummary, RollupState, SystemSetting
+from src.services.daily_rollup import ROLLUP_NAME, ARCHIVE_STATE_NAME, rollup_daily_summaries
+from src.services.event_store import event_store
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_DAYS = 180
+
+ARCHIVE_DIR = os.getenv('ANALYTICS_ARCHIVE_DIR', os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'database', 'archive', 'analytics_events'
+))
+
+# Events read, written and deleted per step; keeps memory and write locks small
+ARCHIVE_BATCH_SIZE = 1000
+
+def _day_start(day):
+    return datetime.combine(day, datetime.min.time())
+
+def day_directory(day, archive_dir=ARCHIVE_DIR):
+    """Partition directory for one day: <archive_dir>/YYYY/MM/DD"""
+    return os.path.join(archive_dir, f'{day:%Y}', f'{day:%m}', f'{day:%d}')
+
+def retention_horizon(today=None):
+    """Events created before this date are archived"""
+    days = SystemSetting.get_setting('analytics_retention_days', DEFAULT_RETENTION_DAYS)
+    return (today or datetime.utcnow().date()) - timedelta(days=int(days))
+
+def _day_max_event_id(day):
+    return db.session.execute(select(func.max(AnalyticsEvent.id)).where(
+        AnalyticsEvent.created_at >= _day_start(day),
+        AnalyticsEvent.created_at < _day_start(day + timedelta(days=1))
+    )).scalar()
+
+def is_rolled_up(day):
+    """Check that the day's summary and the columnar store include every event of the day"""
+    if not DailySummary.query.filter_by(date=day).first():
+        return False
+    state = db.session.get(RollupState, ROLLUP_NAME)
+    max_event_id = _day_max_event_id(day)
+    if max_event_id is None:
+        return state is not None
+    return state is not None and state.last_event_id >= max_event_id and event_store.last_event_id >= max_event_id
+
+def _part_files(directory):
+    """Part file names in a day directory, ordered by first event id"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        (name for name in os.listdir(directory) if name.endswith('.ndjson.gz')),
+        key=lambda name: int(name.split('-', 1)[1].split('.', 1)[0])
+    )
+
+def _part_last_id(path):
+    """Id of the last event in a part file, or None if the file does not read back fully"""
+    last_line = None
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                last_line = line
+        return json.loads(last_line)['id'] if last_line is not None else None
+    except (OSError, EOFError, ValueError, KeyError):
+        return None
+
+def archived_through(day, archive_dir=ARCHIVE_DIR):
+    """Highest event id already in the day's readable part files (0 if none)"""
+    directory = day_directory(day, archive_dir)
+    last_ids = [_part_last_id(os.path.join(directory, name)) for name in _part_files(directory)]
+    return max((last_id for last_id in last_ids if last_id is not None), default=0)
+
+def _write_day(day, archive_dir, batch_size, after_id=0):
+    """Write the day's hot events with id > after_id to a gzip NDJSON part file.
+
+    Returns (count, last_id, path).
+    """
+    start = _day_start(day)
+    end = _day_start(day + timedelta(days=1))
+    directory = day_directory(day, archive_dir)
+    os.makedirs(directory, exist_ok=True)
+
+    first_id = db.session.execute(select(func.min(AnalyticsEvent.id)).where(
+        AnalyticsEvent.created_at >= start, AnalyticsEvent.created_at < end,
+        AnalyticsEvent.id > after_id
+    )).scalar()
+    if first_id is None:
+        return 0, None, None
+
+    # Named by first event id, so a rerun after a crash before any delete
+    # overwrites the same part (a failed verification keeps every row)
+    path = os.path.join(directory, f'events-{first_id}.ndjson.gz')
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    count = 0
+    last_id = first_id - 1
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        while True:
+            events = AnalyticsEvent.query.filter(
+                AnalyticsEvent.created_at >= start,
+                AnalyticsEvent.created_at < end,
+                AnalyticsEvent.id > last_id
+            ).order_by(AnalyticsEvent.id).limit(batch_size).all()
+            if not events:
+                break
+            for event in events:
+                f.write(json.dumps(event.to_dict(), separators=(',', ':')) + '\n')
+            count += len(events)
+            last_id = events[-1].id
+            db.session.expunge_all()
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+    return count, last_id, path
+
+def verify_part(path, count, last_id):
+    """Check that a part file decompresses fully and holds `count` events ending at `last_id`"""
+    lines = 0
+    last_line = None
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                lines += 1
+                last_line = line
+        return lines == count and last_line is not None and json.loads(last_line)['id'] == last_id
+    except (OSError, EOFError, ValueError, KeyError):
+        return False
+
+def _delete_day(day, last_id, batch_size):
+    """Delete the day's events with id <= last_id from the hot table in bounded batches.
+
+    Lowest ids go first, so an interrupted run leaves a suffix of the part in
+    the table, which the next run deletes via archived_through().
+    """
+    start = _day_start(day)
+    end = _day_start(day + timedelta(days=1))
+    deleted = 0
+    while True:
+        ids = db.session.execute(select(AnalyticsEvent.id).where(
+            AnalyticsEvent.created_at >= start,
+            AnalyticsEvent.created_at < end,
+            AnalyticsEvent.id <= last_id
+        ).order_by(AnalyticsEvent.id).limit(batch_size)).scalars().all()
+        if not ids:
+            break
+        db.session.execute(delete(AnalyticsEvent).where(AnalyticsEvent.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+    return deleted
+
+def _mark_archived(day):
+    """Advance the archive watermark before deleting, so rollups stop recomputing the day"""
+    state = db.session.get(RollupState, ARCHIVE_STATE_NAME)
+    if state is None:
+        state = RollupState(name=ARCHIVE_STATE_NAME)
+        db.session.add(state)
+    day_end = _day_start(day + timedelta(days=1))
+    if state.last_run_at is None or state.last_run_at < day_end:
+        state.last_run_at = day_end
+    db.session.commit()
+
+@contextmanager
+def _archive_lock(archive_dir):
+    """Exclusive lock on the archive directory; yields False if another process is archiving"""
+    os.makedirs(archive_dir, exist_ok=True)
+    with open(os.path.join(archive_dir, '.lock'), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def archive_old_events(today=None, archive_dir=ARCHIVE_DIR, batch_size=ARCHIVE_BATCH_SIZE, max_days=None):
+    """Move events older than the retention horizon into daily archive files.
+
+    A day is only archived once its DailySummary covers all of its events;
+    the archive file is written, fsynced and read back before any row is
+    deleted. Only one process archives at a time (others return 0).
+    Returns the number of events archived.
+    """
+    with _archive_lock(archive_dir) as locked:
+        if not locked:
+            logger.info('Another process is archiving analytics events; skipping')
+            return 0
+        return _archive_old_events(today, archive_dir, batch_size, max_days)
+
+def _archive_old_events(today, archive_dir, batch_size, max_days):
+    horizon = retention_horizon(today)
+    oldest = db.session.execute(select(func.min(AnalyticsEvent.created_at)).where(
+        AnalyticsEvent.created_at < _day_start(horizon)
+    )).scalar()
+    if oldest is None:
+        return 0
+
+    # Make sure the days about to leave the hot table are summarized and in the columnar store
+    rollup_daily_summaries()
+    event_store.sync()
+
+    archived = 0
+    days = 0
+    day = oldest.date()
+    while day < horizon and (max_days is None or days < max_days):
+        if not is_rolled_up(day):
+            logger.warning('Skipping archive of %s: not rolled up yet', day)
+            metrics.increment('event_archive.skipped_days')
+        else:
+            # Rows already in a part (a previous run stopped while deleting) are
+            # deleted, not archived again, so no event is in two parts
+            done_through = archived_through(day, archive_dir)
+            if done_through:
+                _mark_archived(day)
+                resumed = _delete_day(day, done_through, batch_size)
+                if resumed:
+                    logger.info('Deleted %d already archived events for %s', resumed, day)
+                    metrics.increment('event_archive.resumed_deletes', resumed)
+
+            count, last_id, path = _write_day(day, archive_dir, batch_size, after_id=done_through)
+            if count and not verify_part(path, count, last_id):
+                # Keep the rows and drop the part, so archived_through() never trusts it
+                logger.error('Archive part %s failed verification; not deleting events for %s', path, day)
+                os.remove(path)
+                metrics.increment('event_archive.verify_failures')
+            elif count:
+                _mark_archived(day)
+                _delete_day(day, last_id, batch_size)
+                archived += count
+                days += 1
+                logger.info('Archived %d events for %s', count, day)
+
+        next_event = db.session.execute(select(func.min(AnalyticsEvent.created_at)).where(
+            AnalyticsEvent.created_at >= _day_start(day + timedelta(days=1)),
+            AnalyticsEvent.created_at < _day_start(horizon)
+        )).scalar()
+        if next_event is None:
+            break
+        day = next_event.date()
+
+    metrics.increment('event_archive.events', archived)
+    metrics.set_gauge('event_archive.last_run_at', datetime.utcnow().isoformat())
+    return archived
+
+def archived_days(archive_dir=ARCHIVE_DIR):
+    """List the days that have archive files, oldest first"""
+    days = []
+    if not os.path.isdir(archive_dir):
+        return days
+    # Skips the .lock file next to the year directories
+    for year in sorted(name for name in os.listdir(archive_dir) if name.isdigit()):
+        for month in sorted(os.listdir(os.path.join(archive_dir, year))):
+            for day in sorted(os.listdir(os.path.join(archive_dir, year, month))):
+                try:
+                    days.append(date(int(year), int(month), int(day)))
+                except ValueError:
+                    continue
+    return days
+
+def read_archived_events(start_date, end_date, event_type=None, user_id=None, book_id=None,
+                         archive_dir=ARCHIVE_DIR):
+    """Yield archived events (as dicts) with start_date <= created_at day < end_date.
+
+    Only the day partitions inside the range are opened, and each part file
+    is streamed line by line.
+    """
+    day = start_date
+    while day < end_date:
+        directory = day_directory(day, archive_dir)
+        if os.path.isdir(directory):
+            for name in _part_files(directory):
+                with gzip.open(os.path.join(directory, name), 'rt', encoding='utf-8') as f:
+                    for line in f:
+                        event = json.loads(line)
+                        if event_type and event['event_type'] != event_type:
+                            continue
+                        if user_id is not None and event['user_id'] != user_id:
+                            continue
+                        if book_id is not None and event['book_id'] != book_id:
+                            continue
+                        yield event
+        day += timedelta(days=1)
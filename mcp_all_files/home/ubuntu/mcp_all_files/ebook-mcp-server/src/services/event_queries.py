@@ -0,0 +1,84 @@
+from sqlalchemy import select, func, desc, text
+from datetime import datetime, timedelta
+from collections import namedtuple
+from src.models.user import db
+from src.models.analytics import AnalyticsEvent, EventType
+
+# Hot analytics_events statements. Every filter on created_at is a plain range
+# against a bound timestamp so it can seek into the (…, created_at) indexes.
+
+def recent_events_query(start_date, limit=10):
+    """Newest events since start_date (dashboard recent activity)"""
+    return select(AnalyticsEvent).where(
+        AnalyticsEvent.created_at >= start_date
+    ).order_by(desc(AnalyticsEvent.created_at)).limit(limit)
+
+def filtered_events_query(start_date=None, event_type=None, user_id=None, book_id=None):
+    """Event list for the admin events view, newest first"""
+    query = select(AnalyticsEvent)
+    if event_type:
+        query = query.where(AnalyticsEvent.event_type == event_type)
+    if user_id:
+        query = query.where(AnalyticsEvent.user_id == user_id)
+    if book_id:
+        query = query.where(AnalyticsEvent.book_id == book_id)
+    if start_date is not None:
+        query = query.where(AnalyticsEvent.created_at >= start_date)
+    return query.order_by(desc(AnalyticsEvent.created_at))
+
+def event_type_counts_query(start_date=None):
+    """Events per type since start_date, as one row with a count column per type.
+
+    A filtered count per type instead of GROUP BY event_type: grouping lets
+    SQLite prefer scanning all of (event_type, created_at) to avoid a sort,
+    while this form seeks the date range in (created_at, event_type) once.
+    """
+    query = select(*[
+        func.count(AnalyticsEvent.id).filter(AnalyticsEvent.event_type == event_type).label(event_type.value)
+        for event_type in EventType
+    ])
+    if start_date is not None:
+        query = query.where(AnalyticsEvent.created_at >= start_date)
+    return query
+
+def event_type_counts(start_date=None):
+    """(event type, count) for each type seen since start_date"""
+    row = db.session.execute(event_type_counts_query(start_date)).one()
+    return [(event_type, row._mapping[event_type.value]) for event_type in EventType if row._mapping[event_type.value]]
+
+def explain_query_plan(statement):
+    """Return SQLite's EXPLAIN QUERY PLAN detail lines for a statement"""
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    return [row[3] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))]
+
+QueryPlanCheck = namedtuple('QueryPlanCheck', ['name', 'plan', 'problems'])
+
+def hot_queries(now=None):
+    """The statements the plan check covers, with representative arguments"""
+    start_date = (now or datetime.utcnow()) - timedelta(days=7)
+    return {
+        'recent_activity': recent_events_query(start_date),
+        'events_by_date': filtered_events_query(start_date),
+        'events_by_type': filtered_events_query(start_date, event_type=EventType.BOOK_VIEW),
+        'events_by_book': filtered_events_query(start_date, book_id=1),
+        'events_by_user': filtered_events_query(start_date, user_id=1),
+        'event_type_counts': event_type_counts_query(start_date)
+    }
+
+def check_query_plans(now=None):
+    """Flag hot queries that scan analytics_events or sort with a temp b-tree.
+
+    Any SCAN fails, including a scan of a covering index: it still reads every
+    entry instead of seeking the date range.
+    """
+    results = []
+    for name, statement in hot_queries(now).items():
+        plan = explain_query_plan(statement)
+        problems = []
+        for detail in plan:
+            if detail.startswith('SCAN analytics_events'):
+                problems.append('full index scan' if 'INDEX' in detail else 'full table scan')
+            if 'USE TEMP B-TREE' in detail:
+                problems.append(detail.lower())
+        results.append(QueryPlanCheck(name, plan, problems))
+    return results
@@ -0,0 +1,346 @@
+from sqlalchemy import select, func
+from datetime import datetime, date, timedelta
+from contextlib import contextmanager
+import fcntl
+import json
+import logging
+import os
+import numpy as np
+from src.models.user import db
+from src.models.analytics import AnalyticsEvent, EventType
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EVENT_STORE_DIR = os.getenv('EVENT_STORE_DIR', os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'database', 'event_store'
+))
+
+# Rows pulled from analytics_events per sync round-trip
+EVENT_STORE_SYNC_BATCH = 50000
+
+# Fixed-width columns, one raw little-endian file per column per day segment.
+# Missing user/book/order ids are stored as 0 (database ids start at 1).
+COLUMNS = {
+    'id': np.dtype('<i8'),
+    'ts': np.dtype('<i8'),          # seconds since the epoch, UTC
+    'event_type': np.dtype('u1'),   # index into EVENT_TYPE_CODES
+    'user_id': np.dtype('<i4'),
+    'book_id': np.dtype('<i4'),
+    'order_id': np.dtype('<i4')
+}
+
+# Stable codes for the event_type column; new event types must be appended
+EVENT_TYPE_CODES = [
+    EventType.PAGE_VIEW, EventType.BOOK_VIEW, EventType.BOOK_DOWNLOAD, EventType.SEARCH,
+    EventType.PURCHASE, EventType.USER_REGISTRATION, EventType.USER_LOGIN
+]
+_CODE_BY_TYPE = {event_type: code for code, event_type in enumerate(EVENT_TYPE_CODES)}
+
+# Group-by keys computed from the timestamp instead of stored
+DERIVED_COLUMNS = ('day', 'hour', 'hour_of_day')
+
+SECONDS_PER_DAY = 86400
+_EPOCH = date(1970, 1, 1)
+
+def _day_from_number(number):
+    return _EPOCH + timedelta(days=int(number))
+
+def _column(segment, name):
+    """Stored or derived column of a segment"""
+    if name == 'day':
+        return segment['ts'] // SECONDS_PER_DAY
+    if name == 'hour':
+        return segment['ts'] // 3600
+    if name == 'hour_of_day':
+        return (segment['ts'] // 3600) % 24
+    return segment[name]
+
+def decode_key(name, value):
+    """Convert a group key back to its API value"""
+    if name == 'day':
+        return _day_from_number(value).isoformat()
+    if name == 'hour':
+        return datetime.utcfromtimestamp(int(value) * 3600).isoformat()
+    if name == 'event_type':
+        return EVENT_TYPE_CODES[int(value)].value
+    if name in ('user_id', 'book_id', 'order_id'):
+        return int(value) or None
+    return int(value)
+
+class EventStore:
+    """Append-only columnar copy of analytics_events, memory-mapped per day.
+
+    Each day is a directory of fixed-width column files that only grow. A
+    manifest holds the highest event id that is fully written; readers cap
+    every segment to that id, so a sync in progress is never half visible.
+    Writers serialize on a file lock, so any worker may run the sync job.
+    """
+
+    def __init__(self, path=EVENT_STORE_DIR):
+        self.path = path
+        self.manifest_path = os.path.join(path, 'manifest.json')
+
+    def _segment_dir(self, day):
+        return os.path.join(self.path, day.isoformat())
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'last_event_id': 0, 'dirty': False}
+
+    def _write_manifest(self, manifest):
+        tmp_path = f'{self.manifest_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    @contextmanager
+    def _write_lock(self, blocking=False):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, '.lock'), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @property
+    def last_event_id(self):
+        return self._read_manifest()['last_event_id']
+
+    def days(self):
+        """Days that have a segment, oldest first"""
+        if not os.path.isdir(self.path):
+            return []
+        days = []
+        for name in sorted(os.listdir(self.path)):
+            try:
+                days.append(date.fromisoformat(name))
+            except ValueError:
+                continue
+        return days
+
+    def _segment_rows(self, directory):
+        return min(
+            os.path.getsize(os.path.join(directory, name)) // dtype.itemsize
+            if os.path.exists(os.path.join(directory, name)) else 0
+            for name, dtype in COLUMNS.items()
+        )
+
+    def _open_segment(self, day, last_event_id):
+        """Memory-map a day's columns, capped to rows committed in the manifest"""
+        directory = self._segment_dir(day)
+        if not os.path.isdir(directory):
+            return None
+        rows = self._segment_rows(directory)
+        if rows == 0:
+            return None
+        segment = {
+            name: np.memmap(os.path.join(directory, name), dtype=dtype, mode='r', shape=(rows,))
+            for name, dtype in COLUMNS.items()
+        }
+        # Ids ascend within a segment, so uncommitted rows are a suffix
+        committed = int(np.searchsorted(segment['id'], last_event_id, side='right'))
+        if committed == 0:
+            return None
+        if committed < rows:
+            segment = {name: column[:committed] for name, column in segment.items()}
+        return segment
+
+    def _repair(self, last_event_id):
+        """Truncate rows written after the manifest by an interrupted sync"""
+        for day in self.days():
+            directory = self._segment_dir(day)
+            rows = self._segment_rows(directory)
+            ids = np.fromfile(os.path.join(directory, 'id'), dtype=COLUMNS['id'], count=rows) if rows else []
+            committed = int(np.searchsorted(ids, last_event_id, side='right')) if rows else 0
+            for name, dtype in COLUMNS.items():
+                column_path = os.path.join(directory, name)
+                if os.path.exists(column_path) and os.path.getsize(column_path) != committed * dtype.itemsize:
+                    os.truncate(column_path, committed * dtype.itemsize)
+
+    def _append(self, columns):
+        """Append a batch of rows (ordered by id) to their day segments"""
+        day_numbers = columns['ts'] // SECONDS_PER_DAY
+        for day_number in np.unique(day_numbers):
+            mask = day_numbers == day_number
+            directory = self._segment_dir(_day_from_number(day_number))
+            os.makedirs(directory, exist_ok=True)
+            for name, dtype in COLUMNS.items():
+                with open(os.path.join(directory, name), 'ab') as f:
+                    f.write(np.ascontiguousarray(columns[name][mask], dtype=dtype).tobytes())
+
+    def append_rows(self, rows):
+        """Append (id, created_at, event_type, user_id, book_id, order_id) rows"""
+        if not rows:
+            return 0
+        ids, created, types, users, books, orders = zip(*rows)
+        columns = {
+            'id': np.array(ids, dtype=COLUMNS['id']),
+            'ts': np.array(created, dtype='datetime64[s]').astype(COLUMNS['ts']),
+            'event_type': np.array([_CODE_BY_TYPE[t] for t in types], dtype=COLUMNS['event_type']),
+            'user_id': np.array([v or 0 for v in users], dtype=COLUMNS['user_id']),
+            'book_id': np.array([v or 0 for v in books], dtype=COLUMNS['book_id']),
+            'order_id': np.array([v or 0 for v in orders], dtype=COLUMNS['order_id'])
+        }
+        self._append(columns)
+        return len(rows)
+
+    def _ingest(self, batches):
+        """Append row batches under the write lock, committing the manifest at the end"""
+        manifest = self._read_manifest()
+        if manifest.get('dirty'):
+            self._repair(manifest['last_event_id'])
+        self._write_manifest({**manifest, 'dirty': True})
+
+        last_event_id = manifest['last_event_id']
+        count = 0
+        for rows in batches:
+            count += self.append_rows(rows)
+            if rows:
+                last_event_id = max(last_event_id, max(row[0] for row in rows))
+
+        self._write_manifest({'last_event_id': last_event_id, 'dirty': False})
+        return count
+
+    def _hot_batches(self, after_id, batch_size):
+        """Rows of analytics_events with id > after_id, in id order"""
+        while True:
+            rows = db.session.execute(select(
+                AnalyticsEvent.id, AnalyticsEvent.created_at, AnalyticsEvent.event_type,
+                AnalyticsEvent.user_id, AnalyticsEvent.book_id, AnalyticsEvent.order_id
+            ).where(AnalyticsEvent.id > after_id).order_by(AnalyticsEvent.id).limit(batch_size)).all()
+            if not rows:
+                return
+            yield rows
+            after_id = rows[-1][0]
+
+    def sync(self, batch_size=EVENT_STORE_SYNC_BATCH):
+        """Copy events newer than the store's watermark from analytics_events.
+
+        Returns the number of rows appended, or 0 when there is nothing new
+        or another worker holds the write lock.
+        """
+        max_event_id = db.session.execute(select(func.max(AnalyticsEvent.id))).scalar() or 0
+        if max_event_id <= self.last_event_id:
+            return 0
+
+        with self._write_lock() as locked:
+            if not locked:
+                return 0
+            count = self._ingest(self._hot_batches(self.last_event_id, batch_size))
+
+        metrics.increment('event_store.rows_appended', count)
+        metrics.set_gauge('event_store.last_event_id', self.last_event_id)
+        return count
+
+    def rebuild(self, batch_size=EVENT_STORE_SYNC_BATCH):
+        """Recreate the store from the event archive and analytics_events"""
+        from src.services.event_archive import archived_days, read_archived_events
+
+        def archived_batches():
+            for day in archived_days():
+                yield [
+                    (event['id'], datetime.fromisoformat(event['created_at']), EventType(event['event_type']),
+                     event['user_id'], event['book_id'], event['order_id'])
+                    for event in read_archived_events(day, day + timedelta(days=1))
+                ]
+
+        def all_batches():
+            yield from archived_batches()
+            # Archived rows are gone from the hot table, so the two never overlap
+            yield from self._hot_batches(0, batch_size)
+
+        with self._write_lock(blocking=True):
+            for day in self.days():
+                directory = self._segment_dir(day)
+                for name in os.listdir(directory):
+                    os.remove(os.path.join(directory, name))
+                os.rmdir(directory)
+            self._write_manifest({'last_event_id': 0, 'dirty': False})
+            count = self._ingest(all_batches())
+
+        metrics.set_gauge('event_store.last_event_id', self.last_event_id)
+        return count
+
+    def scan(self, start_date, end_date, columns, event_types=None, **filters):
+        """Yield per-day dicts of the requested columns for start_date <= day < end_date.
+
+        event_types restricts to EventType members; filters are exact matches
+        on stored id columns (e.g. book_id=3). Only matching rows are copied
+        out of the memory maps.
+        """
+        last_event_id = self.last_event_id
+        codes = np.array([_CODE_BY_TYPE[t] for t in event_types], dtype=COLUMNS['event_type']) if event_types else None
+        for day in self.days():
+            if day < start_date or day >= end_date:
+                continue
+            segment = self._open_segment(day, last_event_id)
+            if segment is None:
+                continue
+
+            mask = None
+            if codes is not None:
+                mask = np.isin(segment['event_type'], codes)
+            for name, value in filters.items():
+                if value is None:
+                    continue
+                condition = segment[name] == value
+                mask = condition if mask is None else mask & condition
+
+            if mask is None:
+                yield {name: np.asarray(_column(segment, name)) for name in columns}
+            elif mask.any():
+                yield {name: np.asarray(_column(segment, name))[mask] for name in columns}
+
+    def group_count(self, start_date, end_date, by, event_types=None, **filters):
+        """Count events per distinct combination of the `by` columns.
+
+        Returns (keys, counts): keys maps each `by` column to an array and
+        counts holds the matching row counts, sorted by key.
+        """
+        by = list(by)
+        if not by:
+            raise ValueError('group_count needs at least one column to group by')
+        key_parts = {name: [] for name in by}
+        for part in self.scan(start_date, end_date, by, event_types=event_types, **filters):
+            for name in by:
+                key_parts[name].append(part[name].astype(np.int64))
+
+        if not key_parts[by[0]]:
+            return {name: np.array([], dtype=np.int64) for name in by}, np.array([], dtype=np.int64)
+
+        stacked = np.column_stack([np.concatenate(key_parts[name]) for name in by])
+        unique, counts = np.unique(stacked, axis=0, return_counts=True)
+        return {name: unique[:, i] for i, name in enumerate(by)}, counts
+
+    def count(self, start_date, end_date, event_types=None, **filters):
+        """Number of matching events"""
+        return sum(len(part['id']) for part in self.scan(start_date, end_date, ['id'],
+                                                          event_types=event_types, **filters))
+
+    def count_distinct(self, start_date, end_date, column, event_types=None, **filters):
+        """Number of distinct non-null values of a column among matching events"""
+        values = [part[column] for part in self.scan(start_date, end_date, [column],
+                                                     event_types=event_types, **filters)]
+        if not values:
+            return 0
+        unique = np.unique(np.concatenate(values))
+        if column in ('user_id', 'book_id', 'order_id'):
+            unique = unique[unique != 0]
+        return int(len(unique))
+
+event_store = EventStore()
+
+def sync_event_store():
+    """Job entry point: append new analytics events to the columnar store"""
+    return event_store.sync()
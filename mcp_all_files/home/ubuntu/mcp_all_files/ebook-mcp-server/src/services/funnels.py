@@ -0,0 +1,188 @@
+from sqlalchemy import select
+from datetime import datetime, timedelta
+import numpy as np
+from src.models.user import db
+from src.models.book import book_categories
+from src.models.order import OrderItem
+from src.models.analytics import AnalyticsEvent, EventType
+from src.services.cache import TTLCache
+
+FUNNEL_STEPS = ('book_view', 'purchase', 'book_download')
+
+ATTRIBUTIONS = ('user', 'session')
+
+# Default time allowed from a first view to the purchase, and from the purchase to a download
+DEFAULT_PURCHASE_WINDOW = timedelta(days=7)
+DEFAULT_DOWNLOAD_WINDOW = timedelta(days=30)
+
+# Funnels are recomputed at most this often per parameter set
+_funnel_cache = TTLCache(ttl=60, max_entries=64)
+
+def _day_start(day):
+    return datetime.combine(day, datetime.min.time())
+
+def _epoch_seconds(values):
+    return np.array(values, dtype='datetime64[s]').astype(np.int64)
+
+def _identities(rows, attribution):
+    """Identity of each row as a string, None where it cannot be attributed.
+
+    Sessions fall back to the client IP: events are not always logged with
+    a session id, and the same visitor keeps one IP within a session.
+    """
+    if attribution == 'user':
+        return [None if row.user_id is None else str(row.user_id) for row in rows]
+    return [row.session_id or row.ip_address for row in rows]
+
+def _load_steps(start, end, last_step_end, attribution):
+    """Extract each step's (identity, book_id, timestamp) arrays in one query per event table.
+
+    Views start the funnel only inside [start, end); purchases and downloads
+    are read up to last_step_end so visitors near the end of the range can
+    still convert. Identities are factorized to dense integers shared by
+    all steps.
+    """
+    events = db.session.execute(select(
+        AnalyticsEvent.event_type, AnalyticsEvent.book_id, AnalyticsEvent.created_at,
+        AnalyticsEvent.user_id, AnalyticsEvent.session_id, AnalyticsEvent.ip_address
+    ).where(
+        AnalyticsEvent.event_type.in_([EventType.BOOK_VIEW, EventType.BOOK_DOWNLOAD]),
+        AnalyticsEvent.created_at >= start,
+        AnalyticsEvent.created_at < last_step_end,
+        AnalyticsEvent.book_id.isnot(None)
+    )).all()
+
+    # A purchase event names the order; it counts for every book in it
+    purchases = db.session.execute(select(
+        OrderItem.book_id, AnalyticsEvent.created_at,
+        AnalyticsEvent.user_id, AnalyticsEvent.session_id, AnalyticsEvent.ip_address
+    ).join(OrderItem, OrderItem.order_id == AnalyticsEvent.order_id).where(
+        AnalyticsEvent.event_type == EventType.PURCHASE,
+        AnalyticsEvent.created_at >= start,
+        AnalyticsEvent.created_at < last_step_end
+    )).all()
+
+    names = np.array(_identities(events, attribution) + _identities(purchases, attribution), dtype=object)
+    known = np.array([name is not None for name in names], dtype=bool)
+    identity = np.full(len(names), -1, dtype=np.int64)
+    if known.any():
+        _, identity[known] = np.unique(names[known].astype(str), return_inverse=True)
+
+    event_identity, purchase_identity = identity[:len(events)], identity[len(events):]
+    event_type = np.array([row.event_type == EventType.BOOK_VIEW for row in events], dtype=bool)
+    event_book = np.array([row.book_id for row in events], dtype=np.int64)
+    event_ts = _epoch_seconds([row.created_at for row in events])
+    end_ts = _epoch_seconds([end])[0]
+
+    views = event_type & (event_ts < end_ts) & (event_identity >= 0)
+    downloads = ~event_type & (event_identity >= 0)
+    bought = purchase_identity >= 0
+    return [
+        (event_identity[views], event_book[views], event_ts[views]),
+        (purchase_identity[bought], np.array([row.book_id for row in purchases], dtype=np.int64)[bought],
+         _epoch_seconds([row.created_at for row in purchases])[bought]),
+        (event_identity[downloads], event_book[downloads], event_ts[downloads])
+    ]
+
+def _first_per_key(keys, timestamps):
+    """Sorted distinct keys with the earliest timestamp of each"""
+    order = np.lexsort((timestamps, keys))
+    keys, timestamps = keys[order], timestamps[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    return keys[first], timestamps[first]
+
+def funnel_counts(steps, windows, n_groups):
+    """Distinct identities per group reaching each funnel step, as a (steps, n_groups) array.
+
+    steps holds one (identity, group, timestamp) array triple per step and
+    windows[i] the seconds allowed between reaching step i and step i + 1.
+    An identity reaches a step in a group at its earliest matching event
+    no sooner than, and within the window after, the time it reached the
+    previous step there. Everything is done with sorts, binary searches and
+    bincounts over whole arrays.
+    """
+    counts = np.zeros((len(steps), n_groups), dtype=np.int64)
+    reached_keys = reached_at = None
+    for i, (identity, group, timestamps) in enumerate(steps):
+        keys = identity * n_groups + group
+        if i > 0:
+            if len(reached_keys) == 0:
+                break
+            position = np.minimum(np.searchsorted(reached_keys, keys), len(reached_keys) - 1)
+            previous = reached_at[position]
+            converted = (reached_keys[position] == keys) & (timestamps >= previous) & \
+                        (timestamps - previous <= windows[i - 1])
+            keys, timestamps = keys[converted], timestamps[converted]
+        reached_keys, reached_at = _first_per_key(keys, timestamps)
+        counts[i] = np.bincount(reached_keys % n_groups, minlength=n_groups)
+    return counts
+
+def _book_category_pairs():
+    rows = db.session.execute(select(book_categories.c.book_id, book_categories.c.category_id)).all()
+    return (np.array([row.book_id for row in rows], dtype=np.int64),
+            np.array([row.category_id for row in rows], dtype=np.int64))
+
+def _expand_to_categories(step, pair_books, pair_categories):
+    """Repeat each event once per category of its book (vectorized CSR lookup)"""
+    identity, books, timestamps = step
+    order = np.argsort(pair_books, kind='stable')
+    pair_books, pair_categories = pair_books[order], pair_categories[order]
+    first = np.searchsorted(pair_books, books, side='left')
+    repeats = np.searchsorted(pair_books, books, side='right') - first
+    rows = np.repeat(np.arange(len(books)), repeats)
+    # Offset of each output row within its event's run of categories
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    return identity[rows], pair_categories[first[rows] + offsets], timestamps[rows]
+
+def _rates(counts):
+    viewers, purchasers, downloaders = (int(value) for value in counts)
+    return {
+        'viewers': viewers,
+        'purchasers': purchasers,
+        'downloaders': downloaders,
+        'view_to_purchase': round(purchasers / viewers * 100, 2) if viewers else 0.0,
+        'purchase_to_download': round(downloaders / purchasers * 100, 2) if purchasers else 0.0,
+        'view_to_download': round(downloaders / viewers * 100, 2) if viewers else 0.0
+    }
+
+def _compute_funnels(start_date, end_date, attribution, purchase_window, download_window):
+    start, end = _day_start(start_date), _day_start(end_date)
+    last_step_end = min(end + purchase_window + download_window, datetime.utcnow() + timedelta(seconds=1))
+    steps = _load_steps(start, end, last_step_end, attribution)
+    windows = (purchase_window.total_seconds(), download_window.total_seconds())
+
+    overall = funnel_counts([(identity, np.zeros_like(group), ts) for identity, group, ts in steps], windows, 1)
+
+    n_books = int(max((group.max() for _, group, _ in steps if len(group)), default=0)) + 1
+    by_book = funnel_counts(steps, windows, n_books)
+
+    pair_books, pair_categories = _book_category_pairs()
+    n_categories = int(pair_categories.max()) + 1 if len(pair_categories) else 1
+    by_category = funnel_counts(
+        [_expand_to_categories(step, pair_books, pair_categories) for step in steps], windows, n_categories
+    )
+
+    return {
+        'overall': _rates(overall[:, 0]),
+        'books': {int(book_id): _rates(by_book[:, book_id]) for book_id in np.flatnonzero(by_book[0])},
+        'categories': {
+            int(category_id): _rates(by_category[:, category_id]) for category_id in np.flatnonzero(by_category[0])
+        }
+    }
+
+def conversion_funnels(start_date, end_date, attribution='user',
+                       purchase_window=DEFAULT_PURCHASE_WINDOW, download_window=DEFAULT_DOWNLOAD_WINDOW):
+    """View -> purchase -> download funnels for visitors whose first view is in [start_date, end_date).
+
+    Returns overall, per-book and per-category distinct counts per step with
+    step conversion rates (percent); books and categories without views in
+    the range are omitted. Events are read from analytics_events, so days
+    already archived are not included.
+    """
+    if attribution not in ATTRIBUTIONS:
+        raise ValueError(f'attribution must be one of {", ".join(ATTRIBUTIONS)}')
+    key = (start_date, end_date, attribution, purchase_window, download_window)
+    return _funnel_cache.get_or_compute(
+        key, lambda: _compute_funnels(start_date, end_date, attribution, purchase_window, download_window)
+    )
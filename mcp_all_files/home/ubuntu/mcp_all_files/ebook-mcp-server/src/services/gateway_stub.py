@@ -0,0 +1,153 @@
+"""Local Razorpay-compatible HTTP stub for offline checkout load tests.
+
+Run it and point the server at it:
+
+    python -m src.services.gateway_stub --port 9010 --latency-ms 150 --jitter-ms 50 --failure-rate 0.05
+    RAZORPAY_API_URL=http://127.0.0.1:9010 python src/main.py
+
+Only the endpoints the gateway client uses are implemented.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubConfig:
+    """Fault injection knobs shared by all request handlers"""
+
+    def __init__(self, latency_ms=0, jitter_ms=0, failure_rate=0.0, timeout_rate=0.0,
+                 failure_status=503, hang_seconds=30):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.failure_status = failure_status
+        self.hang_seconds = hang_seconds
+
+class GatewayStubHandler(BaseHTTPRequestHandler):
+    config = StubConfig()
+    orders = {}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        if not self._inject_faults():
+            return
+        if self.path != '/v1/orders':
+            return self._send(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Not found'}})
+
+        body = self._read_json()
+        if not body or not body.get('amount') or not body.get('currency'):
+            return self._send(400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'amount and currency are required'}})
+
+        order = {
+            'id': f"order_{uuid.uuid4().hex[:14]}",
+            'entity': 'order',
+            'amount': body['amount'],
+            'amount_paid': 0,
+            'amount_due': body['amount'],
+            'currency': body['currency'],
+            'receipt': body.get('receipt'),
+            'status': 'created',
+            'attempts': 0,
+            'notes': body.get('notes', {}),
+            'created_at': int(time.time())
+        }
+        with self.lock:
+            self.orders[order['id']] = order
+        self._send(200, order)
+
+    def do_GET(self):
+        if not self._inject_faults():
+            return
+        if self.path.startswith('/v1/payments/'):
+            payment_id = self.path.rsplit('/', 1)[-1]
+            return self._send(200, {
+                'id': payment_id,
+                'entity': 'payment',
+                'status': 'captured',
+                'created_at': int(time.time())
+            })
+        if self.path.startswith('/v1/orders/'):
+            with self.lock:
+                order = self.orders.get(self.path.rsplit('/', 1)[-1])
+            if order:
+                return self._send(200, order)
+        self._send(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Not found'}})
+
+    def log_message(self, format, *args):
+        pass
+
+    def _inject_faults(self):
+        """Apply latency, hangs and failures; returns False when the request was answered"""
+        config = self.config
+        delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+        roll = random.random()
+        if roll < config.timeout_rate:
+            time.sleep(config.hang_seconds)
+            return False
+        if roll < config.timeout_rate + config.failure_rate:
+            self._send(config.failure_status, {'error': {'code': 'SERVER_ERROR', 'description': 'Injected failure'}})
+            return False
+        return True
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return None
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def make_server(host='127.0.0.1', port=9010, config=None):
+    """Create a stub server; call serve_forever() or run it in a thread"""
+    handler = type('ConfiguredGatewayStubHandler', (GatewayStubHandler,), {
+        'config': config or StubConfig(),
+        'orders': {},
+        'lock': threading.Lock()
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description='Razorpay-compatible gateway stub')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9010)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--failure-status', type=int, default=503)
+    parser.add_argument('--timeout-rate', type=float, default=0.0)
+    parser.add_argument('--hang-seconds', type=float, default=30)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        timeout_rate=args.timeout_rate,
+        failure_status=args.failure_status,
+        hang_seconds=args.hang_seconds
+    )
+    server = make_server(args.host, args.port, config)
+    print(f"Gateway stub listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
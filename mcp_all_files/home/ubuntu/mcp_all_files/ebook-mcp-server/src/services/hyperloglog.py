@@ -0,0 +1,85 @@
+import hashlib
+import math
+import zlib
+import numpy as np
+
+def hash_items(items):
+    """64-bit hashes of string items as a uint64 array"""
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), 'little') for item in items),
+        dtype=np.uint64
+    )
+
+def _bit_length(values):
+    """Exact bit length of each uint64 value"""
+    values = values.copy()
+    for shift in (1, 2, 4, 8, 16, 32):
+        values |= values >> np.uint64(shift)
+    return np.bitwise_count(values).astype(np.int64)
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over 64-bit hashes.
+
+    Uses m = 2**precision one-byte registers. The relative standard error of
+    estimate() is 1.04 / sqrt(m): 0.81% at precision 14 (16 KiB), 1.63% at
+    precision 12 (4 KiB); about 95% of estimates fall within twice that.
+    Small cardinalities use linear counting and are near exact. Sketches
+    of the same precision merge losslessly with an element-wise max, so a
+    date range is the max over its daily sketches.
+    """
+
+    def __init__(self, precision=14, registers=None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8) if registers is None else registers
+
+    @property
+    def standard_error(self):
+        return 1.04 / math.sqrt(self.m)
+
+    def add_hashes(self, hashes):
+        """Add uint64 hashes (vectorized)"""
+        if len(hashes) == 0:
+            return self
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        remainder = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - _bit_length(remainder) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+        return self
+
+    def add(self, items):
+        """Add string items"""
+        return self.add_hashes(hash_items(items))
+
+    def merge(self, other):
+        """Fold another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge HyperLogLog sketches of different precision')
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @classmethod
+    def union(cls, sketches, precision):
+        """Merge many sketches in one vectorized max"""
+        registers = [sketch.registers for sketch in sketches]
+        if not registers:
+            return cls(precision)
+        return cls(precision, np.maximum.reduce(registers) if len(registers) > 1 else registers[0].copy())
+
+    def estimate(self):
+        """Estimated number of distinct items added"""
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def to_bytes(self):
+        """Compressed registers; sparse (low-cardinality) sketches shrink to a few bytes"""
+        return zlib.compress(self.registers.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data, precision):
+        return cls(precision, np.frombuffer(zlib.decompress(data), dtype=np.uint8).copy())
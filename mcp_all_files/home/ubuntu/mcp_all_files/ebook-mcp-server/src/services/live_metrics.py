@@ -0,0 +1,290 @@
+from sqlalchemy import select, func
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import threading
+import time
+from src.models.user import db
+from src.models.order import Order
+from src.models.pricing import usd_amount
+from src.models.analytics import AnalyticsEvent, EventType
+from src.services.daily_rollup import today_sales
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds between pipeline polls (one computation per process, shared by all streams)
+LIVE_METRICS_INTERVAL = float(os.getenv('LIVE_METRICS_INTERVAL', 2))
+
+# Idle streams get an SSE comment this often so proxies keep them open and dead clients are noticed
+LIVE_HEARTBEAT_SECONDS = 15
+
+# Undelivered messages kept per client; a slower client is resynced with a snapshot
+LIVE_CLIENT_BUFFER = 100
+
+# Recent messages kept for clients reconnecting with Last-Event-ID. SSE ids are
+# analytics event ids, so they mean the same thing on every worker
+LIVE_REPLAY_BUFFER = 200
+
+# Concurrent streams per worker process
+LIVE_MAX_SUBSCRIBERS = int(os.getenv('LIVE_MAX_SUBSCRIBERS', 100))
+
+# Events read per poll round-trip
+LIVE_POLL_BATCH = 5000
+
+# Recently seen purchase orders, so a payment logged by both verify and webhook counts once
+_SEEN_ORDERS_LIMIT = 10000
+
+def format_sse(event, data, event_id=None):
+    """Encode one Server-Sent Events message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+class Subscriber:
+    """One connected stream: a bounded buffer of (event id, encoded message)"""
+
+    def __init__(self, maxlen=LIVE_CLIENT_BUFFER):
+        self.maxlen = maxlen
+        self.overflowed = False
+        self._messages = deque()
+        self._condition = threading.Condition()
+
+    def push(self, event_id, message):
+        with self._condition:
+            if len(self._messages) >= self.maxlen:
+                # Drop the backlog; the stream sends a fresh snapshot instead
+                self._messages.clear()
+                self.overflowed = True
+            self._messages.append((event_id, message))
+            self._condition.notify()
+
+    def drain(self, timeout):
+        """Wait up to timeout for messages; returns (messages, overflowed)"""
+        with self._condition:
+            if not self._messages:
+                self._condition.wait(timeout)
+            messages = list(self._messages)
+            self._messages.clear()
+            overflowed, self.overflowed = self.overflowed, False
+            return messages, overflowed
+
+class LiveMetrics:
+    """Tails analytics_events once per process and fans metric deltas out to SSE streams.
+
+    A poll reads new events since the last id, turns purchases into order
+    counts and revenue, and publishes one pre-encoded delta message that
+    every subscriber receives, so the cost does not grow with clients.
+
+    Each delta covers the analytics events (first id, last id] and carries
+    the last id as its SSE id. Workers poll at different moments, so a
+    reconnect is only replayed when this worker has a delta starting exactly
+    at the client's Last-Event-ID; otherwise it gets a snapshot.
+    """
+
+    def __init__(self):
+        self.last_event_id = None
+        self.last_poll_at = 0.0
+        self.day = None
+        self.totals = {'orders_today': 0, 'revenue_today': 0.0}
+        self._per_second = Counter()  # epoch second -> events
+        self._seen_orders = OrderedDict()
+        self._replay = deque(maxlen=LIVE_REPLAY_BUFFER)  # (first event id, last event id, encoded message)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+
+    def at_capacity(self):
+        """Check if this worker already serves LIVE_MAX_SUBSCRIBERS streams"""
+        with self._lock:
+            return len(self._subscribers) >= LIVE_MAX_SUBSCRIBERS
+
+    def subscribe(self):
+        """Register a stream; returns None when the worker is at capacity"""
+        with self._lock:
+            if len(self._subscribers) >= LIVE_MAX_SUBSCRIBERS:
+                return None
+            subscriber = Subscriber()
+            self._subscribers.add(subscriber)
+        metrics.set_gauge('live_metrics.subscribers', len(self._subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+        metrics.set_gauge('live_metrics.subscribers', len(self._subscribers))
+
+    def _publish(self, event, data, first_id, last_id):
+        with self._lock:
+            message = format_sse(event, data, last_id)
+            self._replay.append((first_id, last_id, message))
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.push(last_id, message)
+
+    def replay_since(self, last_event_id):
+        """(event id, message) pairs covering the events after last_event_id, or None if this worker can't tell"""
+        with self._lock:
+            if last_event_id == self.last_event_id:
+                return []
+            for index, (first_id, _, _) in enumerate(self._replay):
+                if first_id == last_event_id:
+                    return [(last_id, message) for _, last_id, message in list(self._replay)[index:]]
+            return None
+
+    def _count_events(self, created_ats):
+        seconds = Counter(int((created_at - datetime(1970, 1, 1)).total_seconds()) for created_at in created_ats)
+        with self._lock:
+            self._per_second.update(seconds)
+
+    def _events_per_minute(self, now):
+        cutoff = int(now) - 60
+        with self._lock:
+            for second in [s for s in self._per_second if s <= cutoff]:
+                del self._per_second[second]
+            return sum(self._per_second.values())
+
+    def snapshot(self):
+        """Current totals, sent to new streams and after a buffer overflow"""
+        return {
+            'ts': datetime.utcnow().isoformat(),
+            'orders_today': self.totals['orders_today'],
+            'revenue_today': round(self.totals['revenue_today'], 2),
+            'events_per_minute': self._events_per_minute(time.time()),
+            'last_event_id': self.last_event_id
+        }
+
+    def _reset_day(self, today):
+        sales = today_sales()
+        self.day = today
+        self.totals = {'orders_today': sales['orders'], 'revenue_today': sales['revenue']}
+
+    def poll(self):
+        """Read new events and publish a delta if anything happened; returns events read"""
+        if not self._poll_lock.acquire(blocking=False):
+            return 0
+        try:
+            today = datetime.utcnow().date()
+            if self.last_event_id is None:
+                self.last_event_id = db.session.execute(select(func.max(AnalyticsEvent.id))).scalar() or 0
+                # Seed events/minute from the last minute of the table
+                since = datetime.utcnow() - timedelta(seconds=60)
+                self._count_events(db.session.execute(
+                    select(AnalyticsEvent.created_at).where(AnalyticsEvent.created_at >= since)
+                ).scalars())
+            if self.day != today:
+                # Midnight (or first poll): totals restart from the raw tables
+                self._reset_day(today)
+
+            rows = db.session.execute(select(
+                AnalyticsEvent.id, AnalyticsEvent.event_type, AnalyticsEvent.order_id, AnalyticsEvent.created_at
+            ).where(AnalyticsEvent.id > self.last_event_id).order_by(AnalyticsEvent.id).limit(LIVE_POLL_BATCH)).all()
+
+            if rows:
+                by_type = Counter()
+                order_ids = []
+                self._count_events(row.created_at for row in rows)
+                for row in rows:
+                    by_type[row.event_type.value] += 1
+                    if row.event_type == EventType.PURCHASE and row.order_id and row.order_id not in self._seen_orders:
+                        self._seen_orders[row.order_id] = True
+                        order_ids.append(row.order_id)
+                while len(self._seen_orders) > _SEEN_ORDERS_LIMIT:
+                    self._seen_orders.popitem(last=False)
+
+                new_orders, revenue = 0, 0.0
+                if order_ids:
+                    new_orders, revenue = db.session.execute(
+                        select(func.count(Order.id), func.sum(usd_amount(Order.total_amount, Order.currency))).where(
+                            Order.id.in_(order_ids)
+                        )
+                    ).one()
+                    revenue = float(revenue or 0)
+                self.totals['orders_today'] += new_orders
+                self.totals['revenue_today'] += revenue
+                first_id, self.last_event_id = self.last_event_id, rows[-1].id
+
+                self._publish('metrics', {
+                    'ts': datetime.utcnow().isoformat(),
+                    'new_orders': new_orders,
+                    'revenue': round(revenue, 2),
+                    'events': dict(by_type),
+                    'events_per_minute': self._events_per_minute(time.time()),
+                    'orders_today': self.totals['orders_today'],
+                    'revenue_today': round(self.totals['revenue_today'], 2),
+                    'last_event_id': self.last_event_id
+                }, first_id, self.last_event_id)
+
+            self.last_poll_at = time.monotonic()
+            metrics.increment('live_metrics.events_read', len(rows))
+            return len(rows)
+        finally:
+            self._poll_lock.release()
+
+    def poll_if_stale(self):
+        """Let a stream drive polling when the background job is not running"""
+        if time.monotonic() - self.last_poll_at > 2 * LIVE_METRICS_INTERVAL:
+            try:
+                self.poll()
+            finally:
+                # Long-lived streams must not pin a connection or an old read snapshot
+                db.session.remove()
+
+    def stream(self, last_event_id=None, expires_at=None):
+        """Generate the SSE body for one stream until it disconnects or its token expires.
+
+        The subscription is taken here, so it is released by the same
+        generator whether the client reads one byte or never starts.
+        """
+        subscriber = self.subscribe()
+        if subscriber is None:
+            yield format_sse('error', {'reason': 'too_many_connections'})
+            return
+        try:
+            yield f'retry: {int(LIVE_METRICS_INTERVAL * 2000)}\n\n'
+
+            replay = self.replay_since(last_event_id) if last_event_id is not None else None
+            if replay is not None:
+                sent_until = last_event_id
+                for sent_until, message in replay:
+                    yield message
+            else:
+                self.poll_if_stale()
+                snapshot = self.snapshot()
+                sent_until = snapshot['last_event_id']
+                yield format_sse('snapshot', snapshot, sent_until)
+
+            last_sent = time.monotonic()
+            while expires_at is None or time.time() < expires_at:
+                self.poll_if_stale()
+                messages, overflowed = subscriber.drain(timeout=min(LIVE_METRICS_INTERVAL, LIVE_HEARTBEAT_SECONDS))
+                # Deltas already covered by the replay or snapshot would be counted twice
+                messages = [message for event_id, message in messages if sent_until is None or event_id > sent_until]
+                if overflowed:
+                    metrics.increment('live_metrics.client_overflows')
+                    snapshot = self.snapshot()
+                    sent_until = snapshot['last_event_id']
+                    yield format_sse('snapshot', snapshot, sent_until)
+                    last_sent = time.monotonic()
+                elif messages:
+                    yield ''.join(messages)
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= LIVE_HEARTBEAT_SECONDS:
+                    yield ': heartbeat\n\n'
+                    last_sent = time.monotonic()
+
+            # Token expired: the client reconnects with a fresh one and Last-Event-ID
+            yield format_sse('reauthenticate', {'reason': 'token_expired'})
+        finally:
+            self.unsubscribe(subscriber)
+
+live_metrics = LiveMetrics()
+
+def poll_live_metrics():
+    """Job entry point: publish live dashboard deltas"""
+    return live_metrics.poll()
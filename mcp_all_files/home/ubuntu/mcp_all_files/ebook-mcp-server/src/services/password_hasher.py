@@ -0,0 +1,147 @@
+"""Password hashing on a dedicated process pool.
+
+scrypt/pbkdf2 are deliberately slow, so hashing inline would let a login
+burst starve the request threads that serve the catalog. Hashes are computed
+in a small, bounded process pool instead; callers block on the result but
+the CPU work runs outside the web worker. When the queue is full,
+PasswordHashingBusy is raised so the route can shed load with a 503.
+
+The hash method is a policy: `password_hash_method` (system setting, falling
+back to PASSWORD_HASH_METHOD) is applied to new hashes, and hashes made with
+other parameters are upgraded on the next successful login.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import threading
+import time
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+from src.services.metrics import metrics
+
+# Worker processes; 0 hashes inline (tests, single-process tools)
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+
+# Hashing jobs allowed to wait or run at once; further callers wait up to the timeout
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', PASSWORD_HASH_WORKERS * 8))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', 5))
+
+DEFAULT_PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+
+# Hash time buckets (seconds)
+HASH_TIME_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class PasswordHashingBusy(Exception):
+    """Too many password hashes are already queued"""
+
+def normalize_method(method):
+    """Expand a werkzeug method string to the full form stored in hashes"""
+    parts = method.split(':')
+    if parts[0] == 'scrypt':
+        defaults = ['scrypt', '32768', '8', '1']
+    elif parts[0] == 'pbkdf2':
+        defaults = ['pbkdf2', 'sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        return method
+    return ':'.join(parts + defaults[len(parts):])
+
+def current_hash_method():
+    """Get the configured hash method for new password hashes"""
+    from flask import has_app_context
+    if has_app_context():
+        from src.models.analytics import SystemSetting
+        method = SystemSetting.get_setting('password_hash_method') or DEFAULT_PASSWORD_HASH_METHOD
+    else:
+        method = DEFAULT_PASSWORD_HASH_METHOD
+    return normalize_method(method)
+
+def needs_rehash(pwhash):
+    """Check if a stored hash was made with parameters other than the current policy"""
+    return pwhash.split('$', 1)[0] != current_hash_method()
+
+def _timed(func, args):
+    """Worker entry point; returns (result, started_at, finished_at) in wall-clock time"""
+    started = time.time()
+    result = func(*args)
+    return result, started, time.time()
+
+class PasswordHasher:
+    """Bounded process pool for password hash/verify calls"""
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING,
+                 queue_timeout=PASSWORD_HASH_QUEUE_TIMEOUT):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def hash(self, password, method=None):
+        """Hash a password with the given or current method"""
+        return self._run(generate_password_hash, (password, method or current_hash_method()))
+
+    def verify(self, pwhash, password):
+        """Check a password against a stored hash"""
+        return self._run(check_password_hash, (pwhash, password))
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _run(self, func, args):
+        if self.workers <= 0:
+            started = time.monotonic()
+            result = func(*args)
+            metrics.observe('password_hash.run_seconds', time.monotonic() - started, buckets=HASH_TIME_BUCKETS)
+            return result
+
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            metrics.increment('password_hash.rejected')
+            raise PasswordHashingBusy('Password hashing queue is full')
+
+        try:
+            submitted = time.time()
+            try:
+                result, started, finished = self._get_executor().submit(_timed, func, args).result()
+            except BrokenProcessPool:
+                # A worker died; start a fresh pool for the next call and hash inline now
+                metrics.increment('password_hash.pool_restarts')
+                self.shutdown()
+                result, started, finished = _timed(func, args)
+        finally:
+            self._slots.release()
+
+        metrics.observe('password_hash.queue_seconds', max(started - submitted, 0), buckets=HASH_TIME_BUCKETS)
+        metrics.observe('password_hash.run_seconds', finished - started, buckets=HASH_TIME_BUCKETS)
+        return result
+
+    def _get_executor(self):
+        with self._lock:
+            # Pools do not survive a fork (e.g. preforking servers); start one per process
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context())
+                self._pid = os.getpid()
+            return self._executor
+
+def _mp_context():
+    # Never fork the web worker itself: it runs scheduler and server threads and
+    # holds database connections, and a forked child can deadlock on a lock one
+    # of them held. forkserver forks workers from a clean single-threaded server.
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+password_hasher = PasswordHasher()
+
+def hash_password(password):
+    """Hash a password with the current policy on the hashing pool"""
+    return password_hasher.hash(password)
+
+def verify_password(pwhash, password):
+    """Check a password against a stored hash on the hashing pool"""
+    return password_hasher.verify(pwhash, password)
@@ -0,0 +1,203 @@
+import os
+import random
+import threading
+import time
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RAZORPAY_API_URL = os.getenv('RAZORPAY_API_URL', 'https://api.razorpay.com')
+
+# Timeouts in seconds; a slow gateway must never pin a worker for long
+GATEWAY_CONNECT_TIMEOUT = float(os.getenv('GATEWAY_CONNECT_TIMEOUT', 2))
+GATEWAY_READ_TIMEOUT = float(os.getenv('GATEWAY_READ_TIMEOUT', 5))
+
+# Retries after the first attempt, with exponential backoff and jitter
+GATEWAY_MAX_RETRIES = int(os.getenv('GATEWAY_MAX_RETRIES', 2))
+GATEWAY_BACKOFF_BASE = 0.2
+
+GATEWAY_POOL_SIZE = int(os.getenv('GATEWAY_POOL_SIZE', 10))
+
+# Circuit breaker: open after this many consecutive failures, probe again after the cooldown
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 30
+
+# Gateway responses that are safe to retry
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+class GatewayError(Exception):
+    """Gateway rejected the request or returned an unexpected response"""
+
+    def __init__(self, message, status_code=None, response=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = response
+
+class GatewayUnavailable(GatewayError):
+    """Gateway could not be reached, timed out, or the circuit is open"""
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed -> open -> half-open)"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self):
+        """Check if a call may go out; only one probe is let through when half-open"""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Let the next call probe again if a call ended without recording an outcome"""
+        with self._lock:
+            self._probe_in_flight = False
+
+class RazorpayClient:
+    """Pooled Razorpay API client with strict timeouts, bounded retries and a circuit breaker"""
+
+    def __init__(self, key_id, key_secret, base_url=RAZORPAY_API_URL,
+                 connect_timeout=GATEWAY_CONNECT_TIMEOUT, read_timeout=GATEWAY_READ_TIMEOUT,
+                 max_retries=GATEWAY_MAX_RETRIES, pool_size=GATEWAY_POOL_SIZE, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        self.session.auth = (key_id, key_secret)
+        self.session.headers.update({'Content-Type': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def create_order(self, amount, currency, receipt, notes=None):
+        """Create a gateway order; amount is in the currency's smallest unit"""
+        return self.request('POST', '/v1/orders', json={
+            'amount': amount,
+            'currency': currency,
+            'receipt': receipt,
+            'notes': notes or {}
+        })
+
+    def fetch_payment(self, payment_id):
+        """Fetch a payment by gateway payment id"""
+        return self.request('GET', f'/v1/payments/{payment_id}')
+
+    def request(self, method, path, **kwargs):
+        """Send a request, retrying connection failures and retryable statuses"""
+        if not self.breaker.allow_request():
+            metrics.increment('gateway.circuit_rejected')
+            raise GatewayUnavailable('Payment gateway circuit is open')
+        try:
+            return self._send(method, path, **kwargs)
+        finally:
+            # An unexpected exception must not leave the half-open probe claimed forever
+            self.breaker.release_probe()
+
+    def _send(self, method, path, **kwargs):
+        url = f'{self.base_url}{path}'
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                error = GatewayUnavailable(f'Payment gateway request failed: {e}')
+                # A read timeout on a POST may have been applied; only resend reads
+                retryable = method == 'GET' or isinstance(e, requests.ConnectionError)
+            else:
+                metrics.observe('gateway.request_seconds', time.monotonic() - started)
+                if response.status_code < 400:
+                    body = self._safe_json(response)
+                    if body is None:
+                        self.breaker.record_failure()
+                        raise GatewayError('Payment gateway returned a non-JSON response',
+                                           status_code=response.status_code)
+                    self.breaker.record_success()
+                    return body
+
+                error_class = GatewayUnavailable if response.status_code >= 500 else GatewayError
+                error = error_class(
+                    f'Payment gateway returned {response.status_code}',
+                    status_code=response.status_code,
+                    response=self._safe_json(response)
+                )
+                retryable = response.status_code in RETRYABLE_STATUS_CODES
+
+                if response.status_code < 500 and not retryable:
+                    # Client errors are our fault, not the gateway's health
+                    self.breaker.record_success()
+                    raise error
+
+            metrics.increment('gateway.failures')
+            if not retryable or attempt >= self.max_retries:
+                self.breaker.record_failure()
+                raise error
+
+            attempt += 1
+            metrics.increment('gateway.retries')
+            time.sleep(GATEWAY_BACKOFF_BASE * (2 ** (attempt - 1)) * (0.5 + random.random()))
+
+    @staticmethod
+    def _safe_json(response):
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_gateway_client():
+    """Get the shared Razorpay client, or None when credentials are not configured"""
+    global _client
+    from src.models.analytics import SystemSetting
+
+    key_id = SystemSetting.get_setting('razorpay_key_id', '')
+    key_secret = SystemSetting.get_setting('razorpay_key_secret', '')
+    if not key_id or not key_secret:
+        return None
+
+    with _client_lock:
+        if _client is None or _client.session.auth != (key_id, key_secret):
+            _client = RazorpayClient(key_id, key_secret)
+        return _client
@@ -0,0 +1,98 @@
+from sqlalchemy import select
+from collections import namedtuple
+import os
+import threading
+from src.models.user import db, User
+from src.services.cache import TTLCache
+from src.services.metrics import metrics
+
+# Seconds a cached role/active flag may be served; bounds staleness across workers
+PRINCIPAL_CACHE_TTL = float(os.getenv('PRINCIPAL_CACHE_TTL', 30))
+PRINCIPAL_CACHE_MAX_ENTRIES = 10000
+
+PrincipalRecord = namedtuple('PrincipalRecord', ['id', 'email', 'role', 'is_active', 'version'])
+
+class Principal:
+    """Authenticated user for one request.
+
+    id, email, role and is_active come from the principal cache; any other
+    attribute loads the full User row on first access, so handlers that only
+    need the id or role never touch the users table.
+    """
+
+    __slots__ = ('id', 'email', 'role', 'is_active', 'version', '_user')
+
+    def __init__(self, record):
+        self.id = record.id
+        self.email = record.email
+        self.role = record.role
+        self.is_active = record.is_active
+        self.version = record.version
+        self._user = None
+
+    @property
+    def user(self):
+        """Get the ORM User, loading it on first use"""
+        if self._user is None:
+            self._user = db.session.get(User, self.id)
+        return self._user
+
+    def __getattr__(self, name):
+        return getattr(self.user, name)
+
+    def __repr__(self):
+        return f'<Principal {self.id} {self.role.value}>'
+
+class PrincipalCache:
+    """user id -> (email, role, active flag, version) with TTL and explicit invalidation.
+
+    Each user has a version that invalidate() bumps. A load that started
+    before an invalidation is not stored, so a concurrent request cannot put
+    the pre-change role back into the cache.
+    """
+
+    def __init__(self, ttl=PRINCIPAL_CACHE_TTL, max_entries=PRINCIPAL_CACHE_MAX_ENTRIES):
+        self._cache = TTLCache(ttl=ttl, max_entries=max_entries)
+        self._versions = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Get the PrincipalRecord for a user id, or None if the user does not exist"""
+        record = self._cache.get(user_id)
+        if record is not None:
+            metrics.increment('principal_cache.hits')
+            return record
+
+        metrics.increment('principal_cache.misses')
+        version = self._version(user_id)
+        row = db.session.execute(
+            select(User.id, User.email, User.role, User.is_active).where(User.id == user_id)
+        ).first()
+        if row is None:
+            return None
+
+        record = PrincipalRecord(row.id, row.email, row.role, row.is_active, version)
+        with self._lock:
+            if self._version_locked(user_id) == version:
+                self._cache.set(user_id, record)
+        return record
+
+    def invalidate(self, user_id=None):
+        """Drop one user's principal, or all of them when user_id is None"""
+        with self._lock:
+            if user_id is None:
+                self._generation += 1
+            else:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._cache.invalidate(user_id)
+        metrics.increment('principal_cache.invalidations')
+
+    def _version(self, user_id):
+        with self._lock:
+            return self._version_locked(user_id)
+
+    def _version_locked(self, user_id):
+        return (self._generation, self._versions.get(user_id, 0))
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,215 @@
+from flask import request, jsonify, current_app
+from collections import OrderedDict, namedtuple
+import functools
+import jwt
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+
+# 'sqlite' shares buckets between worker processes on one host; 'memory' is per process
+RATE_LIMIT_STORAGE = os.getenv('RATE_LIMIT_STORAGE', 'sqlite')
+
+# Limiter state lives in its own file so throttling never contends with app.db writes
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', os.path.join(tempfile.gettempdir(), 'ebookzone-ratelimit.db'))
+
+# Buckets idle longer than this are dropped by the cleanup job
+RATE_LIMIT_IDLE_TTL = 24 * 3600
+
+RateLimitPolicy = namedtuple('RateLimitPolicy', ['capacity', 'per_seconds', 'key'])
+
+# Token buckets: `capacity` requests burst, refilled at capacity/per_seconds per second.
+# key: 'ip' (client address) or 'user' (user id from a valid bearer token, falling back to ip;
+# the token is optional, so this works on public routes too)
+RATE_LIMIT_POLICIES = {
+    'login': RateLimitPolicy(capacity=10, per_seconds=60, key='ip'),
+    'register': RateLimitPolicy(capacity=5, per_seconds=600, key='ip'),
+    'refresh': RateLimitPolicy(capacity=30, per_seconds=60, key='ip'),
+    'book_view': RateLimitPolicy(capacity=60, per_seconds=60, key='user'),
+    'razorpay_webhook': RateLimitPolicy(capacity=300, per_seconds=60, key='ip')
+}
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'remaining', 'retry_after'])
+
+def _retry_after(tokens, rate):
+    return max(int(math.ceil((1 - tokens) / rate)), 1)
+
+class MemoryBucketStore:
+    """Per-process token buckets; O(1) per check, least recently used keys evicted"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        if allowed:
+            return RateLimitResult(True, int(tokens), 0)
+        return RateLimitResult(False, 0, _retry_after(tokens, rate))
+
+    def cleanup(self, idle_ttl=RATE_LIMIT_IDLE_TTL):
+        cutoff = time.time() - idle_ttl
+        with self._lock:
+            for key in [k for k, (_, updated_at) in self._buckets.items() if updated_at < cutoff]:
+                del self._buckets[key]
+
+class SqliteBucketStore:
+    """Token buckets in a small WAL-mode SQLite file shared by all workers on the host.
+
+    Each check is one UPSERT ... RETURNING statement, so refill, decision and
+    write happen atomically without a read-modify-write race between workers.
+    """
+
+    CONSUME_SQL = '''
+        INSERT INTO rate_limit_buckets (key, tokens, updated_at, allowed)
+        VALUES (:key, :capacity - 1, :now, 1)
+        ON CONFLICT(key) DO UPDATE SET
+            allowed = min(:capacity, tokens + max(:now - updated_at, 0) * :rate) >= 1,
+            tokens = min(:capacity, tokens + max(:now - updated_at, 0) * :rate)
+                     - (min(:capacity, tokens + max(:now - updated_at, 0) * :rate) >= 1),
+            updated_at = :now
+        RETURNING tokens, allowed
+    '''
+
+    def __init__(self, path=RATE_LIMIT_DB):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    allowed INTEGER NOT NULL
+                )
+            ''')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def consume(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        tokens, allowed = self._connection().execute(self.CONSUME_SQL, {
+            'key': key, 'capacity': capacity, 'rate': rate, 'now': now
+        }).fetchone()
+
+        if allowed:
+            return RateLimitResult(True, int(tokens), 0)
+        return RateLimitResult(False, 0, _retry_after(tokens, rate))
+
+    def cleanup(self, idle_ttl=RATE_LIMIT_IDLE_TTL):
+        self._connection().execute(
+            'DELETE FROM rate_limit_buckets WHERE updated_at < ?', (time.time() - idle_ttl,)
+        )
+
+class RateLimiter:
+    """Applies named token-bucket policies against a bucket store"""
+
+    def __init__(self, store, policies=RATE_LIMIT_POLICIES, enabled=RATE_LIMIT_ENABLED):
+        self.store = store
+        self.policies = policies
+        self.enabled = enabled
+
+    def check(self, policy_name, identity):
+        """Consume one token for identity under the named policy"""
+        policy = self.policies[policy_name]
+        try:
+            result = self.store.consume(f'{policy_name}:{identity}', policy.capacity,
+                                        policy.capacity / policy.per_seconds)
+        except sqlite3.Error:
+            # Fail open: a throttling outage must not take the API down
+            metrics.increment('rate_limit.store_errors')
+            logger.exception('Rate limit store unavailable')
+            return RateLimitResult(True, policy.capacity, 0)
+
+        metrics.increment(f'rate_limit.{policy_name}.{"allowed" if result.allowed else "limited"}')
+        return result
+
+    def cleanup(self):
+        """Drop idle buckets"""
+        self.store.cleanup()
+
+def _build_store():
+    if RATE_LIMIT_STORAGE == 'memory':
+        return MemoryBucketStore()
+    return SqliteBucketStore()
+
+rate_limiter = RateLimiter(_build_store())
+
+def _bearer_user_id():
+    """User id of a valid access token in the Authorization header, if any.
+
+    Only the signature and expiry are checked: the id just picks a bucket,
+    and routes that need authentication still go through token_required.
+    """
+    current_user = getattr(request, 'current_user', None)
+    if current_user is not None:
+        return current_user.id
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme != 'Bearer' or not token:
+        return None
+    try:
+        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+    if payload.get('type', 'access') != 'access':
+        return None
+    return payload.get('user_id')
+
+def request_identity(key):
+    """Get the client identity a policy is keyed by"""
+    if key == 'user':
+        user_id = _bearer_user_id()
+        if user_id is not None:
+            return f'user:{user_id}'
+    return f'ip:{request.remote_addr}'
+
+def rate_limit(policy_name):
+    """Decorator to throttle a route with a named policy; answers 429 with Retry-After"""
+    policy = RATE_LIMIT_POLICIES[policy_name]
+
+    def decorator(f):
+        @functools.wraps(f)
+        def decorated(*args, **kwargs):
+            if not rate_limiter.enabled:
+                return f(*args, **kwargs)
+
+            result = rate_limiter.check(policy_name, request_identity(policy.key))
+            if not result.allowed:
+                return jsonify({
+                    'error': 'Too many requests',
+                    'retry_after': result.retry_after
+                }), 429, {
+                    'Retry-After': str(result.retry_after),
+                    'X-RateLimit-Limit': str(policy.capacity),
+                    'X-RateLimit-Remaining': '0'
+                }
+            return f(*args, **kwargs)
+
+        return decorated
+    return decorator
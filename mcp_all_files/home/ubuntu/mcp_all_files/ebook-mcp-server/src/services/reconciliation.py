@@ -0,0 +1,226 @@
+from sqlalchemy import select
+from datetime import datetime
+from itertools import islice
+import csv
+import json
+import logging
+from src.models.user import db
+from src.models.order import Payment, PaymentStatus, PaymentMethod
+from src.models.pricing import to_minor_units
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Settlement rows matched per database round trip
+RECONCILE_BATCH_SIZE = 1000
+
+# Column names tried in order; Razorpay reports use entity_id, other exports payment_id
+PAYMENT_ID_COLUMNS = ('entity_id', 'payment_id', 'id')
+AMOUNT_COLUMNS = ('amount', 'credit')
+CURRENCY_COLUMNS = ('currency',)
+TYPE_COLUMNS = ('type', 'entity_type')
+
+# Every kind of discrepancy _flag() can report; each gets a summary count and a metric
+DISCREPANCY_KINDS = ('missing_payment', 'duplicate', 'duplicate_payment', 'amount_mismatch',
+                     'currency_mismatch', 'status_mismatch', 'invalid_row', 'unsettled')
+
+DISCREPANCY_FIELDS = ('kind', 'gateway_payment_id', 'line', 'settled_amount',
+                      'payment_id', 'payment_amount', 'payment_status', 'details')
+
+def _pick_column(fieldnames, candidates):
+    for name in candidates:
+        if name in fieldnames:
+            return name
+    return None
+
+class SettlementReconciler:
+    """Match a gateway settlement CSV against Payment rows.
+
+    The file is read once as a stream. Rows are matched in batches: each batch
+    issues a single IN query and builds a hash index of gateway_payment_id to
+    payments, so memory is bounded by the batch size plus one set of seen
+    payment ids (used to flag duplicates and, when a window is given,
+    completed payments that never settled).
+    """
+
+    def __init__(self, writer=None, amount_unit='major', batch_size=RECONCILE_BATCH_SIZE):
+        self.writer = writer
+        self.amount_unit = amount_unit
+        self.batch_size = batch_size
+        self.seen = set()
+        self.summary = {
+            'rows': 0,
+            'skipped': 0,
+            'matched': 0,
+            **{kind: 0 for kind in DISCREPANCY_KINDS},
+            'settled_total': 0.0,
+            'matched_total': 0.0
+        }
+
+    def reconcile_file(self, stream, since=None, until=None):
+        """Reconcile an open CSV stream; returns the summary dict"""
+        reader = csv.DictReader(stream)
+        fieldnames = reader.fieldnames or []
+        columns = {
+            'id': _pick_column(fieldnames, PAYMENT_ID_COLUMNS),
+            'amount': _pick_column(fieldnames, AMOUNT_COLUMNS),
+            'currency': _pick_column(fieldnames, CURRENCY_COLUMNS),
+            'type': _pick_column(fieldnames, TYPE_COLUMNS)
+        }
+        if not columns['id'] or not columns['amount']:
+            raise ValueError(f"Settlement file needs a payment id column {PAYMENT_ID_COLUMNS} "
+                             f"and an amount column {AMOUNT_COLUMNS}")
+
+        # Line numbers count the header as line 1
+        rows = enumerate(reader, start=2)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self._reconcile_batch(batch, columns)
+
+        if since or until:
+            self._find_unsettled(since, until)
+
+        self.summary['settled_total'] = round(self.summary['settled_total'], 2)
+        self.summary['matched_total'] = round(self.summary['matched_total'], 2)
+        for kind in DISCREPANCY_KINDS:
+            metrics.increment(f'reconciliation.{kind}', self.summary[kind])
+        metrics.set_gauge('reconciliation.last_run_at', datetime.utcnow().isoformat())
+        return self.summary
+
+    def _reconcile_batch(self, batch, columns):
+        parsed = []
+        for line, row in batch:
+            self.summary['rows'] += 1
+            row_type = (row.get(columns['type']) or '').strip().lower() if columns['type'] else 'payment'
+            if row_type != 'payment':
+                # Refunds, fees and adjustments are settled separately
+                self.summary['skipped'] += 1
+                continue
+
+            gateway_payment_id = (row.get(columns['id']) or '').strip()
+            try:
+                amount = float(row.get(columns['amount']) or '')
+            except ValueError:
+                amount = None
+            if not gateway_payment_id or amount is None:
+                self._flag('invalid_row', gateway_payment_id, line, details='Missing payment id or amount')
+                continue
+
+            if self.amount_unit == 'minor':
+                amount = amount / 100
+            currency = (row.get(columns['currency']) or '').strip().upper() if columns['currency'] else None
+            self.summary['settled_total'] += amount
+            parsed.append((line, gateway_payment_id, amount, currency))
+
+        if not parsed:
+            return
+
+        # One query per batch; hash index of gateway payment id -> payments
+        index = {}
+        for payment in db.session.execute(
+            select(Payment.id, Payment.gateway_payment_id, Payment.amount,
+                   Payment.currency, Payment.status).where(
+                Payment.gateway_payment_id.in_({gateway_id for _, gateway_id, _, _ in parsed})
+            )
+        ):
+            index.setdefault(payment.gateway_payment_id, []).append(payment)
+
+        for line, gateway_payment_id, amount, currency in parsed:
+            if gateway_payment_id in self.seen:
+                self._flag('duplicate', gateway_payment_id, line, amount,
+                           details='Payment settled more than once in this file')
+                continue
+            self.seen.add(gateway_payment_id)
+
+            payments = index.get(gateway_payment_id)
+            if not payments:
+                self._flag('missing_payment', gateway_payment_id, line, amount,
+                           details='No payment with this gateway id')
+                continue
+
+            payment = payments[0]
+            if len(payments) > 1:
+                self._flag('duplicate_payment', gateway_payment_id, line, amount, payment,
+                           details=f'{len(payments)} payments share this gateway id')
+
+            if payment.status != PaymentStatus.COMPLETED:
+                self._flag('status_mismatch', gateway_payment_id, line, amount, payment,
+                           details='Settled but payment is not completed')
+            elif to_minor_units(payment.amount) != to_minor_units(amount):
+                self._flag('amount_mismatch', gateway_payment_id, line, amount, payment,
+                           details=f'Difference {round(amount - payment.amount, 2)}')
+            elif currency and currency != payment.currency.value:
+                self._flag('currency_mismatch', gateway_payment_id, line, amount, payment,
+                           details=f'Settled in {currency}, charged in {payment.currency.value}')
+            else:
+                self.summary['matched'] += 1
+                self.summary['matched_total'] += amount
+
+    def _find_unsettled(self, since, until):
+        """Flag completed gateway payments in the window that are absent from the file"""
+        query = select(Payment.id, Payment.gateway_payment_id, Payment.amount,
+                       Payment.currency, Payment.status).where(
+            Payment.payment_method == PaymentMethod.RAZORPAY,
+            Payment.status == PaymentStatus.COMPLETED,
+            Payment.gateway_payment_id.isnot(None)
+        )
+        if since:
+            query = query.where(Payment.processed_at >= since)
+        if until:
+            query = query.where(Payment.processed_at < until)
+
+        result = db.session.execute(
+            query.order_by(Payment.id).execution_options(stream_results=True, yield_per=self.batch_size)
+        )
+        for payment in result:
+            if payment.gateway_payment_id not in self.seen:
+                self._flag('unsettled', payment.gateway_payment_id, None, None, payment,
+                           details='Completed payment missing from settlement file')
+
+    def _flag(self, kind, gateway_payment_id, line, settled_amount=None, payment=None, details=''):
+        self.summary[kind] += 1
+        if self.writer is None:
+            return
+        self.writer.writerow({
+            'kind': kind,
+            'gateway_payment_id': gateway_payment_id,
+            'line': line,
+            'settled_amount': settled_amount,
+            'payment_id': payment.id if payment else None,
+            'payment_amount': payment.amount if payment else None,
+            'payment_status': payment.status.value if payment else None,
+            'details': details
+        })
+
+def reconcile_settlement_file(path, output_path=None, amount_unit='major', since=None, until=None,
+                              batch_size=RECONCILE_BATCH_SIZE):
+    """Reconcile a settlement CSV file.
+
+    Discrepancies are streamed to output_path as CSV and the summary is
+    written next to it as JSON. Returns the summary dict.
+    """
+    output = open(output_path, 'w', newline='', encoding='utf-8') if output_path else None
+    try:
+        writer = None
+        if output:
+            writer = csv.DictWriter(output, fieldnames=DISCREPANCY_FIELDS)
+            writer.writeheader()
+
+        reconciler = SettlementReconciler(writer, amount_unit=amount_unit, batch_size=batch_size)
+        with open(path, newline='', encoding='utf-8-sig') as stream:
+            summary = reconciler.reconcile_file(stream, since=since, until=until)
+    finally:
+        if output:
+            output.close()
+
+    summary['source'] = path
+    summary['reconciled_at'] = datetime.utcnow().isoformat()
+    if output_path:
+        summary['discrepancies_file'] = output_path
+        with open(f'{output_path}.summary.json', 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+    logger.info('Reconciled %s: %s', path, summary)
+    return summary
@@ -0,0 +1,185 @@
+from sqlalchemy import select, update, or_, and_
+from datetime import datetime, timedelta
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from src.models.user import db
+from src.models.analytics import ReportJob, ReportJobStatus
+from src.services.reports import write_report
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+REPORTS_DIR = os.getenv('REPORTS_DIR', os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'database', 'reports'
+))
+
+# A finished report whose range includes today is reused this long; older ranges until they expire
+REPORT_CACHE_TTL = timedelta(seconds=int(os.getenv('REPORT_CACHE_TTL', 900)))
+
+# Report files are deleted this long after they are built
+REPORT_RETENTION = timedelta(hours=24)
+
+# Claims older than this are assumed to belong to a crashed worker
+REPORT_CLAIM_TIMEOUT = timedelta(minutes=30)
+
+REPORT_MAX_ATTEMPTS = 3
+
+# Expired report files deleted per worker pass
+REPORT_CLEANUP_BATCH = 100
+
+def report_params_key(report_type, format_type, start_date, end_date):
+    """Hash of the parameters that fully determine a report's content"""
+    params = {
+        'report_type': report_type,
+        'format': format_type,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat()
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+def find_reusable_job(params_key):
+    """A pending job or a still-fresh finished report with the same parameters"""
+    now = datetime.utcnow()
+    today = now.date()
+    candidates = ReportJob.query.filter(
+        ReportJob.params_key == params_key,
+        ReportJob.created_at >= now - REPORT_RETENTION
+    ).order_by(ReportJob.created_at.desc()).limit(10)
+
+    for job in candidates:
+        if job.status in (ReportJobStatus.QUEUED, ReportJobStatus.RUNNING):
+            return job
+        if job.status != ReportJobStatus.COMPLETED or not job.file_path or job.expires_at <= now:
+            continue
+        # Past days only change through late events, so those reports live until they expire
+        if job.end_date > today and job.completed_at < now - REPORT_CACHE_TTL:
+            continue
+        if os.path.exists(job.file_path):
+            return job
+    return None
+
+def enqueue_report(report_type, format_type, start_date, end_date, requested_by=None):
+    """Queue a report, or return an equivalent pending or cached one.
+
+    Returns (job, created).
+    """
+    params_key = report_params_key(report_type, format_type, start_date, end_date)
+    existing = find_reusable_job(params_key)
+    if existing is not None:
+        metrics.increment('reports.reused')
+        return existing, False
+
+    job = ReportJob(
+        job_id=uuid.uuid4().hex,
+        report_type=report_type,
+        format=format_type,
+        start_date=start_date,
+        end_date=end_date,
+        params_key=params_key,
+        requested_by=requested_by
+    )
+    db.session.add(job)
+    db.session.commit()
+    metrics.increment('reports.queued')
+    return job, True
+
+def claim_report_job():
+    """Claim the oldest due report job for this worker, or None"""
+    now = datetime.utcnow()
+    claimable = or_(
+        ReportJob.status == ReportJobStatus.QUEUED,
+        and_(ReportJob.status == ReportJobStatus.RUNNING, ReportJob.locked_at < now - REPORT_CLAIM_TIMEOUT)
+    )
+
+    candidate_id = db.session.execute(
+        select(ReportJob.id).where(claimable).order_by(ReportJob.id).limit(1)
+    ).scalar()
+    if candidate_id is None:
+        return None
+
+    # Another worker may have claimed it meanwhile; then nothing is updated
+    claimed = db.session.execute(
+        update(ReportJob).where(
+            ReportJob.id == candidate_id,
+            claimable
+        ).values(
+            status=ReportJobStatus.RUNNING,
+            locked_at=now,
+            started_at=now,
+            attempts=ReportJob.attempts + 1
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+
+    return db.session.get(ReportJob, candidate_id) if claimed else None
+
+def delete_expired_reports(batch_size=REPORT_CLEANUP_BATCH):
+    """Remove report files past their expiry; returns the number removed"""
+    jobs = ReportJob.query.filter(
+        ReportJob.status == ReportJobStatus.COMPLETED,
+        ReportJob.expires_at <= datetime.utcnow(),
+        ReportJob.file_path.isnot(None)
+    ).limit(batch_size).all()
+
+    for job in jobs:
+        try:
+            os.remove(job.file_path)
+        except FileNotFoundError:
+            pass
+        job.file_path = None
+    if jobs:
+        db.session.commit()
+    return len(jobs)
+
+def run_report_job(job, reports_dir=REPORTS_DIR):
+    """Build a claimed job's report file and mark the job completed"""
+    os.makedirs(reports_dir, exist_ok=True)
+    path = os.path.join(reports_dir, f'{job.job_id}.{job.format}')
+    started = time.monotonic()
+
+    row_count = write_report(path, job.report_type, job.format, job.start_date, job.end_date)
+
+    now = datetime.utcnow()
+    job.status = ReportJobStatus.COMPLETED
+    job.file_path = path
+    job.file_size = os.path.getsize(path)
+    job.row_count = row_count
+    job.error = None
+    job.locked_at = None
+    job.completed_at = now
+    job.expires_at = now + REPORT_RETENTION
+    db.session.commit()
+
+    metrics.increment(f'reports.{job.report_type}.completed')
+    metrics.observe('reports.build_seconds', time.monotonic() - started)
+
+def process_report_jobs(reports_dir=REPORTS_DIR):
+    """Job entry point: build one queued report and clean up expired files; returns reports built"""
+    delete_expired_reports()
+
+    job = claim_report_job()
+    if job is None:
+        return 0
+
+    job_pk = job.id
+    try:
+        run_report_job(job, reports_dir)
+        return 1
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(ReportJob, job_pk)
+        job.error = str(e)
+        job.locked_at = None
+        if job.attempts >= REPORT_MAX_ATTEMPTS:
+            job.status = ReportJobStatus.FAILED
+            metrics.increment('reports.failed')
+            logger.error('Report job %s failed permanently: %s', job.job_id, e)
+        else:
+            job.status = ReportJobStatus.QUEUED
+            metrics.increment('reports.retries')
+        db.session.commit()
+        return 0
@@ -0,0 +1,183 @@
+from sqlalchemy import select, func
+from datetime import datetime, date
+import csv
+import enum
+import json
+import os
+from src.models.user import db, User
+from src.models.book import Book, Author
+from src.models.order import Order, OrderItem, PaymentStatus
+from src.models.pricing import usd_amount
+from src.models.analytics import DailySummary, EventType
+from src.services.daily_rollup import ensure_rollup_current, today_sales, today_new_users
+from src.services.event_store import event_store, EVENT_TYPE_CODES
+
+# Rows fetched per round-trip from the server-side cursor
+REPORT_BATCH_SIZE = 1000
+
+REPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+def _day_start(day):
+    return datetime.combine(day, datetime.min.time())
+
+def plain_value(value):
+    """Convert a column value to a plain CSV/JSON value"""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def _streamed(statement):
+    """Rows of a statement read through a server-side cursor"""
+    result = db.session.execute(
+        statement.execution_options(stream_results=True, yield_per=REPORT_BATCH_SIZE)
+    )
+    try:
+        yield from result
+    finally:
+        result.close()
+
+def _completed_orders_between(start_date, end_date):
+    """Orders whose revenue counts in the period (the same definition as RevenueHour)"""
+    return (
+        Order.payment_status == PaymentStatus.COMPLETED,
+        Order.revenue_at >= _day_start(start_date),
+        Order.revenue_at < _day_start(end_date)
+    )
+
+DASHBOARD_COLUMNS = [
+    'date', 'new_users', 'active_users', 'page_views', 'unique_visitors',
+    'book_views', 'orders', 'revenue', 'books_sold'
+]
+
+def dashboard_report(start_date, end_date):
+    """One row per day from the daily rollup; today has only its sales and registrations"""
+    ensure_rollup_current()
+    yield from _streamed(select(
+        DailySummary.date, DailySummary.new_users, DailySummary.active_users, DailySummary.page_views,
+        DailySummary.unique_visitors, DailySummary.book_views, DailySummary.orders_count,
+        DailySummary.revenue_usd, DailySummary.books_sold
+    ).where(
+        DailySummary.date >= start_date,
+        DailySummary.date < end_date
+    ).order_by(DailySummary.date))
+
+    today = datetime.utcnow().date()
+    if start_date <= today < end_date:
+        sales = today_sales()
+        yield (today, today_new_users(), None, None, None, None, sales['orders'], sales['revenue'], None)
+
+USERS_COLUMNS = [
+    'id', 'email', 'first_name', 'last_name', 'role', 'is_active', 'created_at',
+    'last_login', 'orders', 'total_spent'
+]
+
+def users_report(start_date, end_date):
+    """Every user with their completed orders and spend (USD) in the period"""
+    spend = select(
+        Order.customer_id,
+        func.count(Order.id).label('orders'),
+        func.sum(usd_amount(Order.total_amount, Order.currency)).label('total_spent')
+    ).where(*_completed_orders_between(start_date, end_date)).group_by(Order.customer_id).subquery()
+
+    yield from _streamed(select(
+        User.id, User.email, User.first_name, User.last_name, User.role, User.is_active,
+        User.created_at, User.last_login,
+        func.coalesce(spend.c.orders, 0),
+        func.coalesce(spend.c.total_spent, 0.0)
+    ).outerjoin(spend, spend.c.customer_id == User.id).order_by(User.id))
+
+BOOKS_COLUMNS = [
+    'id', 'title', 'author', 'status', 'views', 'downloads', 'sales', 'revenue', 'conversion_rate'
+]
+
+def books_report(start_date, end_date):
+    """Every book with its views and downloads (from the event store) and sales (USD) in the period"""
+    event_store.sync()
+    keys, counts = event_store.group_count(
+        start_date, end_date, ['book_id', 'event_type'],
+        event_types=[EventType.BOOK_VIEW, EventType.BOOK_DOWNLOAD]
+    )
+    traffic = {}
+    for book_id, code, count in zip(keys['book_id'], keys['event_type'], counts):
+        traffic[(int(book_id), EVENT_TYPE_CODES[code])] = int(count)
+
+    sales = select(
+        OrderItem.book_id,
+        func.sum(OrderItem.quantity).label('sales'),
+        func.sum(usd_amount(OrderItem.total_price, Order.currency)).label('revenue')
+    ).join(Order, OrderItem.order_id == Order.id).where(
+        *_completed_orders_between(start_date, end_date)
+    ).group_by(OrderItem.book_id).subquery()
+
+    for book_id, title, author, status, sold, revenue in _streamed(select(
+        Book.id, Book.title, Author.name, Book.status,
+        func.coalesce(sales.c.sales, 0),
+        func.coalesce(sales.c.revenue, 0.0)
+    ).outerjoin(Author, Book.author_id == Author.id).outerjoin(
+        sales, sales.c.book_id == Book.id
+    ).order_by(Book.id)):
+        views = traffic.get((book_id, EventType.BOOK_VIEW), 0)
+        downloads = traffic.get((book_id, EventType.BOOK_DOWNLOAD), 0)
+        conversion_rate = round(sold / views * 100, 2) if views else None
+        yield (book_id, title, author, status, views, downloads, sold, float(revenue), conversion_rate)
+
+SALES_COLUMNS = [
+    'id', 'order_number', 'created_at', 'completed_at', 'customer_id', 'customer_email', 'status',
+    'payment_status', 'payment_method', 'currency', 'subtotal', 'tax_amount', 'discount_amount',
+    'total_amount', 'item_count'
+]
+
+def sales_report(start_date, end_date):
+    """Every order placed in the period"""
+    item_count = select(func.count(OrderItem.id)).where(
+        OrderItem.order_id == Order.id
+    ).correlate(Order).scalar_subquery()
+
+    yield from _streamed(select(
+        Order.id, Order.order_number, Order.created_at, Order.completed_at, Order.customer_id,
+        Order.customer_email, Order.status, Order.payment_status, Order.payment_method, Order.currency,
+        Order.subtotal, Order.tax_amount, Order.discount_amount, Order.total_amount, item_count
+    ).where(
+        Order.created_at >= _day_start(start_date),
+        Order.created_at < _day_start(end_date)
+    ).order_by(Order.created_at, Order.id))
+
+# report_type -> (columns, builder(start_date, end_date) yielding row tuples)
+REPORTS = {
+    'dashboard': (DASHBOARD_COLUMNS, dashboard_report),
+    'users': (USERS_COLUMNS, users_report),
+    'books': (BOOKS_COLUMNS, books_report),
+    'sales': (SALES_COLUMNS, sales_report)
+}
+
+def write_report(path, report_type, format_type, start_date, end_date):
+    """Build a report straight into a CSV or NDJSON file; returns the number of rows written.
+
+    Rows are written as they are read, so memory does not grow with the
+    date range. The file only appears at `path` once it is complete.
+    """
+    columns, build = REPORTS[report_type]
+    tmp_path = f'{path}.tmp'
+    count = 0
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f) if format_type == 'csv' else None
+        if writer:
+            writer.writerow(columns)
+        for row in build(start_date, end_date):
+            values = [plain_value(value) for value in row]
+            if writer:
+                writer.writerow(values)
+            else:
+                f.write(json.dumps(dict(zip(columns, values)), separators=(',', ':')))
+                f.write('\n')
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+    return count
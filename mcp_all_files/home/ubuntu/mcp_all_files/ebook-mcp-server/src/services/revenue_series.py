@@ -0,0 +1,88 @@
+from sqlalchemy import select, func
+from datetime import datetime
+import numpy as np
+from src.models.user import db
+from src.models.order import RevenueHour, Currency
+from src.models.pricing import ExchangeRate
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+
+# 1970-01-01 was a Thursday; weeks start on Monday
+_WEEK_OFFSET_DAYS = 4
+
+def _usd_rates():
+    """Divisor converting each currency's amounts to USD"""
+    rates = {rate.currency: rate.rate_from_usd for rate in ExchangeRate.query.all()}
+    rates[Currency.USD] = 1.0
+    return rates
+
+def _buckets(hours, granularity):
+    """Start of the containing period for a datetime64[h] array"""
+    if granularity == 'hour':
+        return hours
+    if granularity == 'month':
+        return hours.astype('datetime64[M]').astype('datetime64[h]')
+    days = hours.astype('datetime64[D]')
+    if granularity == 'week':
+        day_numbers = days.astype(np.int64)
+        days = (day_numbers - (day_numbers - _WEEK_OFFSET_DAYS) % 7).astype('datetime64[D]')
+    return days.astype('datetime64[h]')
+
+def revenue_series(start, end, granularity='day', currency=None):
+    """Orders, revenue and items per period for start <= hour < end, oldest first.
+
+    Revenue is converted to USD with the stored exchange rates, and the
+    unconverted amount of each currency is listed under by_currency. Only
+    periods with orders are returned.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'granularity must be one of {", ".join(GRANULARITIES)}')
+    statement = select(
+        RevenueHour.hour, RevenueHour.currency, RevenueHour.orders, RevenueHour.revenue, RevenueHour.items
+    ).where(RevenueHour.hour >= start, RevenueHour.hour < end)
+    if currency is not None:
+        statement = statement.where(RevenueHour.currency == currency)
+    rows = db.session.execute(statement).all()
+    if not rows:
+        return []
+
+    rates = _usd_rates()
+    buckets = _buckets(np.array([row.hour for row in rows], dtype='datetime64[h]'), granularity)
+    periods, index = np.unique(buckets, return_inverse=True)
+    orders = np.bincount(index, weights=[row.orders for row in rows], minlength=len(periods))
+    items = np.bincount(index, weights=[row.items for row in rows], minlength=len(periods))
+    revenue = np.bincount(index, weights=[row.revenue / rates.get(row.currency, 1.0) for row in rows],
+                          minlength=len(periods))
+
+    by_currency = [{} for _ in periods]
+    for i, row in zip(index, rows):
+        amounts = by_currency[i]
+        amounts[row.currency.value] = round(amounts.get(row.currency.value, 0.0) + row.revenue, 2)
+
+    return [
+        {
+            'period': periods[i].astype(datetime).isoformat(),
+            'orders': int(orders[i]),
+            'revenue': round(float(revenue[i]), 2),
+            'items': int(items[i]),
+            'by_currency': by_currency[i]
+        }
+        for i in range(len(periods)) if orders[i] > 0
+    ]
+
+def revenue_totals(start=None, end=None):
+    """Completed orders and USD revenue over an optional hour range"""
+    statement = select(
+        RevenueHour.currency, func.sum(RevenueHour.orders), func.sum(RevenueHour.revenue)
+    ).group_by(RevenueHour.currency)
+    if start is not None:
+        statement = statement.where(RevenueHour.hour >= start)
+    if end is not None:
+        statement = statement.where(RevenueHour.hour < end)
+
+    rates = _usd_rates()
+    orders, revenue = 0, 0.0
+    for currency, currency_orders, currency_revenue in db.session.execute(statement):
+        orders += currency_orders or 0
+        revenue += (currency_revenue or 0) / rates.get(currency, 1.0)
+    return {'orders': orders, 'revenue': round(revenue, 2)}
@@ -0,0 +1,107 @@
+from contextlib import contextmanager
+import fcntl
+import threading
+import logging
+import os
+import time
+from src.models.user import db
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# One lock file per shared job, so only one process on the host runs it at a time
+JOB_LOCK_DIR = os.getenv('JOB_LOCK_DIR', os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'database', 'locks'
+))
+
+@contextmanager
+def job_lock(name, blocking=False):
+    """Exclusive cross-process lock for a named job; yields False if another process holds it"""
+    os.makedirs(JOB_LOCK_DIR, exist_ok=True)
+    with open(os.path.join(JOB_LOCK_DIR, f'{name}.lock'), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class PeriodicJob(threading.Thread):
+    """Daemon thread that runs a function inside the app context at a fixed interval.
+
+    Shared jobs (the default) work on the database and files, and a run is
+    skipped while another process holds the job's lock. Per-process jobs
+    maintain in-memory state of their own worker and always run.
+    """
+
+    def __init__(self, app, name, interval, func, per_process=False):
+        super().__init__(name=f'job-{name}', daemon=True)
+        self.app = app
+        self.job_name = name
+        self.interval = interval
+        self.func = func
+        self.per_process = per_process
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        if self.per_process:
+            self._run_func()
+            return
+        with job_lock(self.job_name) as locked:
+            if not locked:
+                metrics.increment(f'jobs.{self.job_name}.skipped')
+                return
+            self._run_func()
+
+    def _run_func(self):
+        started = time.monotonic()
+        with self.app.app_context():
+            try:
+                self.func()
+                metrics.increment(f'jobs.{self.job_name}.runs')
+            except Exception:
+                db.session.rollback()
+                metrics.increment(f'jobs.{self.job_name}.errors')
+                logger.exception('Background job %s failed', self.job_name)
+            finally:
+                db.session.remove()
+        metrics.observe(f'jobs.{self.job_name}.duration_seconds', time.monotonic() - started)
+
+    def stop(self):
+        self._stop_event.set()
+
+_registered_jobs = []
+_running_jobs = []
+_start_lock = threading.Lock()
+
+def register_job(name, interval, func, per_process=False):
+    """Register a function to run every `interval` seconds once jobs are started"""
+    _registered_jobs.append((name, interval, func, per_process))
+
+def start_background_jobs(app):
+    """Start all registered jobs (no-op if already started)"""
+    with _start_lock:
+        if _running_jobs:
+            return _running_jobs
+        for name, interval, func, per_process in _registered_jobs:
+            job = PeriodicJob(app, name, interval, func, per_process)
+            job.start()
+            _running_jobs.append(job)
+        return _running_jobs
+
+def background_jobs_running():
+    return bool(_running_jobs)
+
+def stop_background_jobs():
+    """Signal all running jobs to stop"""
+    with _start_lock:
+        for job in _running_jobs:
+            job.stop()
+        _running_jobs.clear()
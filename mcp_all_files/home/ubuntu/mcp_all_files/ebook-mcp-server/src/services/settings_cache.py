@@ -0,0 +1,73 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between version checks against the database
+SETTINGS_VERSION_CHECK_INTERVAL = 1.0
+
+class SettingsCache:
+    """Process-wide cache of all system settings with typed values.
+
+    Settings are loaded in one query and parsed once. Other workers' changes
+    are picked up through the settings_versions counter row, which is read at
+    most once per SETTINGS_VERSION_CHECK_INTERVAL.
+    """
+
+    def __init__(self, check_interval=SETTINGS_VERSION_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._values = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get typed setting value by key"""
+        values = self._fresh_values()
+        return values.get(key, default)
+
+    def all(self):
+        """Get a copy of all typed setting values"""
+        return dict(self._fresh_values())
+
+    def invalidate(self):
+        """Force a reload on next access"""
+        with self._lock:
+            self._version = None
+            self._checked_at = 0.0
+
+    def _fresh_values(self):
+        from src.models.analytics import SettingsVersion
+
+        now = time.monotonic()
+        values = self._values
+        if values is not None and now - self._checked_at < self.check_interval:
+            return values
+
+        with self._lock:
+            if self._values is not None and now - self._checked_at < self.check_interval:
+                return self._values
+
+            version = SettingsVersion.current()
+            self._checked_at = now
+            if self._values is not None and version == self._version:
+                return self._values
+
+            self._values = self._load()
+            self._version = version
+            return self._values
+
+    def _load(self):
+        from src.models.analytics import SystemSetting
+
+        values = {}
+        for setting in SystemSetting.query.all():
+            try:
+                values[setting.key] = setting.get_value()
+            except (ValueError, TypeError):
+                logger.warning('Invalid value for setting %s', setting.key)
+                values[setting.key] = setting.value
+        return values
+
+settings_cache = SettingsCache()
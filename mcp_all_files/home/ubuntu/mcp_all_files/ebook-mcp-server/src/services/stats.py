@@ -0,0 +1,190 @@
+from sqlalchemy import func, case, exists, select
+from datetime import datetime, timedelta
+from src.models.user import db, User, UserRole
+from src.models.book import Book, Author, Category, BookStatus, book_categories
+from src.models.order import Order, OrderStatus, PaymentStatus
+from src.models.pricing import usd_amount
+from src.services.cache import TTLCache
+
+# Stats are served from cache for this many seconds
+STATS_CACHE_TTL = 15
+
+stats_cache = TTLCache(ttl=STATS_CACHE_TTL)
+
+def count_if(condition):
+    """Conditional COUNT expressed as SUM(CASE WHEN ... THEN 1 ELSE 0 END)"""
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+def sum_if(condition, column):
+    """Conditional SUM that ignores rows not matching the condition"""
+    return func.coalesce(func.sum(case((condition, column), else_=0)), 0)
+
+def compute_book_stats():
+    """Book counters in a single pass over books"""
+    row = db.session.query(
+        func.count(Book.id).label('total_books'),
+        count_if(Book.status == BookStatus.ACTIVE).label('active_books'),
+        count_if(Book.status == BookStatus.DRAFT).label('draft_books'),
+        count_if(Book.is_featured == True).label('featured_books'),
+        count_if(Book.is_bestseller == True).label('bestseller_books'),
+        func.avg(Book.rating).label('average_rating'),
+        func.coalesce(func.sum(Book.view_count), 0).label('total_views'),
+        func.coalesce(func.sum(Book.download_count), 0).label('total_downloads')
+    ).one()
+
+    return {
+        'total_books': row.total_books,
+        'active_books': row.active_books,
+        'draft_books': row.draft_books,
+        'featured_books': row.featured_books,
+        'bestseller_books': row.bestseller_books,
+        'average_rating': round(float(row.average_rating or 0), 2),
+        'total_views': row.total_views,
+        'total_downloads': row.total_downloads
+    }
+
+def compute_order_stats():
+    """Order counters and revenue (in USD) in a single pass over orders"""
+    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+    paid = Order.payment_status == PaymentStatus.COMPLETED
+    recent = Order.created_at >= thirty_days_ago
+    recently_paid = paid & (Order.revenue_at >= thirty_days_ago)
+    amount_usd = usd_amount(Order.total_amount, Order.currency)
+
+    row = db.session.query(
+        func.count(Order.id).label('total_orders'),
+        count_if(Order.status == OrderStatus.COMPLETED).label('completed_orders'),
+        count_if(Order.status == OrderStatus.PENDING).label('pending_orders'),
+        count_if(Order.status == OrderStatus.FAILED).label('failed_orders'),
+        sum_if(paid, amount_usd).label('total_revenue'),
+        count_if(recent).label('recent_orders'),
+        sum_if(recently_paid, amount_usd).label('recent_revenue'),
+        func.avg(case((paid, amount_usd))).label('average_order_value')
+    ).one()
+
+    return {
+        'total_orders': row.total_orders,
+        'completed_orders': row.completed_orders,
+        'pending_orders': row.pending_orders,
+        'failed_orders': row.failed_orders,
+        'total_revenue': round(float(row.total_revenue), 2),
+        'recent_orders': row.recent_orders,
+        'recent_revenue': round(float(row.recent_revenue), 2),
+        'average_order_value': round(float(row.average_order_value or 0), 2)
+    }
+
+def compute_category_stats():
+    """Category counters in one pass plus the top categories by book count"""
+    has_books = exists().where(book_categories.c.category_id == Category.id)
+
+    row = db.session.query(
+        func.count(Category.id).label('total_categories'),
+        count_if(Category.is_active == True).label('active_categories'),
+        count_if(Category.is_active == False).label('inactive_categories'),
+        count_if(has_books).label('categories_with_books')
+    ).one()
+
+    top_categories = db.session.query(
+        Category.id,
+        Category.name,
+        func.count(book_categories.c.book_id).label('book_count')
+    ).outerjoin(book_categories).group_by(
+        Category.id, Category.name
+    ).order_by(
+        func.count(book_categories.c.book_id).desc()
+    ).limit(5).all()
+
+    return {
+        'total_categories': row.total_categories,
+        'active_categories': row.active_categories,
+        'inactive_categories': row.inactive_categories,
+        'categories_with_books': row.categories_with_books,
+        'categories_without_books': row.total_categories - row.categories_with_books,
+        'top_categories': [
+            {
+                'id': category.id,
+                'name': category.name,
+                'book_count': category.book_count
+            }
+            for category in top_categories
+        ]
+    }
+
+def compute_author_stats():
+    """Author counters in one pass plus the top authors by book count"""
+    has_books = exists().where(Book.author_id == Author.id)
+
+    row = db.session.query(
+        func.count(Author.id).label('total_authors'),
+        count_if(has_books).label('authors_with_books')
+    ).one()
+
+    top_authors = db.session.query(
+        Author.id,
+        Author.name,
+        func.count(Book.id).label('book_count')
+    ).outerjoin(Book).group_by(Author.id, Author.name).order_by(
+        func.count(Book.id).desc()
+    ).limit(5).all()
+
+    return {
+        'total_authors': row.total_authors,
+        'authors_with_books': row.authors_with_books,
+        'authors_without_books': row.total_authors - row.authors_with_books,
+        'top_authors': [
+            {
+                'id': author.id,
+                'name': author.name,
+                'book_count': author.book_count
+            }
+            for author in top_authors
+        ]
+    }
+
+def compute_user_stats():
+    """User counters in a single pass over users"""
+    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+
+    row = db.session.query(
+        func.count(User.id).label('total_users'),
+        count_if(User.is_active == True).label('active_users'),
+        count_if(User.is_active == False).label('inactive_users'),
+        count_if(User.role == UserRole.ADMIN).label('admin_count'),
+        count_if(User.role == UserRole.EDITOR).label('editor_count'),
+        count_if(User.role == UserRole.CUSTOMER).label('customer_count'),
+        count_if(User.created_at >= thirty_days_ago).label('recent_registrations')
+    ).one()
+
+    return {
+        'total_users': row.total_users,
+        'active_users': row.active_users,
+        'inactive_users': row.inactive_users,
+        'recent_registrations': row.recent_registrations,
+        'by_role': {
+            'admin': row.admin_count,
+            'editor': row.editor_count,
+            'customer': row.customer_count
+        }
+    }
+
+STATS_FAMILIES = {
+    'books': compute_book_stats,
+    'orders': compute_order_stats,
+    'categories': compute_category_stats,
+    'authors': compute_author_stats,
+    'users': compute_user_stats
+}
+
+def get_stats(family):
+    """Get cached stats for a family, computing them at most once per TTL"""
+    return stats_cache.get_or_compute(family, STATS_FAMILIES[family])
+
+def invalidate_stats(*families):
+    """Drop cached stats (all families if none given) so this worker's next read recomputes them.
+
+    Called by the write routes; other workers catch up within STATS_CACHE_TTL.
+    """
+    if not families:
+        stats_cache.invalidate()
+    for family in families:
+        stats_cache.invalidate(family)
@@ -0,0 +1,127 @@
+from sqlalchemy import select
+from datetime import datetime, timedelta
+import threading
+import time
+from src.models.user import db, TokenVersion, RevokedSession
+from src.services.metrics import metrics
+
+# Minimum seconds between syncs of the revocation set from token_versions
+REVOCATION_SYNC_INTERVAL = 1.0
+
+# Re-read rows this far behind the last sync to tolerate commit/clock skew between workers
+REVOCATION_SYNC_OVERLAP = timedelta(seconds=5)
+
+class RevocationList:
+    """In-memory mirror of token_versions and revoked_sessions.
+
+    A token is revoked when the version it carries is lower than the user's
+    current version, or when the session it belongs to was signed out. Both
+    sets are refreshed incrementally (by updated_at and revoked_at) at most
+    once per REVOCATION_SYNC_INTERVAL, so checking a token costs two dict
+    lookups and at most two small queries per second per worker.
+    """
+
+    def __init__(self, sync_interval=REVOCATION_SYNC_INTERVAL):
+        self.sync_interval = sync_interval
+        self._versions = {}
+        self._sessions = {}
+        self._synced_until = None
+        self._sessions_synced_until = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current_version(self, user_id):
+        """Get the user's token version as mirrored by this worker (may lag by a sync interval)"""
+        self._sync()
+        return self._versions.get(user_id, 0)
+
+    def issue_version(self, user_id):
+        """Get the version new tokens for this user must carry.
+
+        Read from the database rather than the mirror: a revocation made on
+        another worker within the last sync interval would otherwise be
+        missed, and the tokens signed here would be rejected on the next sync.
+        """
+        version = db.session.execute(
+            select(TokenVersion.version).where(TokenVersion.user_id == user_id)
+        ).scalar() or 0
+        with self._lock:
+            self._versions[user_id] = max(self._versions.get(user_id, 0), version)
+        return version
+
+    def is_revoked(self, user_id, version, session_id=None):
+        """Check if a token with this version (and session) was revoked"""
+        if (version or 0) < self.current_version(user_id):
+            return True
+        return session_id is not None and session_id in self._sessions
+
+    def revoke(self, user_id):
+        """Revoke every token issued to the user so far"""
+        TokenVersion.bump(user_id)
+        db.session.commit()
+        version = db.session.execute(
+            select(TokenVersion.version).where(TokenVersion.user_id == user_id)
+        ).scalar_one()
+        with self._lock:
+            self._versions[user_id] = max(self._versions.get(user_id, 0), version)
+        metrics.increment('auth.revocations')
+
+    def revoke_session(self, session_id, user_id, expires_at):
+        """Revoke the access and refresh tokens of one session"""
+        if not db.session.get(RevokedSession, session_id):
+            db.session.add(RevokedSession(
+                session_id=session_id, user_id=user_id,
+                expires_at=expires_at, revoked_at=datetime.utcnow()
+            ))
+        db.session.commit()
+        with self._lock:
+            self._sessions[session_id] = expires_at
+        metrics.increment('auth.session_revocations')
+
+    def cleanup(self):
+        """Delete revoked sessions whose refresh tokens have expired anyway"""
+        now = datetime.utcnow()
+        RevokedSession.query.filter(RevokedSession.expires_at < now).delete(synchronize_session=False)
+        db.session.commit()
+        with self._lock:
+            for session_id in [s for s, expires_at in self._sessions.items() if expires_at < now]:
+                del self._sessions[session_id]
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.sync_interval:
+            return
+
+        with self._lock:
+            if now - self._checked_at < self.sync_interval:
+                return
+            self._checked_at = now
+
+            query = select(TokenVersion.user_id, TokenVersion.version, TokenVersion.updated_at)
+            if self._synced_until is not None:
+                query = query.where(TokenVersion.updated_at >= self._synced_until - REVOCATION_SYNC_OVERLAP)
+
+            for row in db.session.execute(query):
+                if row.version > self._versions.get(row.user_id, 0):
+                    self._versions[row.user_id] = row.version
+                if self._synced_until is None or row.updated_at > self._synced_until:
+                    self._synced_until = row.updated_at
+
+            if self._synced_until is None:
+                self._synced_until = datetime.utcnow() - REVOCATION_SYNC_OVERLAP
+
+            query = select(RevokedSession.session_id, RevokedSession.expires_at, RevokedSession.revoked_at)
+            if self._sessions_synced_until is None:
+                query = query.where(RevokedSession.expires_at >= datetime.utcnow())
+            else:
+                query = query.where(RevokedSession.revoked_at >= self._sessions_synced_until - REVOCATION_SYNC_OVERLAP)
+
+            for row in db.session.execute(query):
+                self._sessions[row.session_id] = row.expires_at
+                if self._sessions_synced_until is None or row.revoked_at > self._sessions_synced_until:
+                    self._sessions_synced_until = row.revoked_at
+
+            if self._sessions_synced_until is None:
+                self._sessions_synced_until = datetime.utcnow() - REVOCATION_SYNC_OVERLAP
+
+revocation_list = RevocationList()
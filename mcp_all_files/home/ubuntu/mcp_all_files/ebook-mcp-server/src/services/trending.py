@@ -0,0 +1,266 @@
+from sqlalchemy import select, func
+from sqlalchemy.orm import selectinload
+from datetime import datetime, timedelta
+import heapq
+import logging
+import os
+import threading
+import time
+from src.models.user import db
+from src.models.book import Book, BookStatus
+from src.models.order import OrderItem
+from src.models.analytics import AnalyticsEvent, EventType
+from src.services.event_store import event_store, EVENT_TYPE_CODES
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Half-life of each trending window, in seconds
+TRENDING_WINDOWS = {
+    '1h': 3600,
+    '24h': 24 * 3600,
+    '7d': 7 * 24 * 3600
+}
+
+DEFAULT_TRENDING_WINDOW = '24h'
+
+# Score added per event (per copy for purchases)
+TRENDING_WEIGHTS = {
+    EventType.BOOK_VIEW: 1.0,
+    EventType.BOOK_DOWNLOAD: 3.0,
+    EventType.PURCHASE: 10.0
+}
+
+# Counters kept per window; any book with more than 1/capacity of the decayed total is guaranteed a slot
+TRENDING_CAPACITY = int(os.getenv('TRENDING_CAPACITY', 200))
+
+# Books served per window
+TRENDING_MAX_RESULTS = 50
+
+# Events read from analytics_events per poll
+TRENDING_POLL_BATCH = 5000
+
+# How often the job polls; requests poll themselves when the job is not running
+TRENDING_POLL_INTERVAL = float(os.getenv('TRENDING_POLL_INTERVAL', 5))
+
+# Book details in the served list are refreshed at least this often
+TRENDING_DETAILS_TTL = 60
+
+def _epoch_seconds(value):
+    """Seconds since the epoch of a naive UTC datetime"""
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+class DecayedSpaceSaving:
+    """Space-Saving top-k counter with exponential time decay.
+
+    Uses forward decay: an event of weight w at time t adds
+    w * 2 ** ((t - landmark) / half_life), so counters never have to be
+    decayed in place and their order only changes when events arrive. The
+    current score of a counter is its value times 2 ** (-(now - landmark) / half_life).
+    When full, a new item replaces the smallest counter and inherits its
+    value (Space-Saving), so scores overestimate by at most that minimum.
+    """
+
+    # Rescale before the forward-decay factors leave comfortable float range
+    MAX_EXPONENT = 512
+
+    def __init__(self, capacity, half_life):
+        self.capacity = capacity
+        self.half_life = half_life
+        self.landmark = time.time()
+        self.counters = {}  # item -> forward-decayed score
+        self._heap = []  # (score, item), lazily refreshed min-heap
+
+    def _factor(self, timestamp):
+        return 2.0 ** ((timestamp - self.landmark) / self.half_life)
+
+    def _rescale(self, timestamp):
+        scale = 1.0 / self._factor(timestamp)
+        self.landmark = timestamp
+        self.counters = {item: score * scale for item, score in self.counters.items()}
+        self._heap = [(score, item) for item, score in self.counters.items()]
+        heapq.heapify(self._heap)
+
+    def add(self, item, weight, timestamp):
+        if (timestamp - self.landmark) / self.half_life > self.MAX_EXPONENT:
+            self._rescale(timestamp)
+        value = weight * self._factor(timestamp)
+
+        if item in self.counters:
+            self.counters[item] += value
+            return
+
+        if len(self.counters) < self.capacity:
+            self.counters[item] = value
+            heapq.heappush(self._heap, (value, item))
+            return
+
+        # Evict the smallest counter; heap entries may be stale since scores only grow
+        while True:
+            score, victim = heapq.heappop(self._heap)
+            current = self.counters.get(victim)
+            if current is None:
+                continue
+            if current != score:
+                heapq.heappush(self._heap, (current, victim))
+                continue
+            break
+        del self.counters[victim]
+        self.counters[item] = score + value
+        heapq.heappush(self._heap, (score + value, item))
+
+    def top(self, n):
+        """Up to n (item, forward-decayed score) pairs, highest first"""
+        return heapq.nlargest(n, self.counters.items(), key=lambda entry: entry[1])
+
+    def current_score(self, score, now=None):
+        """Convert a forward-decayed score to its value at `now`"""
+        return score / self._factor(time.time() if now is None else now)
+
+class TrendingTracker:
+    """Decayed heavy-hitter books per window, fed by tailing analytics_events.
+
+    Every worker process tails the table by event id, so each holds the
+    same ranking. The ranked, serialized lists are rebuilt after a poll
+    that saw new events, and requests only slice them.
+    """
+
+    def __init__(self, windows=TRENDING_WINDOWS, capacity=TRENDING_CAPACITY):
+        self.counters = {name: DecayedSpaceSaving(capacity, half_life) for name, half_life in windows.items()}
+        self.last_event_id = None
+        self.last_poll_at = 0.0
+        self.details_refreshed_at = 0.0
+        self._lists = {name: [] for name in windows}  # name -> [(book dict, forward-decayed score)]
+        self._lock = threading.Lock()
+
+    def _add(self, book_id, weight, timestamp):
+        for counter in self.counters.values():
+            counter.add(book_id, weight, timestamp)
+
+    def _add_purchases(self, purchases):
+        """Feed purchase events as (order_id, timestamp) through their order items"""
+        for offset in range(0, len(purchases), 500):
+            chunk = dict(purchases[offset:offset + 500])
+            for order_id, book_id, quantity in db.session.execute(
+                select(OrderItem.order_id, OrderItem.book_id, OrderItem.quantity).where(
+                    OrderItem.order_id.in_(list(chunk))
+                )
+            ):
+                self._add(book_id, TRENDING_WEIGHTS[EventType.PURCHASE] * (quantity or 1), chunk[order_id])
+
+    def _warm_start(self):
+        """Seed the counters from recent history and return the id to tail from.
+
+        History already in the columnar event store is read from it in
+        hourly buckets; only later events are tailed from the database.
+        """
+        since = datetime.utcnow() - timedelta(seconds=4 * max(c.half_life for c in self.counters.values()))
+        store_event_id = event_store.last_event_id
+        if store_event_id:
+            start_day = since.date()
+            end_day = datetime.utcnow().date() + timedelta(days=1)
+            keys, counts = event_store.group_count(
+                start_day, end_day, ['hour', 'book_id', 'event_type'],
+                event_types=[EventType.BOOK_VIEW, EventType.BOOK_DOWNLOAD]
+            )
+            first_hour = int(_epoch_seconds(since) // 3600)
+            for hour, book_id, code, count in zip(keys['hour'], keys['book_id'], keys['event_type'], counts):
+                if book_id and hour >= first_hour:
+                    weight = TRENDING_WEIGHTS[EVENT_TYPE_CODES[code]]
+                    self._add(int(book_id), weight * int(count), int(hour) * 3600 + 1800)
+
+            keys, _ = event_store.group_count(start_day, end_day, ['hour', 'order_id'], event_types=[EventType.PURCHASE])
+            self._add_purchases([
+                (int(order_id), int(hour) * 3600 + 1800)
+                for hour, order_id in zip(keys['hour'], keys['order_id']) if order_id and hour >= first_hour
+            ])
+            return store_event_id
+
+        first_id = db.session.execute(
+            select(func.min(AnalyticsEvent.id)).where(AnalyticsEvent.created_at >= since)
+        ).scalar()
+        return first_id - 1 if first_id else (db.session.execute(select(func.max(AnalyticsEvent.id))).scalar() or 0)
+
+    def poll(self):
+        """Feed new view, download and purchase events; returns how many were read"""
+        with self._lock:
+            if self.last_event_id is None:
+                self.last_event_id = self._warm_start()
+                changed = True
+            else:
+                changed = False
+
+            read = 0
+            while True:
+                rows = db.session.execute(select(
+                    AnalyticsEvent.id, AnalyticsEvent.event_type, AnalyticsEvent.book_id,
+                    AnalyticsEvent.order_id, AnalyticsEvent.created_at
+                ).where(
+                    AnalyticsEvent.id > self.last_event_id
+                ).order_by(AnalyticsEvent.id).limit(TRENDING_POLL_BATCH)).all()
+                if not rows:
+                    break
+
+                purchases = []
+                for row in rows:
+                    timestamp = _epoch_seconds(row.created_at)
+                    if row.event_type == EventType.PURCHASE:
+                        if row.order_id:
+                            purchases.append((row.order_id, timestamp))
+                    elif row.event_type in TRENDING_WEIGHTS and row.book_id:
+                        self._add(row.book_id, TRENDING_WEIGHTS[row.event_type], timestamp)
+                self._add_purchases(purchases)
+
+                self.last_event_id = rows[-1].id
+                read += len(rows)
+                if len(rows) < TRENDING_POLL_BATCH:
+                    break
+
+            self.last_poll_at = time.monotonic()
+            if changed or read or time.monotonic() - self.details_refreshed_at > TRENDING_DETAILS_TTL:
+                self._rebuild_lists()
+
+        metrics.increment('trending.events_read', read)
+        return read
+
+    def _rebuild_lists(self):
+        """Serialize the current top books of every window"""
+        ranked = {name: counter.top(TRENDING_CAPACITY) for name, counter in self.counters.items()}
+        book_ids = {book_id for entries in ranked.values() for book_id, _ in entries[:TRENDING_MAX_RESULTS * 2]}
+        books = {
+            book.id: book.to_dict()
+            for book in Book.query.options(selectinload(Book.author), selectinload(Book.categories)).filter(
+                Book.id.in_(book_ids), Book.status == BookStatus.ACTIVE
+            )
+        } if book_ids else {}
+
+        for name, entries in ranked.items():
+            # Forward-decayed scores keep their order, so serving only rescales them
+            self._lists[name] = [
+                (books[book_id], score) for book_id, score in entries if book_id in books
+            ][:TRENDING_MAX_RESULTS]
+        self.details_refreshed_at = time.monotonic()
+
+    def poll_if_stale(self):
+        """Poll inline when the background job has not run recently (e.g. jobs disabled)"""
+        if time.monotonic() - self.last_poll_at > 2 * TRENDING_POLL_INTERVAL and not self._lock.locked():
+            self.poll()
+
+    def trending(self, window=DEFAULT_TRENDING_WINDOW, limit=20):
+        """Top books for a window with their current decayed scores"""
+        counter = self.counters[window]
+        now = time.time()
+        books = []
+        for book, score in self._lists[window]:
+            score = round(counter.current_score(score, now), 4)
+            # Ranked by score, so the rest has decayed away too
+            if score <= 0 or len(books) >= limit:
+                break
+            books.append({'book': book, 'score': score})
+        return books
+
+trending_tracker = TrendingTracker()
+
+def poll_trending():
+    """Job entry point: feed new events to the trending tracker"""
+    return trending_tracker.poll()
@@ -0,0 +1,202 @@
+from sqlalchemy import select, update, or_, and_
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+import json
+import logging
+from src.models.user import db
+from src.models.order import (
+    Order, Payment, OrderStatus, PaymentStatus, PaymentMethod,
+    WebhookEvent, WebhookEventStatus
+)
+from src.models.analytics import AnalyticsEvent, EventType
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Events claimed per worker pass
+WEBHOOK_BATCH_SIZE = 50
+
+# Retry policy: exponential backoff capped at one hour, then give up
+WEBHOOK_MAX_ATTEMPTS = 8
+WEBHOOK_BACKOFF_BASE = timedelta(seconds=10)
+WEBHOOK_BACKOFF_MAX = timedelta(hours=1)
+
+# Claims older than this are assumed to belong to a crashed worker
+WEBHOOK_CLAIM_TIMEOUT = timedelta(minutes=5)
+
+def store_webhook_event(provider, event_id, event_type, raw_body):
+    """Persist a raw webhook in the inbox.
+
+    Returns (event, created); created is False when the event id was already
+    received, which makes gateway retries a cheap no-op.
+    """
+    event = WebhookEvent(
+        provider=provider,
+        event_id=event_id,
+        event_type=event_type,
+        payload=raw_body
+    )
+    db.session.add(event)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        metrics.increment(f'webhooks.{provider}.duplicates')
+        return None, False
+
+    metrics.increment(f'webhooks.{provider}.received')
+    return event, True
+
+def backoff_delay(attempts):
+    """Delay before the next attempt after `attempts` failures"""
+    return min(WEBHOOK_BACKOFF_BASE * (2 ** (attempts - 1)), WEBHOOK_BACKOFF_MAX)
+
+def claim_webhook_events(batch_size=WEBHOOK_BATCH_SIZE):
+    """Claim due events for this worker; returns the claimed events"""
+    now = datetime.utcnow()
+    claimable = or_(
+        and_(WebhookEvent.status == WebhookEventStatus.PENDING, WebhookEvent.next_attempt_at <= now),
+        and_(WebhookEvent.status == WebhookEventStatus.PROCESSING, WebhookEvent.locked_at < now - WEBHOOK_CLAIM_TIMEOUT)
+    )
+
+    candidate_ids = db.session.execute(
+        select(WebhookEvent.id).where(claimable).order_by(WebhookEvent.id).limit(batch_size)
+    ).scalars().all()
+    if not candidate_ids:
+        return []
+
+    # Claim in one statement; rows taken by another worker meanwhile drop out
+    db.session.execute(
+        update(WebhookEvent).where(
+            WebhookEvent.id.in_(candidate_ids),
+            claimable
+        ).values(
+            status=WebhookEventStatus.PROCESSING,
+            locked_at=now
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    return WebhookEvent.query.filter(
+        WebhookEvent.id.in_(candidate_ids),
+        WebhookEvent.status == WebhookEventStatus.PROCESSING,
+        WebhookEvent.locked_at == now
+    ).order_by(WebhookEvent.id).all()
+
+def payment_entity(data):
+    """Extract the payment entity from a Razorpay webhook body"""
+    return data.get('payload', {}).get('payment', {}).get('entity', {})
+
+def handle_razorpay_event(data, orders):
+    """Apply one Razorpay webhook to its order; `orders` maps gateway order id to Order"""
+    event = data.get('event')
+    entity = payment_entity(data)
+    gateway_order_id = entity.get('order_id')
+    order = orders.get(gateway_order_id) if gateway_order_id else None
+
+    if event == 'payment.captured':
+        payment_id = entity.get('id')
+        if not order or not payment_id or order.payment_status == PaymentStatus.COMPLETED:
+            return
+
+        # Update order status
+        order.payment_status = PaymentStatus.COMPLETED
+        order.payment_gateway_id = payment_id
+        order.mark_as_completed()
+
+        # Create payment record if not exists
+        existing_payment = Payment.query.filter_by(
+            order_id=order.id,
+            gateway_payment_id=payment_id
+        ).first()
+
+        if not existing_payment:
+            db.session.add(Payment(
+                order_id=order.id,
+                amount=order.total_amount,
+                currency=order.currency,
+                payment_method=PaymentMethod.RAZORPAY,
+                gateway_payment_id=payment_id,
+                gateway_order_id=gateway_order_id,
+                gateway_response=json.dumps(data.get('payload', {})),
+                status=PaymentStatus.COMPLETED,
+                processed_at=datetime.utcnow()
+            ))
+
+        db.session.add(AnalyticsEvent(
+            event_type=EventType.PURCHASE,
+            user_id=order.customer_id,
+            order_id=order.id
+        ))
+
+    elif event == 'payment.failed':
+        if order and order.payment_status != PaymentStatus.COMPLETED:
+            order.payment_status = PaymentStatus.FAILED
+            order.status = OrderStatus.FAILED
+
+def process_webhook_inbox(batch_size=WEBHOOK_BATCH_SIZE):
+    """Process one batch of due webhook events; returns the number processed"""
+    events = claim_webhook_events(batch_size)
+    if not events:
+        return 0
+
+    # Load all referenced orders with one query
+    parsed = {}
+    gateway_order_ids = set()
+    for event in events:
+        try:
+            data = json.loads(event.payload)
+        except ValueError:
+            data = None
+        parsed[event.id] = data
+        if data:
+            gateway_order_id = payment_entity(data).get('order_id')
+            if gateway_order_id:
+                gateway_order_ids.add(gateway_order_id)
+
+    orders = {}
+    if gateway_order_ids:
+        orders = {
+            order.payment_gateway_order_id: order
+            for order in Order.query.filter(Order.payment_gateway_order_id.in_(gateway_order_ids)).all()
+        }
+
+    processed = 0
+    for event in events:
+        event_id = event.id
+        try:
+            data = parsed[event_id]
+            if data is None:
+                raise ValueError('Webhook payload is not valid JSON')
+
+            handle_razorpay_event(data, orders)
+
+            event.status = WebhookEventStatus.PROCESSED
+            event.processed_at = datetime.utcnow()
+            event.locked_at = None
+            db.session.commit()
+            processed += 1
+            metrics.increment(f'webhooks.{event.provider}.processed')
+        except Exception as e:
+            db.session.rollback()
+            record_webhook_failure(event_id, e)
+
+    return processed
+
+def record_webhook_failure(event_id, error):
+    """Schedule a retry with backoff, or mark the event failed for good"""
+    event = db.session.get(WebhookEvent, event_id)
+    event.attempts += 1
+    event.last_error = str(error)
+    event.locked_at = None
+
+    if event.attempts >= WEBHOOK_MAX_ATTEMPTS:
+        event.status = WebhookEventStatus.FAILED
+        metrics.increment(f'webhooks.{event.provider}.failed')
+        logger.error('Webhook %s:%s failed permanently: %s', event.provider, event.event_id, error)
+    else:
+        event.status = WebhookEventStatus.PENDING
+        event.next_attempt_at = datetime.utcnow() + backoff_delay(event.attempts)
+        metrics.increment(f'webhooks.{event.provider}.retries')
+
+    db.session.commit()
@@ -4,6 +4,7 @@ import { X, CreditCard, Lock, CheckCircle, Globe } from 'lucide-react';
 import currencyService from '../services/currencyService';
 import PriceDisplay from './PriceDisplay';
 import { useAuth } from '../context/AuthContext';
+import { authFetch } from '../services/authSession';
 
 const MCP_API_BASE_URL = import.meta.env.VITE_API_BASE_URL;
 
@@ -64,11 +65,10 @@ const PaymentModal = ({ isOpen, onClose, book, onSuccess }) => {
     }
 
     try {
-      const response = await fetch(`${MCP_API_BASE_URL}/orders`, {
+      const response = await authFetch(`${MCP_API_BASE_URL}/orders`, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json',
-          'Authorization': `Bearer ${token}`
+          'Content-Type': 'application/json'
         },
         body: JSON.stringify({
           user_id: user.id,
@@ -109,11 +109,10 @@ const PaymentModal = ({ isOpen, onClose, book, onSuccess }) => {
       }
 
       // Create Razorpay order
-      const response = await fetch(`${MCP_API_BASE_URL}/payments/razorpay/create-order`, {
+      const response = await authFetch(`${MCP_API_BASE_URL}/payments/razorpay/create-order`, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json',
-          'Authorization': `Bearer ${token}`
+          'Content-Type': 'application/json'
         },
         body: JSON.stringify({ order_id: order.id })
       });
@@ -134,11 +133,10 @@ const PaymentModal = ({ isOpen, onClose, book, onSuccess }) => {
         order_id: razorpayOrder.order_id,
         handler: async function (response) {
           try {
-            const verifyResponse = await fetch(`${MCP_API_BASE_URL}/payments/razorpay/verify`, {
+            const verifyResponse = await authFetch(`${MCP_API_BASE_URL}/payments/razorpay/verify`, {
               method: 'POST',
               headers: {
-                'Content-Type': 'application/json',
-                'Authorization': `Bearer ${token}`
+                'Content-Type': 'application/json'
               },
               body: JSON.stringify({
                 razorpay_order_id: response.razorpay_order_id,
@@ -171,11 +169,10 @@ const PaymentModal = ({ isOpen, onClose, book, onSuccess }) => {
       handler: async function (response) {
         // Handle successful payment
         try {
-          const verifyResponse = await fetch(`${MCP_API_BASE_URL}/payments/verify`, {
+          const verifyResponse = await authFetch(`${MCP_API_BASE_URL}/payments/verify`, {
             method: 'POST',
             headers: {
-              'Content-Type': 'application/json',
-              'Authorization': `Bearer ${token}`
+              'Content-Type': 'application/json'
             },
             body: JSON.stringify({
               razorpay_order_id: response.razorpay_order_id,
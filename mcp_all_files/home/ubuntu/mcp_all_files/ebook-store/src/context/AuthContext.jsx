@@ -1,44 +1,72 @@
 import React, { createContext, useState, useEffect, useContext } from 'react';
+import {
+  MCP_API_BASE_URL,
+  SESSION_ENDED_EVENT,
+  TOKEN_REFRESHED_EVENT,
+  authFetch,
+  clearTokens,
+  getRefreshToken,
+  refreshAccessToken,
+  storeTokens
+} from '../services/authSession';
 
 const AuthContext = createContext(null);
 
-const MCP_API_BASE_URL = 'https://5000-i0gb15qzft9jwsars1w2j-3e16843f.manusvm.computer/api';
-
 export const AuthProvider = ({ children }) => {
   const [user, setUser] = useState(null);
   const [token, setToken] = useState(localStorage.getItem('token'));
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
+    const endSession = () => {
+      setToken(null);
+      setUser(null);
+    };
+    const onTokenRefreshed = (event) => setToken(event.detail);
+    window.addEventListener(SESSION_ENDED_EVENT, endSession);
+    window.addEventListener(TOKEN_REFRESHED_EVENT, onTokenRefreshed);
+
+    const verify = (accessToken) => fetch(`${MCP_API_BASE_URL}/auth/verify-token`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json'
+      },
+      body: JSON.stringify({ token: accessToken })
+    });
+
     const verifyToken = async () => {
       if (token) {
         try {
-          const response = await fetch(`${MCP_API_BASE_URL}/auth/verify-token`, {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-              'Authorization': `Bearer ${token}`
+          let response = await verify(token);
+          // The access token may simply have expired; renew it once with the refresh token
+          if (response.status === 401 && getRefreshToken()) {
+            const refreshed = await refreshAccessToken();
+            if (refreshed) {
+              response = await verify(refreshed);
             }
-          });
+          }
           if (response.ok) {
             const data = await response.json();
             setUser(data.user);
           } else {
-            localStorage.removeItem('token');
-            setToken(null);
-            setUser(null);
+            clearTokens();
+            endSession();
           }
         } catch (error) {
           console.error('Token verification failed:', error);
-          localStorage.removeItem('token');
-          setToken(null);
-          setUser(null);
+          clearTokens();
+          endSession();
         }
       }
       setLoading(false);
     };
     verifyToken();
-  }, [token]);
+
+    return () => {
+      window.removeEventListener(SESSION_ENDED_EVENT, endSession);
+      window.removeEventListener(TOKEN_REFRESHED_EVENT, onTokenRefreshed);
+    };
+  }, []);
 
   const login = async (email, password) => {
     try {
@@ -51,7 +79,7 @@ export const AuthProvider = ({ children }) => {
       });
       if (response.ok) {
         const data = await response.json();
-        localStorage.setItem('token', data.token);
+        storeTokens(data.token, data.refresh_token);
         setToken(data.token);
         setUser(data.user);
         return { success: true, user: data.user };
@@ -65,8 +93,22 @@ export const AuthProvider = ({ children }) => {
     }
   };
 
-  const logout = () => {
-    localStorage.removeItem('token');
+  const logout = async () => {
+    // Revoke only this session on the server; sign out locally even if that fails
+    if (token) {
+      try {
+        await authFetch(`${MCP_API_BASE_URL}/auth/logout`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json'
+          },
+          body: JSON.stringify({ refresh_token: getRefreshToken() })
+        });
+      } catch (error) {
+        console.error('Logout request failed:', error);
+      }
+    }
+    clearTokens();
     setToken(null);
     setUser(null);
   };
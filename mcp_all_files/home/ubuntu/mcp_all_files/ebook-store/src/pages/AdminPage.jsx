@@ -2,6 +2,7 @@ import { useState, useEffect } from 'react'
 import { motion } from 'framer-motion'
 import { Plus, Edit, Trash2, Upload, Save, X } from 'lucide-react'
 import { useAuth } from '../context/AuthContext' // Import useAuth
+import { authFetch } from '../services/authSession'
 
 const AdminPage = () => {
   const { user, token } = useAuth() // Get user and token from AuthContext
@@ -39,11 +40,7 @@ const AdminPage = () => {
 
   const fetchBooks = async () => {
     try {
-      const response = await fetch(`${MCP_API_BASE_URL}/books`, {
-        headers: {
-          'Authorization': `Bearer ${token}`
-        }
-      })
+      const response = await authFetch(`${MCP_API_BASE_URL}/books`)
       if (response.ok) {
         const data = await response.json()
         setBooks(data.books)
@@ -57,11 +54,7 @@ const AdminPage = () => {
 
   const fetchCategoriesData = async () => {
     try {
-      const response = await fetch(`${MCP_API_BASE_URL}/categories`, {
-        headers: {
-          'Authorization': `Bearer ${token}`
-        }
-      })
+      const response = await authFetch(`${MCP_API_BASE_URL}/categories`)
       if (response.ok) {
         const data = await response.json()
         setCategories(data.categories)
@@ -75,11 +68,7 @@ const AdminPage = () => {
 
   const fetchAuthorsData = async () => {
     try {
-      const response = await fetch(`${MCP_API_BASE_URL}/authors`, {
-        headers: {
-          'Authorization': `Bearer ${token}`
-        }
-      })
+      const response = await authFetch(`${MCP_API_BASE_URL}/authors`)
       if (response.ok) {
         const data = await response.json()
         setAuthors(data.authors)
@@ -105,11 +94,10 @@ const AdminPage = () => {
       const url = editingBook ? `${MCP_API_BASE_URL}/books/${editingBook.id}` : `${MCP_API_BASE_URL}/books`
       const method = editingBook ? 'PUT' : 'POST'
       
-      const response = await fetch(url, {
+      const response = await authFetch(url, {
         method,
         headers: {
-          'Content-Type': 'application/json',
-          'Authorization': `Bearer ${token}`
+          'Content-Type': 'application/json'
         },
         body: JSON.stringify({
           ...formData,
@@ -160,11 +148,8 @@ const AdminPage = () => {
   const handleDelete = async (bookId) => {
     if (window.confirm('Are you sure you want to delete this book?')) {
       try {
-        const response = await fetch(`${MCP_API_BASE_URL}/books/${bookId}`, {
-          method: 'DELETE',
-          headers: {
-            'Authorization': `Bearer ${token}`
-          }
+        const response = await authFetch(`${MCP_API_BASE_URL}/books/${bookId}`, {
+          method: 'DELETE'
         })
         if (response.ok) {
           await fetchBooks()
@@ -0,0 +1,73 @@
+// Access/refresh token storage and an authorized fetch() for the store.
+// Access tokens are short-lived; on a 401 the refresh token is exchanged once
+// for a new access token and the request retried.
+
+export const MCP_API_BASE_URL = 'https://5000-i0gb15qzft9jwsars1w2j-3e16843f.manusvm.computer/api';
+
+export const SESSION_ENDED_EVENT = 'auth:session-ended';
+export const TOKEN_REFRESHED_EVENT = 'auth:token-refreshed';
+
+let refreshPromise = null;
+
+export const getToken = () => localStorage.getItem('token');
+export const getRefreshToken = () => localStorage.getItem('refresh_token');
+
+export const storeTokens = (token, refreshToken) => {
+  localStorage.setItem('token', token);
+  if (refreshToken) {
+    localStorage.setItem('refresh_token', refreshToken);
+  }
+};
+
+export const clearTokens = () => {
+  localStorage.removeItem('token');
+  localStorage.removeItem('refresh_token');
+};
+
+// Exchange the refresh token for a new access token. Concurrent callers share
+// one request; resolves to null when the session can't be renewed.
+export const refreshAccessToken = () => {
+  if (!refreshPromise) {
+    refreshPromise = fetch(`${MCP_API_BASE_URL}/auth/refresh`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json'
+      },
+      body: JSON.stringify({ refresh_token: getRefreshToken() })
+    })
+      .then(async (response) => {
+        if (!response.ok) return null;
+        const data = await response.json();
+        storeTokens(data.token);
+        window.dispatchEvent(new CustomEvent(TOKEN_REFRESHED_EVENT, { detail: data.token }));
+        return data.token;
+      })
+      .catch(() => null)
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
+export const authFetch = async (url, options = {}) => {
+  const send = () => {
+    const headers = { ...options.headers };
+    const token = getToken();
+    if (token) {
+      headers['Authorization'] = `Bearer ${token}`;
+    }
+    return fetch(url, { ...options, headers });
+  };
+
+  let response = await send();
+  if (response.status === 401 && getToken() && getRefreshToken()) {
+    if (await refreshAccessToken()) {
+      response = await send();
+    } else {
+      clearTokens();
+      window.dispatchEvent(new Event(SESSION_ENDED_EVENT));
+    }
+  }
+  return response;
+};
@@ -1,3 +1,5 @@
+import { authFetch } from './authSession';
+
 export const RAZORPAY_CONFIG = {
   key: process.env.REACT_APP_RAZORPAY_KEY || 'rzp_test_demo_key',
   currency: 'USD',
@@ -13,11 +15,10 @@ const MCP_API_BASE_URL = 'https://w5hni7c7oloe.manus.space/api';
 
 export const paymentAPI = {
   createOrder: async (bookData) => {
-    const response = await fetch(`${MCP_API_BASE_URL}/orders`, {
+    const response = await authFetch(`${MCP_API_BASE_URL}/orders`, {
       method: 'POST',
       headers: {
-        'Content-Type': 'application/json',
-        'Authorization': `Bearer ${localStorage.getItem('token')}` // Assuming token is stored in localStorage
+        'Content-Type': 'application/json'
       },
       body: JSON.stringify({
         book_id: bookData.id,
@@ -32,11 +33,10 @@ export const paymentAPI = {
   },
 
   verifyPayment: async (paymentData) => {
-    const response = await fetch(`${MCP_API_BASE_URL}/payments/verify`, {
+    const response = await authFetch(`${MCP_API_BASE_URL}/payments/verify`, {
       method: 'POST',
       headers: {
-        'Content-Type': 'application/json',
-        'Authorization': `Bearer ${localStorage.getItem('token')}`
+        'Content-Type': 'application/json'
       },
       body: JSON.stringify({
         razorpay_payment_id: paymentData.razorpay_payment_id,
@@ -52,11 +52,8 @@ export const paymentAPI = {
   },
 
   getDownloadLink: async (bookId, transactionId) => {
-    const response = await fetch(`${MCP_API_BASE_URL}/orders/download/${bookId}`, {
-      method: 'GET',
-      headers: {
-        'Authorization': `Bearer ${localStorage.getItem('token')}`
-      }
+    const response = await authFetch(`${MCP_API_BASE_URL}/orders/download/${bookId}`, {
+      method: 'GET'
     });
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`);